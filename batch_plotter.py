@@ -0,0 +1,119 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import matplotlib
+matplotlib.use("Agg")  # headless backend, must be selected before pyplot is imported by the plotters
+import pandas as pd
+import plotter3
+import plotter4
+import results_store
+import rollup_cube
+from columnar_storage import latest_variant
+from downsampling import DEFAULT_MAX_POINTS
+
+# Results loaded once per worker process by the pool initializer
+_results = {}
+
+# Function run once in every worker: keep the shared result frames for all tasks of that worker
+def _init_worker(results):
+    _results.update(results)
+
+# Function run in a worker: render one chart and return how many charts were written
+def _render(task):
+    chart, asset_id, dpi, output_folder, max_points = task
+    meter_to_asset = _results['meter_to_asset']
+    with contextlib.redirect_stdout(io.StringIO()):
+        if chart == 'fleet_revenue':
+            plotter3.plot_asset_revenues(_results['asset_revenue'].copy(), meter_to_asset, dpi=dpi, output_folder=output_folder, max_points=max_points)
+        elif chart == 'fleet_penalty':
+            plotter3.plot_imbalance_penalties(_results['imbalance_penalties'].copy(), meter_to_asset, dpi=dpi, output_folder=output_folder, max_points=max_points)
+        elif chart == 'fleet_breakdown':
+            plotter3.plot_revenue_breakdown(_results['asset_invoices'], dpi=dpi, output_folder=output_folder)
+        elif chart == 'revenue':
+            asset_to_meter = {asset: mp for mp, asset in meter_to_asset.items()}
+            plotter4.plot_asset_revenues(_results['asset_revenue'].copy(), asset_id, asset_to_meter[asset_id], dpi=dpi, output_folder=output_folder, max_points=max_points)
+        elif chart == 'penalty':
+            plotter4.plot_imbalance_penalties(_results['imbalance_penalties'].copy(), asset_id, dpi=dpi, output_folder=output_folder, max_points=max_points)
+        elif chart == 'breakdown':
+            plotter4.plot_revenue_breakdown(_results['asset_invoices'], asset_id, dpi=dpi, output_folder=output_folder)
+    return 1
+
+# Function to load the three result files once, with delivery_start parsed up front
+# With results_db the results are read from that database instead, limited to start/end when given, and
+# with cube_file from that rollup cube (as daily or monthly totals when level is given).
+def load_results(results_db=None, start=None, end=None, cube_file=None, level=None):
+    if results_db is not None:
+        asset_to_meter = results_store.load_asset_to_meter(results_db)
+        results = results_store.load_results(results_db, start=start, end=end)
+        if asset_to_meter is None or results is None:
+            return None
+        return dict(results, meter_to_asset={mp: asset_id for asset_id, mp in asset_to_meter.items()})
+    meter_to_asset = plotter3.load_meter_to_asset()
+    if cube_file is not None:
+        results = rollup_cube.load_results(cube_file, start=start, end=end, level=level)
+        if meter_to_asset is None or results is None:
+            return None
+        return dict(results, meter_to_asset=meter_to_asset)
+    asset_revenue_df = plotter3.load_csv_to_dataframe(latest_variant("asset_revenue.csv"), delimiter=",")
+    imbalance_penalty_df = plotter3.load_csv_to_dataframe(latest_variant("imbalance_penalties.csv"), delimiter=",")
+    asset_invoices_df = plotter3.load_csv_to_dataframe(latest_variant("asset_invoices.csv"), delimiter=",")
+    if any(value is None for value in [meter_to_asset, asset_revenue_df, imbalance_penalty_df, asset_invoices_df]):
+        return None
+    for df in [asset_revenue_df, imbalance_penalty_df]:
+        df['delivery_start'] = pd.to_datetime(df['delivery_start'])
+    return {
+        'meter_to_asset': meter_to_asset,
+        'asset_revenue': asset_revenue_df,
+        'imbalance_penalties': imbalance_penalty_df,
+        'asset_invoices': asset_invoices_df,
+    }
+
+# Function to render the fleet charts and the revenue, penalty and breakdown chart of every selected asset
+def render_batch(results, assets, dpi=100, output_folder="Output", workers=None, fleet_charts=True,
+                 max_points=DEFAULT_MAX_POINTS):
+    os.makedirs(output_folder, exist_ok=True)
+    tasks = [(chart, None, dpi, output_folder, max_points) for chart in ['fleet_revenue', 'fleet_penalty', 'fleet_breakdown'] if fleet_charts]
+    tasks += [(chart, asset_id, dpi, output_folder, max_points) for asset_id in assets for chart in ['revenue', 'penalty', 'breakdown']]
+    started = time.perf_counter()
+    if workers == 1:
+        _init_worker(results)
+        charts = sum(map(_render, tasks))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(results,)) as executor:
+            charts = sum(executor.map(_render, tasks, chunksize=max(1, len(tasks) // (4 * (workers or os.cpu_count())))))
+    elapsed = time.perf_counter() - started
+    print(f"Rendered {charts} charts to {output_folder} in {elapsed:.2f} s ({charts / elapsed:.1f} charts/s)")
+    return charts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render all charts for the fleet without prompting.")
+    parser.add_argument("--assets", nargs="+", default=None, help="assets to plot (default: all)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--max-points", type=int, default=DEFAULT_MAX_POINTS, help="points drawn per line (0: all)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output-folder", default="Output")
+    parser.add_argument("--no-fleet-charts", action="store_true", help="skip the all-asset charts of plotter3")
+    parser.add_argument("--results-db", default=None, help="read the results from this SQLite database instead of the CSVs")
+    parser.add_argument("--rollup-cube", default=None, help="read the results from this rollup cube instead of the CSVs")
+    parser.add_argument("--level", choices=rollup_cube.LEVELS, default=None, help="plot daily or monthly totals (with --rollup-cube)")
+    parser.add_argument("--start", default=None, help="first delivery_start to plot (with --results-db or --rollup-cube)")
+    parser.add_argument("--end", default=None, help="end of the plotted range, exclusive (with --results-db or --rollup-cube)")
+    args = parser.parse_args()
+    if (args.start or args.end) and args.results_db is None and args.rollup_cube is None:
+        parser.error("--start/--end need --results-db or --rollup-cube (the result files are always plotted whole)")
+
+    results = load_results(args.results_db, args.start, args.end, args.rollup_cube, args.level)
+    if results is None:
+        print("Failed to load the result files. Plotting aborted.")
+        raise SystemExit(1)
+    known_assets = list(results['meter_to_asset'].values())
+    assets = args.assets or known_assets
+    unknown = [asset_id for asset_id in assets if asset_id not in known_assets]
+    if unknown:
+        print(f"Unknown assets: {', '.join(unknown)}. Plotting aborted.")
+        raise SystemExit(1)
+    render_batch(results, assets, dpi=args.dpi, output_folder=args.output_folder, workers=args.workers,
+                 fleet_charts=not args.no_fleet_charts, max_points=args.max_points or None)
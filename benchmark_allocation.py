@@ -0,0 +1,64 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from settlement_core import allocate_merit_order
+
+# Reference implementation: the original row-by-row allocation loop
+def allocate_with_iterrows(merged_df, meter_columns):
+    columns = [f"{mp}_contribution" for mp in meter_columns] + ['remaining_quantity']
+    zeros = pd.DataFrame(0.0, index=merged_df.index, columns=columns)
+    result = pd.concat([merged_df[['delivery_start', 'quantity']], zeros], axis=1)
+    for index, row in merged_df.iterrows():
+        remaining = row['quantity']
+        for mp in meter_columns:
+            used = min(remaining, row[mp])
+            result.at[index, f"{mp}_contribution"] = used
+            remaining -= used
+        result.at[index, 'remaining_quantity'] = max(0, remaining)
+    return result
+
+# Function to build a random merged trades/measured frame in MW
+def make_merged_frame(rows, meters, seed=42):
+    rng = np.random.default_rng(seed)
+    columns = {
+        'delivery_start': pd.date_range("2024-10-12 22:00", periods=rows, freq="15min", tz="UTC"),
+        'quantity': np.round(rng.uniform(0, 5 * meters / 4, rows), 1),
+    }
+    for i in range(1, meters + 1):
+        columns[f"mp_{i}"] = np.round(rng.uniform(0, 2.5, rows), 3)
+    return pd.DataFrame(columns)
+
+# Function to time the loop and the vectorized kernel for one problem size
+def run_benchmark(rows, meters, reference_limit):
+    merged_df = make_merged_frame(rows, meters)
+    meter_columns = [f"mp_{i}" for i in range(1, meters + 1)]
+
+    start = time.perf_counter()
+    contributions, remaining = allocate_merit_order(merged_df['quantity'].to_numpy(), merged_df[meter_columns].to_numpy())
+    vectorized_time = time.perf_counter() - start
+
+    # The loop is too slow to run at full size; time a prefix and extrapolate
+    reference_rows = min(rows, reference_limit)
+    start = time.perf_counter()
+    reference = allocate_with_iterrows(merged_df.iloc[:reference_rows], meter_columns)
+    reference_time = (time.perf_counter() - start) * rows / reference_rows
+
+    expected = reference[[f"{mp}_contribution" for mp in meter_columns]].to_numpy()
+    identical = (np.array_equal(expected, contributions[:reference_rows])
+                 and np.array_equal(reference['remaining_quantity'].to_numpy(), remaining[:reference_rows]))
+
+    extrapolated = " (extrapolated)" if reference_rows < rows else ""
+    print(f"{rows:>9} rows x {meters} meters: iterrows {reference_time:9.3f} s{extrapolated}, "
+          f"vectorized {vectorized_time:7.4f} s, speedup {reference_time / vectorized_time:9.1f}x, "
+          f"identical: {identical}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the merit-order trade allocation kernel.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--meters", type=int, default=4)
+    parser.add_argument("--reference-limit", type=int, default=10_000,
+                        help="maximum rows run through the iterrows loop before extrapolating")
+    args = parser.parse_args()
+    for rows in args.rows:
+        run_benchmark(rows, args.meters, args.reference_limit)
@@ -0,0 +1,46 @@
+import argparse
+import contextlib
+import io
+import os
+import time
+from datetime import date
+import numpy as np
+from backfill import backfill
+
+# Function to run the backfill quietly and return its wall time and totals
+def timed_backfill(start, end, data_dir, partition, workers):
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        totals = backfill(start, end, data_dir=data_dir, partition=partition, workers=workers)
+    return time.perf_counter() - started, totals
+
+# Function to check that two runs produced bit-identical totals: every running aggregate of
+# streaming_settlement.RunningTotals, including the fee parts and the interval count
+def same_totals(a, b):
+    return vars(a).keys() == vars(b).keys() and all(np.array_equal(value, getattr(b, name)) for name, value in vars(a).items())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark backfill scaling from 1 to N worker processes.")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="first delivery day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="last delivery day (YYYY-MM-DD)")
+    parser.add_argument("--data-dir", default=".", help="directory with measured_YYYYMMDD.csv and the other inputs")
+    parser.add_argument("--partition", choices=["day", "week"], default="day")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    worker_counts = [1]
+    while worker_counts[-1] * 2 <= args.max_workers:
+        worker_counts.append(worker_counts[-1] * 2)
+    if worker_counts[-1] != args.max_workers:
+        worker_counts.append(args.max_workers)
+
+    serial_time, serial_totals = timed_backfill(args.start, args.end, args.data_dir, args.partition, 1)
+    if serial_totals is None:
+        print("Serial backfill failed. Exiting.")
+        raise SystemExit(1)
+    print(f"{'workers':>7} {'seconds':>9} {'speedup':>8} {'efficiency':>10} identical")
+    print(f"{1:>7} {serial_time:>9.2f} {1.0:>8.2f} {1.0:>10.2f} True")
+    for workers in worker_counts[1:]:
+        elapsed, totals = timed_backfill(args.start, args.end, args.data_dir, args.partition, workers)
+        speedup = serial_time / elapsed
+        print(f"{workers:>7} {elapsed:>9.2f} {speedup:>8.2f} {speedup / workers:>10.2f} {same_totals(serial_totals, totals)}")
@@ -0,0 +1,171 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import matplotlib
+matplotlib.use("Agg")  # headless backend, must be selected before the plotters import pyplot
+import energy_trading5
+import plotter3
+import plotter4
+from generate_data import generate_dataset
+from settlement_core import AssetRegistry, meter_to_asset_map
+
+# Problem sizes: number of assets, delivery days and interval length
+PRESETS = {
+    'small': {'assets': 4, 'days': 1, 'resolution': '1h'},
+    'medium': {'assets': 100, 'days': 7, 'resolution': '15min'},
+    'large': {'assets': 1000, 'days': 30, 'resolution': '15min'},
+}
+
+# Number of assets drawn in the fleet chart (plotter3 puts every asset into one legend)
+FLEET_CHART_ASSETS = 10
+
+# Function to identify the code version the results belong to
+def code_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Function to run one stage and record wall time, peak traced memory and throughput
+# rows is the number of rows the stage processes, or a function of the stage result.
+def measure_stage(stage, func, rows, trace_memory=True):
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    wall = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    if trace_memory:
+        tracemalloc.stop()
+    rows = rows(result) if callable(rows) else rows
+    metrics = {
+        'stage': stage,
+        'wall_s': round(wall, 6),
+        'peak_mb': round(peak / 1024 ** 2, 3) if peak is not None else None,
+        'rows': int(rows),
+        'rows_per_s': round(rows / wall, 1) if wall > 0 else None,
+    }
+    return result, metrics
+
+# Function to time every pipeline stage on one generated data set (run inside the data directory)
+def run_stages(measured_file, trace_memory=True):
+    results = []
+    def record(stage, func, rows):
+        result, metrics = measure_stage(stage, func, rows, trace_memory)
+        results.append(metrics)
+        return result
+
+    inputs = record('load', lambda: energy_trading5.load_inputs(measured_file=measured_file),
+                    lambda inputs: sum(len(df) for key, df in inputs.items() if key != 'forecasts')
+                    + sum(len(df) for df in inputs['forecasts'].values()))
+    if inputs is None:
+        raise RuntimeError("Generated inputs failed to load")
+    assets_df, measured_df = inputs['assets'], inputs['measured']
+    registry = AssetRegistry(assets_df)
+    trade_allocation_df = record('match_trades_with_measured',
+                                 lambda: energy_trading5.match_trades_with_measured(inputs['trades'], measured_df, registry),
+                                 len(inputs['trades']))
+    asset_revenue_df = record('calculate_asset_revenue',
+                              lambda: energy_trading5.calculate_asset_revenue(assets_df, trade_allocation_df, inputs['market_index']),
+                              len(trade_allocation_df))
+    asset_invoices_df = record('calculate_invoices',
+                               lambda: energy_trading5.calculate_invoices(assets_df, trade_allocation_df, asset_revenue_df,
+                                                                          inputs['market_index'], registry,
+                                                                          energy_trading5.measured_intervals(measured_df)),
+                               len(trade_allocation_df))
+    imbalance_penalties_df = record('calculate_imbalance_penalty',
+                                    lambda: energy_trading5.calculate_imbalance_penalty(assets_df, measured_df, inputs['forecasts'],
+                                                                                        inputs['imbalance_penalty']),
+                                    len(measured_df) * len(assets_df))
+    outputs = {'trade_allocation': trade_allocation_df, 'asset_revenue': asset_revenue_df,
+               'asset_invoices': asset_invoices_df, 'imbalance_penalties': imbalance_penalties_df}
+    record('save_outputs', lambda: energy_trading5.save_outputs(outputs),
+           len(asset_revenue_df) + len(asset_invoices_df) + len(imbalance_penalties_df))
+
+    asset_id, mp = assets_df['asset_id'].iloc[0], assets_df['metering_point_id'].iloc[0]
+    fleet = dict(list(meter_to_asset_map(assets_df).items())[:FLEET_CHART_ASSETS])
+    def plot():
+        plotter3.plot_asset_revenues(asset_revenue_df.copy(), fleet, dpi=100)
+        plotter3.plot_imbalance_penalties(imbalance_penalties_df.copy(), fleet, dpi=100)
+        plotter4.plot_asset_revenues(asset_revenue_df.copy(), asset_id, mp, dpi=100)
+        plotter4.plot_imbalance_penalties(imbalance_penalties_df.copy(), asset_id, dpi=100)
+    record('plot', plot, (len(fleet) + 1) * (len(asset_revenue_df) + len(imbalance_penalties_df)))
+    return results
+
+# Function to generate the data of one problem size and benchmark all stages on it
+def run_benchmark(name, assets, days, resolution, trace_memory=True, data_dir=None, seed=42):
+    with contextlib.ExitStack() as stack:
+        if data_dir is None:
+            data_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="benchmark_"))
+        started = time.perf_counter()
+        written = generate_dataset(data_dir, assets=assets, days=days, resolution=resolution,
+                                   single_measured_file=True, seed=seed)
+        print(f"{name}: generated {assets} assets x {days} days at {resolution} in {time.perf_counter() - started:.1f} s")
+        previous_dir = os.getcwd()
+        os.chdir(data_dir)
+        try:
+            results = run_stages(os.path.basename(written['measured'][0]), trace_memory)
+        finally:
+            os.chdir(previous_dir)
+    config = f"assets={assets},days={days},resolution={resolution}"
+    return [dict(metrics, config=config, preset=name) for metrics in results]
+
+# Function to append results to the history file, tagged with the code version and time of the run
+def store_results(results, results_file):
+    version, timestamp = code_version(), datetime.now(timezone.utc).isoformat(timespec='seconds')
+    with open(results_file, 'a') as file:
+        for metrics in results:
+            file.write(json.dumps(dict(metrics, version=version, timestamp=timestamp)) + "\n")
+
+# Function to load the stored results of earlier runs
+def load_history(results_file):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+# Function to print this run next to the latest run of another code version with the same configuration
+def print_report(results, history, threshold=0.2):
+    version = code_version()
+    print(f"{'config':<40} {'stage':<28} {'wall s':>9} {'peak MB':>9} {'rows/s':>13} {'vs previous':>14}")
+    for metrics in results:
+        baseline = next((old for old in reversed(history)
+                         if old['config'] == metrics['config'] and old['stage'] == metrics['stage'] and old['version'] != version), None)
+        change = ""
+        if baseline is not None and baseline['wall_s'] > 0:
+            ratio = metrics['wall_s'] / baseline['wall_s'] - 1
+            change = f"{ratio:+.0%} ({baseline['version']})" + (" REGRESSION" if ratio > threshold else "")
+        peak = f"{metrics['peak_mb']:.1f}" if metrics['peak_mb'] is not None else "-"
+        print(f"{metrics['config']:<40} {metrics['stage']:<28} {metrics['wall_s']:>9.3f} {peak:>9} "
+              f"{metrics['rows_per_s'] or 0:>13,.0f} {change:>14}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on generated data of several sizes.")
+    parser.add_argument("--presets", nargs="+", choices=list(PRESETS), default=['small', 'medium'])
+    parser.add_argument("--assets", type=int, default=None, help="custom size instead of the presets")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--resolution", default="1h")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc (its overhead inflates wall times)")
+    parser.add_argument("--results-file", default="benchmark_results.jsonl")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown reported as regression")
+    args = parser.parse_args()
+
+    sizes = ({'custom': {'assets': args.assets, 'days': args.days, 'resolution': args.resolution}}
+             if args.assets is not None else {name: PRESETS[name] for name in args.presets})
+    results_file = os.path.abspath(args.results_file)
+    history = load_history(results_file)
+    results = []
+    for name, size in sizes.items():
+        results += run_benchmark(name, trace_memory=not args.no_memory, **size)
+    print_report(results, history, args.threshold)
+    store_results(results, results_file)
+    print(f"Results appended to {results_file}")
@@ -0,0 +1,165 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+# Fixed ISO-8601 layout used by trades.json and the forecast files (2024-10-12T22:00:00+00:00)
+ISO_8601_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+
+# Columns of trades.json parsed as timestamps
+TRADE_TIMESTAMP_COLUMNS = ['delivery_start', 'delivery_end', 'execution_time']
+
+# Columns and types of a trades frame, also kept when a file holds no trades
+TRADE_SCHEMA = {'delivery_end': 'datetime64[ns, UTC]', 'delivery_start': 'datetime64[ns, UTC]',
+                'execution_time': 'datetime64[ns, UTC]', 'price': 'float64', 'quantity': 'float64', 'side': 'object',
+                'trade_id': 'int64'}
+
+# Function to parse an array of ISO-8601 strings in one vectorized call with a fixed format
+def parse_iso8601_utc(values):
+    return pd.to_datetime(values, format=ISO_8601_FORMAT, utc=True)
+
+# Function run in a worker: read a batch of forecast files into flat arrays (no DataFrames)
+def _read_forecast_files(file_paths):
+    asset_ids, timestamps, values = [], [], []
+    for file_path in file_paths:
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+        timestamps.extend(data['values'].keys())
+        values.append(np.fromiter(data['values'].values(), dtype=float, count=len(data['values'])))
+        asset_ids.append((data['asset_id'], len(data['values'])))
+    return asset_ids, timestamps, values
+
+# Function to load every forecast file matching a glob (or a list of files) into one long
+# asset_id/delivery_start/forecast frame. Files are parsed concurrently in batches and the timestamps
+# of all files are parsed in a single call. Forecasts are converted from kW to MW like
+# load_json_to_dataframe(flatten=True) does.
+def load_forecasts_bulk(pattern, workers=None, files_per_task=16):
+    file_paths = sorted(glob.glob(pattern)) if isinstance(pattern, str) else list(pattern)
+    if not file_paths:
+        print(f"Error: no forecast files match {pattern}.")
+        return None
+    missing = [file_path for file_path in file_paths if not os.path.exists(file_path)]
+    if missing:
+        print(f"Error: {', '.join(missing)} not found.")
+        return None
+    batches = [file_paths[i:i + files_per_task] for i in range(0, len(file_paths), files_per_task)]
+    try:
+        if workers == 1 or len(batches) == 1:
+            results = list(map(_read_forecast_files, batches))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_read_forecast_files, batches))
+    except Exception as e:
+        print(f"Error loading forecast files {pattern}: {e}")
+        return None
+
+    asset_ids = [asset_id for result in results for asset_id, count in result[0] for _ in range(count)]
+    timestamps = [timestamp for result in results for timestamp in result[1]]
+    values = np.concatenate([array for result in results for array in result[2]])
+    df = pd.DataFrame({
+        'asset_id': pd.Categorical(asset_ids),
+        'delivery_start': parse_iso8601_utc(timestamps),
+        'forecast': values / 1000,  # Convert forecast from kW to MW
+    })
+    print(f"Loaded {len(file_paths)} forecast files successfully.")
+    return df
+
+# Function to split the long forecast frame into one frame per registry asset (a_1 <- file asset_id a1)
+def split_forecasts(forecast_df, asset_ids):
+    groups = {file_asset_id: group for file_asset_id, group in forecast_df.groupby('asset_id', observed=True)}
+    forecast_dfs = {}
+    for asset_id in asset_ids:
+        group = groups.get(asset_id, groups.get(asset_id.replace('_', '')))
+        if group is not None:
+            forecast_dfs[asset_id] = group[['delivery_start', 'forecast', 'asset_id']].reset_index(drop=True)
+    return forecast_dfs
+
+# Function to iterate over the elements of a top-level JSON array without reading the whole file
+# Leading whitespace (however long) is skipped; a file that does not start with '[' raises ValueError.
+def iter_json_array(file_path, chunk_size=1 << 20):
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r') as file:
+        buffer, end_of_file = '', False
+        while not buffer and not end_of_file:
+            chunk = file.read(chunk_size)
+            end_of_file = len(chunk) < chunk_size
+            buffer = chunk.lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{file_path} does not hold a JSON array (found {buffer[:20]!r})")
+        position = 1
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                if position >= len(buffer):
+                    raise json.JSONDecodeError("buffer exhausted", buffer, position)
+                element, next_position = decoder.raw_decode(buffer, position)
+                if next_position == len(buffer) and not end_of_file:
+                    raise json.JSONDecodeError("element may continue", buffer, position)
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise
+                more = file.read(chunk_size)
+                end_of_file = len(more) < chunk_size
+                buffer = buffer[position:] + more
+                position = 0
+                continue
+            yield element
+            position = next_position
+
+# Function to build a trades frame without rows but with the columns and types of trades.json
+def empty_trades():
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in TRADE_SCHEMA.items()})
+
+# Function to turn one batch of trade records into a typed frame
+def _trade_batch_frame(records):
+    if not records:
+        return empty_trades()
+    df = pd.DataFrame.from_records(records)
+    for column in TRADE_TIMESTAMP_COLUMNS:
+        if column in df.columns:
+            df[column] = parse_iso8601_utc(df[column].to_numpy())
+    return df
+
+# Function to load trades.json in batches, so the raw text and the parsed records never coexist in full
+def load_trades_streaming(file_path, batch_size=100_000):
+    try:
+        frames, batch = [], []
+        for record in iter_json_array(file_path):
+            batch.append(record)
+            if len(batch) == batch_size:
+                frames.append(_trade_batch_frame(batch))
+                batch = []
+        if batch or not frames:
+            frames.append(_trade_batch_frame(batch))
+        df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        print(f"Loaded {file_path} successfully.")
+        return df
+    except FileNotFoundError:
+        print(f"Error: {file_path} not found.")
+        return None
+    except Exception as e:
+        print(f"Error loading {file_path}: {e}")
+        return None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the bulk forecast and streaming trade loaders.")
+    parser.add_argument("--forecasts", default="a*.json", help="glob of forecast files")
+    parser.add_argument("--trades", default="trades.json")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    forecast_df = load_forecasts_bulk(args.forecasts, workers=args.workers)
+    if forecast_df is not None:
+        print(f"{len(forecast_df)} forecast rows in {time.perf_counter() - started:.3f} s")
+    started = time.perf_counter()
+    trades_df = load_trades_streaming(args.trades)
+    if trades_df is not None:
+        print(f"{len(trades_df)} trades in {time.perf_counter() - started:.3f} s")
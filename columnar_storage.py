@@ -0,0 +1,107 @@
+import argparse
+import glob
+import json
+import os
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# File extensions handled by the columnar backend
+COLUMNAR_EXTENSIONS = {'arrow': '.arrow', 'parquet': '.parquet'}
+
+# Columns stored as timezone-aware timestamps
+TIMESTAMP_COLUMNS = ['delivery_start', 'delivery_end', 'execution_time']
+
+# Function to tell whether a path points to a columnar file
+def is_columnar(file_path):
+    return os.path.splitext(file_path)[1] in COLUMNAR_EXTENSIONS.values()
+
+# Function to map a CSV/JSON file name to its name in the given storage format ('csv' keeps it)
+def storage_path(file_path, storage="csv"):
+    if storage == "csv":
+        return file_path
+    return os.path.splitext(file_path)[0] + COLUMNAR_EXTENSIONS[storage]
+
+# Function to pick the most recently written variant of a result (e.g. asset_revenue.csv / .arrow / .parquet)
+def latest_variant(file_path):
+    candidates = [storage_path(file_path, storage) for storage in ['csv'] + list(COLUMNAR_EXTENSIONS)]
+    existing = [path for path in candidates if os.path.exists(path)]
+    return max(existing, key=os.path.getmtime) if existing else file_path
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow is required for Arrow/Parquet storage (pip install pyarrow)")
+
+# Function to read a columnar file into a DataFrame, optionally only a subset of its columns
+# Arrow IPC files are memory-mapped; columns without nulls are handed to pandas without copying.
+def read_table(file_path, columns=None):
+    _require_pyarrow()
+    if file_path.endswith(COLUMNAR_EXTENSIONS['arrow']):
+        table = pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    else:
+        table = pq.read_table(file_path, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+# Function to write a DataFrame to a columnar file (uncompressed Arrow IPC so it can be memory-mapped)
+def write_table(df, file_path):
+    _require_pyarrow()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if file_path.endswith(COLUMNAR_EXTENSIONS['arrow']):
+        with pa.OSFile(file_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        pq.write_table(table, file_path)
+
+# Function to parse the timestamp columns of a frame once, so they are stored typed
+def parse_timestamp_columns(df):
+    for column in TIMESTAMP_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], utc=True)
+    return df
+
+# Function to convert one CSV or JSON input file to the columnar format
+# Forecast JSON files become long delivery_start/forecast/asset_id tables in kW, as in the source file.
+def import_file(source_path, dest_dir, storage="arrow"):
+    if source_path.endswith(".json"):
+        with open(source_path, 'r') as file:
+            data = json.load(file)
+        if isinstance(data, dict) and 'values' in data:
+            df = pd.DataFrame({'delivery_start': list(data['values'].keys()),
+                               'forecast': list(data['values'].values()),
+                               'asset_id': data['asset_id']})
+        else:
+            df = pd.DataFrame(data)
+    else:
+        with open(source_path, 'r') as file:
+            header = file.readline()
+        df = pd.read_csv(source_path, delimiter=";" if ";" in header else ",")
+    dest_path = storage_path(os.path.join(dest_dir, os.path.basename(source_path)), storage)
+    write_table(parse_timestamp_columns(df), dest_path)
+    return dest_path
+
+# Function to convert every CSV/JSON archive file in a directory once
+def import_archive(source_dir, dest_dir, storage="arrow"):
+    os.makedirs(dest_dir, exist_ok=True)
+    source_files = sorted(glob.glob(os.path.join(source_dir, "*.csv")) + glob.glob(os.path.join(source_dir, "*.json")))
+    for source_path in source_files:
+        try:
+            dest_path = import_file(source_path, dest_dir, storage)
+            print(f"Converted {source_path} to {dest_path}")
+        except Exception as e:
+            print(f"Error converting {source_path}: {e}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert CSV/JSON input and result files to Arrow or Parquet.")
+    parser.add_argument("--source-dir", default=".")
+    parser.add_argument("--dest-dir", default=".")
+    parser.add_argument("--format", choices=list(COLUMNAR_EXTENSIONS), default="arrow")
+    args = parser.parse_args()
+    import_archive(args.source_dir, args.dest_dir, args.format)
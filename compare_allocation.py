@@ -0,0 +1,58 @@
+import argparse
+import numpy as np
+import pandas as pd
+from energy_trading5 import load_inputs, measured_intervals, positions_core, save_dataframe
+from settlement_core import ALLOCATION_STRATEGIES, AssetRegistry, invoice_amounts, invoice_fees
+from trade_book import net_positions
+
+# Function to allocate the same net positions with every strategy and compare revenues and invoices
+# The trades are netted and the settlement core is set up on the measured intervals once (see
+# energy_trading5.positions_core), so capacity fees cover the whole settled period; every strategy then allocates and prices on the core's arrays and
+# the strategies are stacked on one axis, so the fees and invoice amounts of all strategies are priced
+# together (the strategies take the place of billing periods in settlement_core.invoice_fees).
+# Returns one row per strategy and asset.
+def compare_allocation_strategies(inputs, strategies=None):
+    strategies = list(ALLOCATION_STRATEGIES) if strategies is None else list(strategies)
+    registry = AssetRegistry(inputs['assets'])
+    positions_df = net_positions(inputs['trades'], measured_intervals(inputs['measured']))
+    core = positions_core(positions_df, inputs['measured'], registry, inputs['market_index'])
+
+    total_contribution, total_revenue, remaining, fee_part, fee_weight = [], [], [], [], []
+    for strategy in strategies:
+        contribution = core.allocate(strategy)
+        total_contribution.append(contribution.sum(axis=1))
+        total_revenue.append(np.nansum(core.compute_revenue(), axis=1))
+        remaining.append(core.remaining.sum())
+        part, weight = core.fee_parts()
+        fee_part.append(part.sum(axis=1))
+        fee_weight.append(weight.sum(axis=1))
+    fees = invoice_fees(fee_part, fee_weight, inputs['market_index']['market_index_price'].mean())
+    net_revenue, unit_net_revenue, gross_revenue = invoice_amounts(np.array(total_revenue), fees, registry.capacity_kw)
+    asset_count = len(registry.asset_ids)
+    return pd.DataFrame({
+        'strategy': np.repeat(strategies, asset_count),
+        'asset_id': np.tile(registry.asset_ids, len(strategies)),
+        'total_contribution': np.ravel(total_contribution),
+        'total_revenue': np.ravel(total_revenue),
+        'fee': fees.ravel(),
+        'net_revenue': net_revenue.ravel(),
+        'unit_net_revenue': unit_net_revenue.ravel(),
+        'gross_revenue': gross_revenue.ravel(),
+        'unallocated_quantity': np.repeat(remaining, asset_count),
+    })
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare revenues and invoices under every allocation strategy.")
+    parser.add_argument("--measured-file", default="measured_20241013.csv")
+    parser.add_argument("--strategies", nargs="+", choices=list(ALLOCATION_STRATEGIES), default=None)
+    parser.add_argument("--output", default="allocation_comparison.csv")
+    args = parser.parse_args()
+
+    inputs = load_inputs(measured_file=args.measured_file)
+    if inputs is None:
+        print("One or more input files failed to load. Exiting.")
+    else:
+        comparison_df = compare_allocation_strategies(inputs, args.strategies)
+        net_revenue = comparison_df.pivot(index='asset_id', columns='strategy', values='net_revenue')
+        print(net_revenue[list(pd.unique(comparison_df['strategy']))].to_string())
+        save_dataframe(comparison_df, args.output, "Allocation comparison")
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import matplotlib.dates as mdates
+
+# Default number of points drawn per line; roughly the pixel width of a 12 inch chart at 150 dpi
+DEFAULT_MAX_POINTS = 2000
+
+# Lines with at most this many points keep their point markers
+MARKER_MAX_POINTS = 100
+
+# Function to split n points into at most n_buckets contiguous buckets, returned as bucket edges
+def _bucket_edges(n, n_buckets):
+    return np.unique(np.linspace(0, n, n_buckets + 1).astype(np.int64))
+
+# Function to pick, per bucket, the positions of the smallest and largest value
+# NaN values are only picked when a bucket holds nothing else, so gaps stay visible.
+def minmax_indices(values, max_points=DEFAULT_MAX_POINTS):
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    edges = _bucket_edges(n, max(1, (max_points - 2) // 2))
+    buckets = np.repeat(np.arange(len(edges) - 1), np.diff(edges))
+    starts = edges[:-1]
+    lowest = np.lexsort((values, buckets))[starts]
+    highest = np.lexsort((-values, buckets))[starts]
+    return np.unique(np.concatenate([lowest, highest, [0, n - 1]]))
+
+# Function to pick max_points positions with largest-triangle-three-buckets (LTTB)
+# The first and last points are always kept; in every bucket in between the point spanning the
+# largest triangle with the previously kept point and the mean of the next bucket is selected.
+def lttb_indices(x, values, max_points=DEFAULT_MAX_POINTS):
+    x = np.asarray(x, dtype=float)
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+    edges = _bucket_edges(n - 2, max_points - 2) + 1
+    filled = np.where(np.isnan(values), np.nanmean(values) if not np.isnan(values).all() else 0.0, values)
+    next_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1)[1:] / np.diff(edges)[1:], x[-1])
+    next_y = np.append(np.add.reduceat(filled[1:n - 1], edges[:-1] - 1)[1:] / np.diff(edges)[1:], filled[-1])
+    selected = np.empty(len(edges) + 1, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket, (start, stop) in enumerate(zip(edges[:-1], edges[1:])):
+        area = np.abs((x[previous] - next_x[bucket]) * (filled[start:stop] - filled[previous])
+                      - (x[previous] - x[start:stop]) * (next_y[bucket] - filled[previous]))
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+# Function to decimate a time series before plotting
+# method 'minmax' keeps every local extreme (use it where spikes matter, e.g. imbalance penalties),
+# 'lttb' keeps the visual shape of the line with fewer points.
+def downsample(times, values, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    times = pd.Series(times).reset_index(drop=True)
+    values = pd.Series(values).reset_index(drop=True)
+    if max_points is None or len(values) <= max_points:
+        return times, values
+    if method == "minmax":
+        positions = minmax_indices(values.to_numpy(dtype=float), max_points)
+    elif method == "lttb":
+        positions = lttb_indices(pd.DatetimeIndex(times).asi8, values.to_numpy(dtype=float), max_points)
+    else:
+        raise ValueError(f"Unknown downsampling method {method}")
+    return times.iloc[positions], values.iloc[positions]
+
+# Function to pick a readable time-axis locator: every 2 hours for a day, automatic for longer ranges
+def time_axis_locator(times):
+    times = pd.DatetimeIndex(times)
+    if len(times) and times.max() - times.min() <= pd.Timedelta(days=2):
+        return mdates.HourLocator(interval=2)
+    return mdates.AutoDateLocator()
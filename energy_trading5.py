@@ -1,59 +1,308 @@
+import argparse
 import pandas as pd
+import numpy as np
 import json
 from datetime import datetime
+import results_store
+import rollup_cube
+import settlement_core
+import trade_book
+from resolution import align_inputs
+from settlement_core import ALLOCATION_STRATEGIES, AssetRegistry, SettlementCore, billing_periods, invoice_table, meter_to_asset_map
+from bulk_ingest import empty_trades, load_forecasts_bulk, load_trades_streaming, split_forecasts
+from columnar_storage import is_columnar, read_table, storage_path, write_table
+from instrumentation import RunMetrics, count_rows
+from stage_cache import StageCache, StageGraph, file_fingerprint
+from trade_book import net_positions, trade_pnl
 
 # Main function to orchestrate the calls
-def main():
-    # Load data
-    assets_df = load_csv_to_dataframe("assets_base_data.csv", delimiter=";")
-    measured_df = load_csv_to_dataframe("measured_20241013.csv", delimiter=";")
-    trades_df = load_json_to_dataframe("trades.json")
-    market_index_df = load_csv_to_dataframe("market_index_price.csv", delimiter=";")
-    imbalance_penalty_df = load_csv_to_dataframe("imbalance_penalty.csv", delimiter=";")
-    forecast_a1_df = load_json_to_dataframe("a1.json", flatten=True)
-    forecast_a2_df = load_json_to_dataframe("a2.json", flatten=True)
-    forecast_a3_df = load_json_to_dataframe("a3.json", flatten=True)
-    forecast_a4_df = load_json_to_dataframe("a4.json", flatten=True)
-
-    if any(df is None for df in [assets_df, measured_df, trades_df, market_index_df, imbalance_penalty_df, 
-                                forecast_a1_df, forecast_a2_df, forecast_a3_df, forecast_a4_df]):
-        print("One or more input files failed to load. Exiting.")
+# The stages hand their frames to each other in memory and the results are written once at the
+# end. With keep_intermediate_files the trade allocation is also written for auditing.
+# With cache_dir every stage output is cached on disk and only stages downstream of a changed
+# input file are recomputed (resampling to another resolution is not part of the cached graph).
+# storage selects the file format of inputs and results: 'csv' or the columnar 'arrow'/'parquet'
+# (convert existing CSV/JSON files once with columnar_storage.py).
+# resolution (e.g. '15min') resamples every input to that interval length before settling.
+# Every stage is timed (see instrumentation.py); metrics_file writes the per-stage metrics as JSON,
+# profile_stages runs the named stages under cProfile and trace_memory adds tracemalloc statistics.
+# billing_period ('day' or 'month') additionally writes asset_invoices_by_period.csv, with_trade_pnl
+# writes the per-trade P&L to trade_pnl.csv. allocation_strategy names the way net positions are split
+# across the meters (see settlement_core.ALLOCATION_STRATEGIES). results_db additionally stores the
+# results in that SQLite database (see results_store.py), which the plotters can query instead.
+# cube_file appends the run's intervals to that rollup cube (see rollup_cube.py) for range totals and invoices.
+def main(keep_intermediate_files=False, cache_dir=None, cache_max_mb=512, storage="csv", resolution=None,
+         metrics_file=None, profile_stages=None, trace_memory=False, billing_period=None, with_trade_pnl=False,
+         allocation_strategy="merit_order", results_db=None, cube_file=None):
+    metrics = RunMetrics("energy_trading5", profile_stages=profile_stages, trace_memory=trace_memory)
+    if cache_dir is not None and resolution is not None:
+        print("Error: --resolution cannot be combined with --cache-dir (resampling is not part of the cached stage graph). Exiting.")
         return
+    if cache_dir is not None:
+        with metrics.stage('settle_cached') as record:
+            outputs = settle_cached(cache_dir, cache_max_mb, allocation_strategy, storage=storage, billing_period=billing_period,
+                                    with_trade_pnl=with_trade_pnl)
+            record['rows_out'] = count_rows(outputs)
+        if outputs is None:
+            return
+    else:
+        with metrics.stage('load_inputs') as record:
+            inputs = load_inputs(storage=storage)
+            record['rows_out'] = count_rows(inputs)
+        if inputs is None:
+            print("One or more input files failed to load. Exiting.")
+            return
 
-    # Convert measured production from kW to MW (divide by 1000)
-    measured_df[['mp_1', 'mp_2', 'mp_3', 'mp_4']] = measured_df[['mp_1', 'mp_2', 'mp_3', 'mp_4']] / 1000
+        outputs = settle(inputs, resolution=resolution, metrics=metrics, billing_period=billing_period,
+                         with_trade_pnl=with_trade_pnl, allocation_strategy=allocation_strategy)
+        if outputs is None:
+            return
 
-    # Match trades with measured production and save to Excel
-    match_trades_with_measured(trades_df, measured_df)
+    save_outputs(outputs, keep_intermediate_files=keep_intermediate_files, storage=storage, metrics=metrics)
+    if results_db is not None or cube_file is not None:
+        assets_df = load_csv_to_dataframe(storage_path("assets_base_data.csv", storage), delimiter=";") if cache_dir is not None \
+            else inputs['assets']
+        market_index_df = load_csv_to_dataframe(storage_path("market_index_price.csv", storage), delimiter=";",
+                                                parse_dates=['delivery_start']) if cache_dir is not None else inputs['market_index']
+    if results_db is not None:
+        with metrics.stage('store_results', rows_in=outputs) as record:
+            results_store.store_results(outputs, assets_df, results_db, market_index_df=market_index_df)
+            record['rows_out'] = record['rows_in']
+    if cube_file is not None:
+        with metrics.stage('update_rollup_cube', rows_in=outputs) as record:
+            rollup_cube.update_cube(cube_file, outputs, assets_df, market_index_df)
+            record['rows_out'] = record['rows_in']
+    if metrics_file is not None:
+        metrics.print_summary()
+        metrics.write(metrics_file)
 
-    # Load the trade allocation output
-    trade_allocation_df = pd.read_csv("trade_allocation.csv")
-    if trade_allocation_df is None:
-        print("Failed to load trade_allocation.xlsx. Exiting.")
-        return
+# Function to load all pipeline inputs, with delivery_start parsed once and measured values in MW
+def load_inputs(measured_file="measured_20241013.csv", trades_file="trades.json", storage="csv"):
+    assets_df = load_csv_to_dataframe(storage_path("assets_base_data.csv", storage), delimiter=";")
+    measured_df = load_csv_to_dataframe(storage_path(measured_file, storage), delimiter=";", parse_dates=['delivery_start'])
+    market_index_df = load_csv_to_dataframe(storage_path("market_index_price.csv", storage), delimiter=";",
+                                            parse_dates=['delivery_start'])
+    imbalance_penalty_df = load_csv_to_dataframe(storage_path("imbalance_penalty.csv", storage), delimiter=";",
+                                                 parse_dates=['delivery_start'])
+    if assets_df is None:
+        return None
+    # One forecast file per asset, also for assets with several contract terms (rows)
+    asset_ids = list(AssetRegistry(assets_df).asset_ids)
+    if storage == "csv":
+        # JSON inputs go through the bulk loaders: trades are parsed incrementally and all forecast
+        # files are read concurrently into one long frame before being split per asset
+        trades_df = load_trades_streaming(trades_file)
+        forecast_df = load_forecasts_bulk([forecast_file_for_asset(asset_id) for asset_id in asset_ids])
+        forecast_dfs = split_forecasts(forecast_df, asset_ids) if forecast_df is not None else {}
+        forecast_dfs = {asset_id: forecast_dfs.get(asset_id) for asset_id in asset_ids}
+    else:
+        trades_df = load_json_to_dataframe(storage_path(trades_file, storage))
+        forecast_dfs = {asset_id: load_json_to_dataframe(storage_path(forecast_file_for_asset(asset_id), storage), flatten=True)
+                        for asset_id in asset_ids}
 
-    # Calculate revenue for each asset and save to CSV
-    calculate_asset_revenue(assets_df, trade_allocation_df, market_index_df)
+    if any(df is None for df in [measured_df, trades_df, market_index_df, imbalance_penalty_df] + list(forecast_dfs.values())):
+        return None
 
-    # Load the asset revenue output
-    asset_revenue_df = load_csv_to_dataframe("asset_revenue.csv", delimiter=",")
-    if asset_revenue_df is None:
-        print("Failed to load asset_revenue.csv. Exiting.")
-        return
+    ensure_datetime(trades_df)
+
+    return {
+        'assets': assets_df,
+        'measured': measured_to_mw(assets_df, measured_df),
+        'trades': trades_df,
+        'market_index': market_index_df,
+        'imbalance_penalty': imbalance_penalty_df,
+        'forecasts': forecast_dfs,
+    }
+
+# Function to convert measured production from kW to MW (divide by 1000)
+def measured_to_mw(assets_df, measured_df):
+    meter_columns = list(meter_to_asset_map(assets_df))
+    measured_df = measured_df.copy()
+    measured_df[meter_columns] = measured_df[meter_columns] / 1000
+    return measured_df
+
+# Function to read one asset's forecast file with the bulk loader (see bulk_ingest.load_forecasts_bulk)
+def load_asset_forecast(file_path, asset_id):
+    forecast_df = load_forecasts_bulk([file_path], workers=1)
+    return split_forecasts(forecast_df, [asset_id]).get(asset_id) if forecast_df is not None else None
+
+# Function to describe the pipeline as a stage graph: load -> allocate -> revenue -> invoice and
+# load -> imbalance penalty, plus the per-period invoices with a billing_period and the per-trade P&L
+# with with_trade_pnl. Input files are read in the given storage format; JSON inputs go through the
+# bulk loaders like load_inputs, with one source per forecast file so a changed forecast only
+# invalidates its own asset's source.
+def build_stage_graph(cache, measured_file="measured_20241013.csv", trades_file="trades.json", allocation_strategy="merit_order",
+                      storage="csv", billing_period=None, with_trade_pnl=False):
+    code_fingerprint = file_fingerprint(__file__) + file_fingerprint(settlement_core.__file__) + file_fingerprint(trade_book.__file__)
+    graph = StageGraph(cache, code_fingerprint=code_fingerprint)
+    read_semicolon_csv = lambda path: load_csv_to_dataframe(path, delimiter=";", parse_dates=['delivery_start'])
+    graph.add_source('assets', storage_path("assets_base_data.csv", storage), lambda path: load_csv_to_dataframe(path, delimiter=";"))
+    graph.add_source('measured_kw', storage_path(measured_file, storage), read_semicolon_csv)
+    graph.add_source('trades', storage_path(trades_file, storage), load_trades_streaming if storage == "csv" else load_json_to_dataframe)
+    graph.add_source('market_index', storage_path("market_index_price.csv", storage), read_semicolon_csv)
+    graph.add_source('imbalance_penalty', storage_path("imbalance_penalty.csv", storage), read_semicolon_csv)
+    asset_ids = list(AssetRegistry(graph.get('assets')).asset_ids)
+    for asset_id in asset_ids:
+        graph.add_source(f"forecast_{asset_id}", storage_path(forecast_file_for_asset(asset_id), storage),
+                         (lambda path, asset_id=asset_id: load_asset_forecast(path, asset_id)) if storage == "csv"
+                         else (lambda path: load_json_to_dataframe(path, flatten=True)))
+
+    graph.add_stage('measured', ['assets', 'measured_kw'], measured_to_mw)
+    if allocation_strategy == "merit_order":
+        graph.add_stage('trade_allocation', ['assets', 'trades', 'measured'],
+                        lambda assets_df, trades_df, measured_df: match_trades_with_measured(
+                            trades_df, measured_df, AssetRegistry(assets_df)))
+    else:
+        graph.add_stage('trade_allocation', ['assets', 'trades', 'measured', 'market_index'],
+                        lambda assets_df, trades_df, measured_df, market_index_df: match_trades_with_measured(
+                            trades_df, measured_df, AssetRegistry(assets_df), allocation_strategy, market_index_df),
+                        params={'strategy': allocation_strategy})
+    graph.add_stage('asset_revenue', ['assets', 'trade_allocation', 'market_index'], calculate_asset_revenue)
+    graph.add_stage('asset_invoices', ['assets', 'trade_allocation', 'asset_revenue', 'market_index', 'measured'],
+                    lambda assets_df, trade_allocation_df, asset_revenue_df, market_index_df, measured_df: calculate_invoices(
+                        assets_df, trade_allocation_df, asset_revenue_df, market_index_df,
+                        settled_intervals=measured_intervals(measured_df)))
+    if billing_period is not None:
+        graph.add_stage('asset_invoices_by_period', ['assets', 'trade_allocation', 'asset_revenue', 'market_index', 'measured'],
+                        lambda assets_df, trade_allocation_df, asset_revenue_df, market_index_df, measured_df: calculate_invoices_by_period(
+                            assets_df, trade_allocation_df, asset_revenue_df, market_index_df, billing_period,
+                            settled_intervals=measured_intervals(measured_df)),
+                        params={'period': billing_period})
+    if with_trade_pnl:
+        graph.add_stage('trade_pnl', ['trades', 'trade_allocation', 'market_index', 'measured'],
+                        lambda trades_df, trade_allocation_df, market_index_df, measured_df: trade_pnl(
+                            trades_df, trade_allocation_df, market_index_df, measured_df['delivery_start'].unique()))
+    graph.add_stage('imbalance_penalties', ['assets', 'measured', 'imbalance_penalty'] + [f"forecast_{a}" for a in asset_ids],
+                    lambda assets_df, measured_df, imbalance_penalty_df, *forecasts: calculate_imbalance_penalty(
+                        assets_df, measured_df, dict(zip(asset_ids, forecasts)), imbalance_penalty_df))
+    return graph
+
+# Function to run the pipeline through the stage cache
+# billing_period and with_trade_pnl add the same optional outputs as settle().
+def settle_cached(cache_dir, cache_max_mb=512, allocation_strategy="merit_order", storage="csv", billing_period=None,
+                  with_trade_pnl=False):
+    names = ['trade_allocation', 'asset_revenue', 'asset_invoices', 'imbalance_penalties']
+    names += (['asset_invoices_by_period'] if billing_period is not None else []) + (['trade_pnl'] if with_trade_pnl else [])
+    try:
+        graph = build_stage_graph(StageCache(cache_dir, max_bytes=cache_max_mb * 1024 * 1024),
+                                  allocation_strategy=allocation_strategy, storage=storage, billing_period=billing_period,
+                                  with_trade_pnl=with_trade_pnl)
+        outputs = {name: graph.get(name) for name in names}
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}. Exiting.")
+        return None
+    print(f"Stages recomputed: {graph.computed or 'none'}; reused from cache: {graph.reused or 'none'}")
+    return outputs
+
+# Function to run allocation, revenue, invoicing and imbalance penalties on loaded inputs
+# With a resolution all inputs are first brought to that interval length (see resolution.py), so
+# hourly prices or forecasts can be settled against 15-minute products without exact-match joins
+# dropping rows.
+# metrics (a RunMetrics) records every stage; a throwaway one is used when none is given.
+# billing_period ('day' or 'month') adds per-period invoices of every asset as 'asset_invoices_by_period'
+# and with_trade_pnl the P&L of every individual trade as 'trade_pnl'.
+def settle(inputs, resolution=None, metrics=None, billing_period=None, with_trade_pnl=False, allocation_strategy="merit_order"):
+    if metrics is None:
+        metrics = RunMetrics("settle")
+    trades_df = inputs['trades']
+    if resolution is not None:
+        with metrics.stage('align_inputs', rows_in=inputs) as record:
+            inputs = align_inputs(inputs, resolution)
+            record['rows_out'] = count_rows(inputs)
+    assets_df = inputs['assets']
+    registry = AssetRegistry(assets_df)
+
+    # Match trades with measured production
+    with metrics.stage('match_trades_with_measured', rows_in=[inputs['trades'], inputs['measured']]) as record:
+        trade_allocation_df = match_trades_with_measured(inputs['trades'], inputs['measured'], registry, allocation_strategy,
+                                                         inputs['market_index'])
+        record['rows_out'] = len(trade_allocation_df)
+
+    # Calculate revenue for each asset
+    with metrics.stage('calculate_asset_revenue', rows_in=[trade_allocation_df, inputs['market_index']]) as record:
+        asset_revenue_df = calculate_asset_revenue(assets_df, trade_allocation_df, inputs['market_index'], registry)
+        record['rows_out'] = len(asset_revenue_df)
+
+    # Calculate invoices for each asset
+    with metrics.stage('calculate_invoices', rows_in=[trade_allocation_df, asset_revenue_df]) as record:
+        asset_invoices_df = calculate_invoices(assets_df, trade_allocation_df, asset_revenue_df, inputs['market_index'], registry,
+                                               measured_intervals(inputs['measured']))
+        record['rows_out'] = count_rows(asset_invoices_df)
+    if asset_invoices_df is None:
+        print("Invoice calculation failed. Exiting.")
+        return None
+    outputs = {}
+    if billing_period is not None:
+        with metrics.stage('calculate_invoices_by_period', rows_in=[trade_allocation_df, asset_revenue_df]) as record:
+            outputs['asset_invoices_by_period'] = calculate_invoices_by_period(assets_df, trade_allocation_df, asset_revenue_df,
+                                                                               inputs['market_index'], billing_period, registry,
+                                                                               measured_intervals(inputs['measured']))
+            record['rows_out'] = len(outputs['asset_invoices_by_period'])
+    if with_trade_pnl:
+        with metrics.stage('trade_pnl', rows_in=trades_df) as record:
+            outputs['trade_pnl'] = trade_pnl(trades_df, trade_allocation_df, inputs['market_index'],
+                                             inputs['measured']['delivery_start'].unique())
+            record['rows_out'] = len(outputs['trade_pnl'])
 
-    # Debug: Print column names to verify
-    print("Columns in asset_revenue_df:", asset_revenue_df.columns.tolist())
+    # Calculate imbalance penalties
+    with metrics.stage('calculate_imbalance_penalty',
+                       rows_in=[inputs['measured'], inputs['imbalance_penalty'], inputs['forecasts']]) as record:
+        imbalance_penalties_df = calculate_imbalance_penalty(assets_df, inputs['measured'], inputs['forecasts'],
+                                                             inputs['imbalance_penalty'])
+        record['rows_out'] = len(imbalance_penalties_df)
 
-    # Calculate invoices for each asset and save to CSV
-    calculate_invoices(assets_df, trade_allocation_df, asset_revenue_df, market_index_df)
+    outputs.update({
+        'trade_allocation': trade_allocation_df,
+        'asset_revenue': asset_revenue_df,
+        'asset_invoices': asset_invoices_df,
+        'imbalance_penalties': imbalance_penalties_df,
+    })
+    return outputs
 
-    # Calculate imbalance penalties and save to CSV
-    calculate_imbalance_penalty(measured_df, forecast_a1_df, forecast_a2_df, forecast_a3_df, forecast_a4_df, imbalance_penalty_df)
+# Function to write the pipeline results; the trade allocation is only kept on request
+def save_outputs(outputs, keep_intermediate_files=False, storage="csv", metrics=None):
+    if metrics is None:
+        metrics = RunMetrics("save_outputs")
+    names = (['trade_allocation'] if keep_intermediate_files else []) + ['asset_revenue', 'asset_invoices', 'imbalance_penalties']
+    names += [name for name in ['asset_invoices_by_period', 'trade_pnl'] if name in outputs]
+    with metrics.stage('save_outputs', rows_in=[outputs[name] for name in names]) as record:
+        if keep_intermediate_files:
+            save_dataframe(outputs['trade_allocation'], storage_path("trade_allocation.csv", storage), "Trade allocation")
+        save_dataframe(outputs['asset_revenue'], storage_path("asset_revenue.csv", storage), "Asset revenue")
+        save_dataframe(outputs['asset_invoices'], storage_path("asset_invoices.csv", storage), "Asset invoices")
+        save_dataframe(outputs['imbalance_penalties'], storage_path("imbalance_penalties.csv", storage), "Imbalance penalties")
+        if 'asset_invoices_by_period' in outputs:
+            save_dataframe(outputs['asset_invoices_by_period'], storage_path("asset_invoices_by_period.csv", storage),
+                           "Asset invoices by period")
+        if 'trade_pnl' in outputs:
+            save_dataframe(outputs['trade_pnl'], storage_path("trade_pnl.csv", storage), "Trade P&L")
+        record['rows_out'] = record['rows_in']
+
+# Function to save a DataFrame to CSV, or to Arrow/Parquet when the file name says so
+def save_dataframe(df, output_file, label):
+    if is_columnar(output_file):
+        write_table(df, output_file)
+    else:
+        df.to_csv(output_file, index=False, sep=",")
+    print(f"{label} saved to {output_file}")
+
+# Function to make sure delivery_start is a datetime column without re-parsing parsed data
+def ensure_datetime(df, column='delivery_start'):
+    if not pd.api.types.is_datetime64_any_dtype(df[column]):
+        df[column] = pd.to_datetime(df[column])
+
+# Function to name the forecast file of an asset (a_1 -> a1.json)
+def forecast_file_for_asset(asset_id):
+    return f"{asset_id.replace('_', '')}.json"
 
 # Function to load CSV files into DataFrames
-def load_csv_to_dataframe(file_path, delimiter=";"):
+# Arrow/Parquet files are read through the columnar backend, which already stores typed timestamps.
+# columns restricts the load to a subset of columns.
+def load_csv_to_dataframe(file_path, delimiter=";", parse_dates=None, columns=None):
     try:
-        df = pd.read_csv(file_path, delimiter=delimiter)
+        if is_columnar(file_path):
+            df = read_table(file_path, columns=columns)
+        else:
+            df = pd.read_csv(file_path, delimiter=delimiter, parse_dates=parse_dates, usecols=columns)
         print(f"Loaded {file_path} successfully.")
         return df
     except FileNotFoundError:
@@ -64,8 +313,15 @@ def load_csv_to_dataframe(file_path, delimiter=";"):
         return None
 
 # Function to load JSON files into DataFrames with optional flattening
+# Columnar copies written by columnar_storage.py are read directly.
 def load_json_to_dataframe(file_path, flatten=False):
     try:
+        if is_columnar(file_path):
+            df = read_table(file_path)
+            if flatten:
+                df['forecast'] = df['forecast'] / 1000  # Convert forecast from kW to MW
+            print(f"Loaded {file_path} successfully.")
+            return df
         with open(file_path, 'r') as file:
             data = json.load(file)
         if flatten and 'values' in data:
@@ -74,6 +330,9 @@ def load_json_to_dataframe(file_path, flatten=False):
             df['delivery_start'] = pd.to_datetime(df['delivery_start'])
             df['forecast'] = df['forecast'] / 1000  # Convert forecast from kW to MW
             df['asset_id'] = data['asset_id']
+        elif isinstance(data, list) and not data:
+            # A trades file without trades keeps the trade columns
+            df = empty_trades()
         else:
             df = pd.DataFrame(data)
         print(f"Loaded {file_path} successfully.")
@@ -85,150 +344,155 @@ def load_json_to_dataframe(file_path, flatten=False):
         print(f"Error loading {file_path}: {e}")
         return None
 
+# Function to get the sorted delivery_start values of the measured intervals
+def measured_intervals(measured_df):
+    ensure_datetime(measured_df)
+    return pd.DatetimeIndex(measured_df['delivery_start'].unique()).sort_values()
+
+# Function to set up the settlement core for allocating already netted positions: the measured and
+# traded intervals with every meter's production (MW) there and, when given, the market price the
+# price-based allocation strategies need. Intervals without trades allocate nothing but are still
+# charged their capacity fees (see SettlementCore.fee_parts).
+def positions_core(positions_df, measured_df, registry, market_index_df=None):
+    time_index = measured_intervals(measured_df).union(pd.DatetimeIndex(positions_df['delivery_start'])).sort_values()
+    core = SettlementCore(registry, time_index)
+    core.set_measured(measured_df)
+    core.set_positions(positions_df)
+    if market_index_df is not None:
+        ensure_datetime(market_index_df)
+        core.set_market_price(market_index_df)
+    return core
+
 # Function to match trades with measured production
-def match_trades_with_measured(trades_df, measured_df):
-    trades_df['delivery_start'] = pd.to_datetime(trades_df['delivery_start'])
-    measured_df['delivery_start'] = pd.to_datetime(measured_df['delivery_start'])
-    result = trades_df[['delivery_start', 'quantity']].copy()
-    result['mp_1_contribution'] = 0.0
-    result['mp_2_contribution'] = 0.0
-    result['mp_3_contribution'] = 0.0
-    result['mp_4_contribution'] = 0.0
-    result['remaining_quantity'] = 0.0
-    merged_df = pd.merge(trades_df, measured_df, on='delivery_start', how='left')
-    for index, row in merged_df.iterrows():
-        remaining = row['quantity']
-        mp_1_used = min(remaining, row['mp_1'])
-        result.at[index, 'mp_1_contribution'] = mp_1_used
-        remaining -= mp_1_used
-        mp_2_used = min(remaining, row['mp_2'])
-        result.at[index, 'mp_2_contribution'] = mp_2_used
-        remaining -= mp_2_used
-        mp_3_used = min(remaining, row['mp_3'])
-        result.at[index, 'mp_3_contribution'] = mp_3_used
-        remaining -= mp_3_used
-        mp_4_used = min(remaining, row['mp_4'])
-        result.at[index, 'mp_4_contribution'] = mp_4_used
-        remaining -= mp_4_used
-        result.at[index, 'remaining_quantity'] = max(0, remaining)
-    output_file = "trade_allocation.csv"
-    result.to_csv(output_file, index=False)
-    print(f"Trade allocation saved to {output_file}")
+# Trades go through the trade book first: buys are netted against sells and all trades of a measured
+# interval (including partial-hour products) are aggregated into one net position, which is then
+# allocated to the meters (see allocate_positions). quantity in the result is the net position of the interval.
+def match_trades_with_measured(trades_df, measured_df, registry, strategy="merit_order", market_index_df=None):
+    ensure_datetime(trades_df)
+    positions_df = net_positions(trades_df, measured_intervals(measured_df))
+    return allocate_positions(positions_df, measured_df, registry, strategy, market_index_df)
+
+# Function to allocate already netted positions (see trade_book.net_positions) to the meters with the
+# given strategy (see settlement_core.ALLOCATION_STRATEGIES; the default fills the meters in merit order)
+# Meters outside their asset's contract take no volume; strategies other than merit_order also need
+# the market index.
+def allocate_positions(positions_df, measured_df, registry, strategy="merit_order", market_index_df=None):
+    if strategy != "merit_order" and market_index_df is None:
+        raise ValueError(f"Allocation strategy {strategy} needs the market index")
+    core = positions_core(positions_df, measured_df, registry, market_index_df)
+    core.allocate(strategy)
+    return core.allocation_frame()
+
+# Function to set up the settlement core on the intervals of a trade allocation (as written to
+# trade_allocation.csv), with its contributions
+def allocation_core(assets_df, trade_allocation_df, registry=None, settled_intervals=None):
+    registry = registry if registry is not None else AssetRegistry(assets_df)
+    ensure_datetime(trade_allocation_df)
+    time_index = pd.DatetimeIndex(trade_allocation_df['delivery_start'])
+    if settled_intervals is not None:
+        time_index = time_index.union(pd.DatetimeIndex(settled_intervals)).sort_values()
+    core = SettlementCore(registry, time_index)
+    core.set_allocation(trade_allocation_df)
+    return core
 
 # Function to calculate revenue for each asset
-def calculate_asset_revenue(assets_df, trade_allocation_df, market_index_df):
-    trade_allocation_df['delivery_start'] = pd.to_datetime(trade_allocation_df['delivery_start'])
-    market_index_df['delivery_start'] = pd.to_datetime(market_index_df['delivery_start'])
-    revenue_df = pd.merge(trade_allocation_df, market_index_df, on='delivery_start', how='left')
-    meter_to_asset = {'mp_1': 'a_1', 'mp_2': 'a_2', 'mp_3': 'a_3', 'mp_4': 'a_4'}
-    revenue_df['mp_1_revenue'] = 0.0
-    revenue_df['mp_2_revenue'] = 0.0
-    revenue_df['mp_3_revenue'] = 0.0
-    revenue_df['mp_4_revenue'] = 0.0
-    for mp, asset_id in meter_to_asset.items():
-        asset = assets_df[assets_df['asset_id'] == asset_id].iloc[0]
-        price_model = asset['price_model']
-        contribution_col = f"{mp}_contribution"
-        if price_model == 'fixed':
-            fixed_price = asset['price__eur_per_mwh']
-            revenue_df[f"{mp}_revenue"] = revenue_df[contribution_col] * fixed_price
-        elif price_model == 'market':
-            revenue_df[f"{mp}_revenue"] = revenue_df[contribution_col] * revenue_df['market_index_price']
-    output_df = revenue_df[['delivery_start', 'mp_1_revenue', 'mp_2_revenue', 'mp_3_revenue', 'mp_4_revenue']]
-    output_file = "asset_revenue.csv"
-    output_df.to_csv(output_file, index=False, sep=",")
-    print(f"Asset revenue saved to {output_file}")
+# Prices come from each asset's contract term active in the interval (see AssetRegistry.price_matrix);
+# intervals outside an asset's contract earn no revenue. registry is built from assets_df if not given.
+def calculate_asset_revenue(assets_df, trade_allocation_df, market_index_df, registry=None):
+    ensure_datetime(market_index_df)
+    core = allocation_core(assets_df, trade_allocation_df, registry)
+    core.set_market_price(market_index_df)
+    core.compute_revenue()
+    return core.revenue_frame()
 
 # Function to calculate invoices for each asset
-def calculate_invoices(assets_df, trade_allocation_df, asset_revenue_df, market_index_df):
-    required_cols = ['mp_1_revenue', 'mp_2_revenue', 'mp_3_revenue', 'mp_4_revenue']
+# Fees accrue per settled interval under the contract term active there (see settlement_core.FEE_MODELS)
+# and the market-linked part is priced at the average market index price of the period.
+# settled_intervals (e.g. measured_intervals(measured_df)) is the settled period: capacity fees accrue
+# over all of it, also in intervals without trades. Without it only the traded intervals are charged.
+def calculate_invoices(assets_df, trade_allocation_df, asset_revenue_df, market_index_df, registry=None,
+                       settled_intervals=None):
+    registry = registry if registry is not None else AssetRegistry(assets_df)
+    required_cols = [f"{mp}_revenue" for mp in registry.metering_point_ids]
     missing_cols = [col for col in required_cols if col not in asset_revenue_df.columns]
     if missing_cols:
         print(f"Error: Missing columns in asset_revenue_df: {missing_cols}")
-        return
+        return None
 
-    meter_to_asset = {'mp_1': 'a_1', 'mp_2': 'a_2', 'mp_3': 'a_3', 'mp_4': 'a_4'}
-    total_revenue = {
-        'a_1': asset_revenue_df['mp_1_revenue'].sum(),
-        'a_2': asset_revenue_df['mp_2_revenue'].sum(),
-        'a_3': asset_revenue_df['mp_3_revenue'].sum(),
-        'a_4': asset_revenue_df['mp_4_revenue'].sum()
-    }
-    total_contribution = {
-        'a_1': trade_allocation_df['mp_1_contribution'].sum(),
-        'a_2': trade_allocation_df['mp_2_contribution'].sum(),
-        'a_3': trade_allocation_df['mp_3_contribution'].sum(),
-        'a_4': trade_allocation_df['mp_4_contribution'].sum()
-    }
-    avg_market_price = market_index_df['market_index_price'].mean()
-    invoice_df = pd.DataFrame(columns=['asset_id', 'net_revenue', 'unit_net_revenue', 'gross_revenue'])
-    invoice_df['asset_id'] = ['a_1', 'a_2', 'a_3', 'a_4']
-    for index, row in invoice_df.iterrows():
-        asset_id = row['asset_id']
-        asset = assets_df[assets_df['asset_id'] == asset_id].iloc[0]
-        fee_model = asset['fee_model']
-        if fee_model == 'fixed_as_produced':
-            fee = total_contribution[asset_id] * asset['fee__eur_per_mwh']
-        elif fee_model == 'fixed_for_capacity':
-            fee = (asset['capacity__kw'] / 1000) * asset['fee__eur_per_mwh']
-        elif fee_model == 'percent_of_market':
-            fee = total_contribution[asset_id] * avg_market_price * (asset['fee_percent'] / 100)
-        net_revenue = total_revenue[asset_id] + fee
-        unit_net_revenue = net_revenue / (asset['capacity__kw'] / 1000)
-        gross_revenue = net_revenue * 1.19
-        invoice_df.at[index, 'net_revenue'] = net_revenue
-        invoice_df.at[index, 'unit_net_revenue'] = unit_net_revenue
-        invoice_df.at[index, 'gross_revenue'] = gross_revenue
-    output_file = "asset_invoices.csv"
-    invoice_df.to_csv(output_file, index=False, sep=",")
-    print(f"Asset invoices saved to {output_file}")
+    core = allocation_core(assets_df, trade_allocation_df, registry, settled_intervals)
+    core.set_revenue(asset_revenue_df)
+    return core.invoices(market_index_df['market_index_price'].mean())
+
+# Function to build the invoice table from per-asset totals
+# fee_part and fee_weight map asset_id to the summed fee parts of the billing period (see
+# settlement_core.interval_fee_parts) and total_revenue to its summed revenue in EUR.
+def invoices_from_totals(assets_df, fee_part, fee_weight, total_revenue, avg_market_price, registry=None):
+    registry = registry if registry is not None else AssetRegistry(assets_df)
+    asset_ids = list(registry.asset_ids)
+    return invoice_table(registry, [fee_part[asset_id] for asset_id in asset_ids], [fee_weight[asset_id] for asset_id in asset_ids],
+                         [total_revenue[asset_id] for asset_id in asset_ids], avg_market_price)
+
+# Function to invoice every asset for every billing period ('day' or 'month' of the local delivery
+# date) in one pass (see SettlementCore.invoices_by_period); the market price is averaged per period.
+# Fees accrue per settled interval, so a month's invoice equals the sum of its days' invoices;
+# settled_intervals works as in calculate_invoices, so a day without trades still gets its capacity fees.
+def calculate_invoices_by_period(assets_df, trade_allocation_df, asset_revenue_df, market_index_df, period="month",
+                                 registry=None, settled_intervals=None):
+    core = allocation_core(assets_df, trade_allocation_df, registry, settled_intervals)
+    core.set_revenue(asset_revenue_df)
+    avg_market_price = market_index_df['market_index_price'].groupby(
+        billing_periods(market_index_df['delivery_start'], period)).mean()
+    return core.invoices_by_period(period, avg_market_price)
 
 # Function to calculate imbalance penalties
-def calculate_imbalance_penalty(measured_df, forecast_a1_df, forecast_a2_df, forecast_a3_df, forecast_a4_df, imbalance_penalty_df):
+# forecast_dfs maps asset_id to that asset's forecast frame (in MW). Every input is reindexed once
+# onto the sorted measured delivery_start index; intervals without a measured value, forecast or
+# penalty price are reported; with_report also returns them as a frame of input/delivery_start rows
+# (see settlement_core.missing_intervals), as (output_df, report).
+def calculate_imbalance_penalty(assets_df, measured_df, forecast_dfs, imbalance_penalty_df, with_report=False):
     # Ensure datetime columns are consistent
-    measured_df['delivery_start'] = pd.to_datetime(measured_df['delivery_start'])
-    imbalance_penalty_df['delivery_start'] = pd.to_datetime(imbalance_penalty_df['delivery_start'])
-
-    # Merge measured data with imbalance penalties
-    imbalance_df = pd.merge(measured_df, imbalance_penalty_df, on='delivery_start', how='left')
-
-    # Merge forecast data for each asset
-    forecast_dfs = {
-        'mp_1': forecast_a1_df,
-        'mp_2': forecast_a2_df,
-        'mp_3': forecast_a3_df,
-        'mp_4': forecast_a4_df
-    }
-    for mp, forecast_df in forecast_dfs.items():
-        forecast_df = forecast_df.rename(columns={'forecast': f'{mp}_forecast'})
-        imbalance_df = pd.merge(imbalance_df, forecast_df[['delivery_start', f'{mp}_forecast']], 
-                              on='delivery_start', how='left')
-
-    # Calculate imbalance volume (measured - forecast) for each asset
-    imbalance_df['a_1_imbalance'] = imbalance_df['mp_1'] - imbalance_df['mp_1_forecast']
-    imbalance_df['a_2_imbalance'] = imbalance_df['mp_2'] - imbalance_df['mp_2_forecast']
-    imbalance_df['a_3_imbalance'] = imbalance_df['mp_3'] - imbalance_df['mp_3_forecast']
-    imbalance_df['a_4_imbalance'] = imbalance_df['mp_4'] - imbalance_df['mp_4_forecast']
-
-    # Calculate imbalance penalty for each asset
-    imbalance_df['a_1_penalty'] = imbalance_df['a_1_imbalance'] * imbalance_df['imbalance_penalty']
-    imbalance_df['a_2_penalty'] = imbalance_df['a_2_imbalance'] * imbalance_df['imbalance_penalty']
-    imbalance_df['a_3_penalty'] = imbalance_df['a_3_imbalance'] * imbalance_df['imbalance_penalty']
-    imbalance_df['a_4_penalty'] = imbalance_df['a_4_imbalance'] * imbalance_df['imbalance_penalty']
-
-    # Calculate total imbalance penalty per timestep
-    imbalance_df['total_penalty'] = (imbalance_df['a_1_penalty'] + 
-                                    imbalance_df['a_2_penalty'] + 
-                                    imbalance_df['a_3_penalty'] + 
-                                    imbalance_df['a_4_penalty'])
-
-    # Select relevant columns for output
-    output_df = imbalance_df[['delivery_start', 'a_1_penalty', 'a_2_penalty', 'a_3_penalty', 'a_4_penalty', 'total_penalty']]
-
-    # Save to CSV
-    output_file = "imbalance_penalties.csv"
-    output_df.to_csv(output_file, index=False, sep=",")
-    print(f"Imbalance penalties saved to {output_file}")
+    ensure_datetime(measured_df)
+    ensure_datetime(imbalance_penalty_df)
+
+    # Align measured values, penalty prices and all forecasts on one shared time index
+    core = SettlementCore(AssetRegistry(assets_df), measured_intervals(measured_df))
+    core.set_measured(measured_df)
+    core.set_imbalance_penalty(imbalance_penalty_df)
+    core.set_forecasts(forecast_dfs)
+
+    # Calculate imbalance penalty for every asset at once: (measured - forecast) * penalty price,
+    # plus the total imbalance penalty per timestep
+    core.compute_penalty()
+    output_df = core.penalty_frame()
+    if with_report:
+        return output_df, core.missing_report
+    return output_df
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Settle trades against measured production.")
+    parser.add_argument("--keep-intermediate-files", action="store_true",
+                        help="also write trade_allocation.csv for auditing")
+    parser.add_argument("--cache-dir", default=None,
+                        help="cache stage outputs in this directory and only recompute stages whose inputs changed")
+    parser.add_argument("--cache-max-mb", type=int, default=512, help="size limit of the stage cache")
+    parser.add_argument("--storage", choices=["csv", "arrow", "parquet"], default="csv",
+                        help="file format of inputs and results")
+    parser.add_argument("--resolution", default=None,
+                        help="settle at this interval length, e.g. 15min (inputs are split/summed or held/averaged)")
+    parser.add_argument("--metrics-file", default=None, help="write per-stage wall/CPU time, peak RSS, rows and bytes as JSON")
+    parser.add_argument("--profile-stages", nargs="+", default=None,
+                        help="run these stages (or 'all') under cProfile, .prof files go to profiles/")
+    parser.add_argument("--trace-memory", action="store_true", help="add tracemalloc peaks and top allocation sites")
+    parser.add_argument("--billing-period", choices=["day", "month"], default=None,
+                        help="also invoice every asset per local delivery day or month (asset_invoices_by_period.csv)")
+    parser.add_argument("--trade-pnl", action="store_true", help="also write the P&L of every trade to trade_pnl.csv")
+    parser.add_argument("--allocation-strategy", choices=list(ALLOCATION_STRATEGIES), default="merit_order",
+                        help="how each interval's net position is split across the meters")
+    parser.add_argument("--results-db", default=None, help="also store the results in this SQLite database, e.g. results.sqlite")
+    parser.add_argument("--rollup-cube", default=None, help="also append the results to this rollup cube, e.g. rollup_cube.npz")
+    args = parser.parse_args()
+    main(keep_intermediate_files=args.keep_intermediate_files, cache_dir=args.cache_dir, cache_max_mb=args.cache_max_mb,
+         storage=args.storage, resolution=args.resolution, metrics_file=args.metrics_file,
+         profile_stages=args.profile_stages, trace_memory=args.trace_memory, billing_period=args.billing_period,
+         with_trade_pnl=args.trade_pnl, allocation_strategy=args.allocation_strategy, results_db=args.results_db,
+         cube_file=args.rollup_cube)
\ No newline at end of file
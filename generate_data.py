@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Delivery days follow the local market day (measured_20241013.csv starts at 2024-10-12 22:00 UTC)
+LOCAL_TIMEZONE = "Europe/Berlin"
+
+FEE_MODELS = ['fixed_as_produced', 'fixed_for_capacity', 'percent_of_market']
+
+# Function to format timestamps like the sample CSV files (2024-10-12 22:00:00+00:00)
+def csv_timestamps(time_index):
+    return time_index.strftime("%Y-%m-%d %H:%M:%S+00:00")
+
+# Function to format timestamps like the sample JSON files (2024-10-12T22:00:00+00:00)
+def json_timestamps(time_index):
+    return list(time_index.strftime("%Y-%m-%dT%H:%M:%S+00:00"))
+
+# Function to build the UTC interval index covering the given local delivery days
+def delivery_index(start, days, resolution):
+    first_day = pd.Timestamp(start)
+    local_start = first_day.tz_localize(LOCAL_TIMEZONE)
+    local_end = (first_day + pd.Timedelta(days=days)).tz_localize(LOCAL_TIMEZONE)
+    return pd.date_range(local_start, local_end, freq=resolution, inclusive='left').tz_convert('UTC')
+
+# Function to create the asset base data with a mix of technologies, price models and fee models
+def make_assets(assets, start, rng):
+    solar = rng.random(assets) < 0.6
+    capacity = np.where(solar, rng.choice([500, 1000, 2000], assets), rng.choice([2000, 3000, 5000], assets))
+    fixed_price = rng.random(assets) < 0.6
+    fee_model = np.array(FEE_MODELS)[np.arange(assets) % len(FEE_MODELS)]
+    months_before = rng.integers(1, 12, assets)
+    contract_begin = [(pd.Timestamp(start) - pd.DateOffset(months=int(m))).strftime("%Y-%m-01") for m in months_before]
+    return pd.DataFrame({
+        'asset_id': [f"a_{i}" for i in range(1, assets + 1)],
+        'metering_point_id': [f"mp_{i}" for i in range(1, assets + 1)],
+        'capacity__kw': capacity,
+        'technology': np.where(solar, 'solar', 'wind'),
+        'contract_begin': contract_begin,
+        'contract_end': '',
+        'price_model': np.where(fixed_price, 'fixed', 'market'),
+        'price__eur_per_mwh': np.where(fixed_price, np.round(rng.uniform(8, 20, assets), 1), np.nan),
+        'fee_model': fee_model,
+        'fee__eur_per_mwh': np.where(fee_model == 'fixed_as_produced', np.round(rng.uniform(1.0, 1.5, assets), 1),
+                                     np.where(fee_model == 'fixed_for_capacity', np.round(rng.uniform(0.5, 0.8, assets), 1), np.nan)),
+        'fee_percent': pd.Series(rng.integers(10, 21, assets), dtype="Int64").where(fee_model == 'percent_of_market'),
+    })
+
+# Function to create forecast production in kW (intervals x assets)
+# Solar follows a daylight bell scaled by a daily cloudiness factor, wind a mean-reverting capacity factor.
+def make_forecasts(assets_df, time_index, rng):
+    capacity = assets_df['capacity__kw'].to_numpy(dtype=float)
+    solar = (assets_df['technology'] == 'solar').to_numpy()
+    local = time_index.tz_convert(LOCAL_TIMEZONE)
+    hour = (local.hour + local.minute / 60).to_numpy()
+    daylight = np.clip(np.sin(np.pi * (hour - 6) / 12), 0, None) ** 1.5
+    day_number = (local.normalize() - local.normalize()[0]).days.to_numpy()
+    cloudiness = rng.uniform(0.3, 1.0, (day_number.max() + 1, len(capacity)))[day_number]
+    solar_factor = daylight[:, None] * cloudiness
+
+    wind_factor = np.empty((len(time_index), len(capacity)))
+    level = rng.uniform(0.2, 0.6, len(capacity))
+    shocks = rng.normal(0, 0.04, wind_factor.shape)
+    for t in range(len(time_index)):
+        level = np.clip(0.97 * level + 0.03 * 0.35 + shocks[t], 0, 1)
+        wind_factor[t] = level
+    return np.round(np.where(solar, solar_factor, wind_factor) * capacity, 0)
+
+# Function to create day-ahead style market prices (EUR/MWh) with a daily shape and occasional negatives
+def make_market_prices(time_index, rng):
+    hour = time_index.tz_convert(LOCAL_TIMEZONE).hour.to_numpy()
+    shape = 45 + 25 * np.sin(np.pi * (hour - 11) / 12) - 30 * ((hour >= 10) & (hour <= 15))
+    return np.round(shape + rng.normal(0, 12, len(time_index)), 2)
+
+# Function to create imbalance penalty prices (EUR/MWh) with rare spikes
+def make_penalty_prices(time_index, rng):
+    penalty = np.abs(rng.normal(45, 35, len(time_index)))
+    spikes = rng.random(len(time_index)) < 0.02
+    penalty[spikes] *= rng.uniform(5, 25, spikes.sum())
+    return np.round(penalty, 2)
+
+# Function to create sell (and optionally buy) trades whose net quantity follows the fleet forecast
+def make_trades(time_index, resolution, fleet_forecast_mw, rng, trades_per_interval=1, buy_share=0.0):
+    n = len(time_index) * trades_per_interval
+    interval = np.repeat(np.arange(len(time_index)), trades_per_interval)
+    starts = time_index[interval]
+    quantity = np.round(fleet_forecast_mw[interval] / trades_per_interval * rng.uniform(0.7, 1.0, n), 1)
+    side = np.where(rng.random(n) < buy_share, 'buy', 'sell')
+    quantity = np.where(side == 'buy', np.round(quantity * rng.uniform(0.05, 0.3, n), 1), quantity)
+    execution_time = starts - pd.to_timedelta(rng.integers(15, 180, n), unit='min')
+    return [{'delivery_end': end, 'delivery_start': start, 'execution_time': executed, 'price': price,
+             'quantity': q, 'side': s, 'trade_id': trade_id}
+            for end, start, executed, price, q, s, trade_id in zip(
+                json_timestamps(starts + pd.Timedelta(resolution)), json_timestamps(starts), json_timestamps(execution_time),
+                np.round(rng.uniform(5, 100, n), 2).tolist(), quantity.tolist(), side.tolist(),
+                (1_000_000 + rng.permutation(n)).tolist())]
+
+# Function to write a complete synthetic input set in the formats of the sample files
+# Measured production goes to one measured_YYYYMMDD.csv per delivery day (as streaming_settlement.py
+# expects), or to a single file named after the first day when single_measured_file is set
+# (as energy_trading5.load_inputs expects). Returns the paths written per input.
+def generate_dataset(output_dir=".", assets=4, start="2024-10-13", days=1, resolution="1h",
+                     trades_per_interval=1, buy_share=0.0, single_measured_file=False, seed=42):
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    time_index = delivery_index(start, days, resolution)
+    assets_df = make_assets(assets, start, rng)
+    forecast_kw = make_forecasts(assets_df, time_index, rng)
+    measured_kw = np.round(np.clip(forecast_kw * rng.normal(1.0, 0.1, forecast_kw.shape), 0, None), 0)
+    written = {'assets': os.path.join(output_dir, "assets_base_data.csv"), 'measured': [], 'forecasts': []}
+    assets_df.to_csv(written['assets'], sep=";", index=False, na_rep="")
+
+    measured_df = pd.DataFrame(measured_kw, columns=list(assets_df['metering_point_id']))
+    measured_df.insert(0, 'delivery_start', csv_timestamps(time_index))
+    delivery_day = time_index.tz_convert(LOCAL_TIMEZONE).strftime("%Y%m%d")
+    for day in ([delivery_day[0]] if single_measured_file else pd.unique(delivery_day)):
+        path = os.path.join(output_dir, f"measured_{day}.csv")
+        rows = slice(None) if single_measured_file else (delivery_day == day)
+        measured_df[rows].to_csv(path, sep=";", index=False)
+        written['measured'].append(path)
+
+    for file_name, column, values in [("market_index_price.csv", 'market_index_price', make_market_prices(time_index, rng)),
+                                      ("imbalance_penalty.csv", 'imbalance_penalty', make_penalty_prices(time_index, rng))]:
+        written[column] = os.path.join(output_dir, file_name)
+        pd.DataFrame({'delivery_start': csv_timestamps(time_index), column: values}).to_csv(written[column], sep=";", index=False)
+
+    timestamps = json_timestamps(time_index)
+    for i, asset_id in enumerate(assets_df['asset_id']):
+        file_asset_id = asset_id.replace('_', '')
+        path = os.path.join(output_dir, f"{file_asset_id}.json")
+        with open(path, 'w') as file:
+            json.dump({'asset_id': file_asset_id, 'values': dict(zip(timestamps, forecast_kw[:, i].tolist()))}, file)
+        written['forecasts'].append(path)
+
+    trades = make_trades(time_index, resolution, forecast_kw.sum(axis=1) / 1000, rng, trades_per_interval, buy_share)
+    written['trades'] = os.path.join(output_dir, "trades.json")
+    with open(written['trades'], 'w') as file:
+        json.dump(trades, file)
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic pipeline inputs in the formats of the sample files.")
+    parser.add_argument("--output-dir", default="synthetic_data")
+    parser.add_argument("--assets", type=int, default=4)
+    parser.add_argument("--start", default="2024-10-13", help="first local delivery day (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--resolution", default="1h", help="interval length, e.g. 1h or 15min")
+    parser.add_argument("--trades-per-interval", type=int, default=1)
+    parser.add_argument("--buy-share", type=float, default=0.0, help="fraction of trades that are buys")
+    parser.add_argument("--single-measured-file", action="store_true", help="write all days into one measured file")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    written = generate_dataset(args.output_dir, args.assets, args.start, args.days, args.resolution,
+                               args.trades_per_interval, args.buy_share, args.single_measured_file, args.seed)
+    print(f"Wrote {args.assets} assets x {args.days} days at {args.resolution} to {args.output_dir} "
+          f"({len(written['measured'])} measured files, {len(written['forecasts'])} forecast files)")
@@ -0,0 +1,130 @@
+import cProfile
+import json
+import os
+import platform
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import pandas as pd
+
+# Function to read the process I/O counters (bytes passed through read/write calls); None where unsupported
+def _io_counters():
+    try:
+        with open("/proc/self/io", 'r') as file:
+            counters = dict(line.split(":") for line in file.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+# Function to reset the peak RSS so it can be measured per stage (Linux only); returns whether it worked
+def _reset_peak_rss():
+    try:
+        with open("/proc/self/clear_refs", 'w') as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+# Function to read the peak RSS in MB (since the last reset on Linux, since process start elsewhere)
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status", 'r') as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+# Function to count the rows of a stage input or output (a DataFrame, a dict of them or None)
+def count_rows(value):
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(count_rows(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(count_rows(item) for item in value)
+    return 0
+
+# Collects wall time, CPU time, peak RSS, rows and bytes per stage of a run and writes them as JSON
+# profile_stages names the stages run under cProfile ('all' for every stage); the .prof files go to
+# profile_dir. trace_memory additionally records the tracemalloc peak and top allocation sites.
+class RunMetrics:
+    def __init__(self, run_name, profile_stages=None, profile_dir="profiles", trace_memory=False):
+        self.run_name = run_name
+        self.profile_stages = set(profile_stages or [])
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.started = datetime.now(timezone.utc)
+        self.started_counter = time.perf_counter()
+        self.stages = []
+
+    # Context manager around one stage; the yielded record takes rows_in/rows_out set by the caller
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = {'stage': name, 'rows_in': count_rows(rows_in) if rows_in is not None else None, 'rows_out': None}
+        profiler = cProfile.Profile() if name in self.profile_stages or 'all' in self.profile_stages else None
+        peak_reset = _reset_peak_rss()
+        io_before = _io_counters()
+        if self.trace_memory:
+            tracemalloc.start()
+        wall_before, cpu_before = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record['wall_s'] = round(time.perf_counter() - wall_before, 6)
+            record['cpu_s'] = round(time.process_time() - cpu_before, 6)
+            record['peak_rss_mb'] = round(_peak_rss_mb(), 1)
+            record['peak_rss_scope'] = 'stage' if peak_reset else 'process'
+            io_after = _io_counters()
+            if io_before is not None and io_after is not None:
+                record['bytes_read'] = io_after[0] - io_before[0]
+                record['bytes_written'] = io_after[1] - io_before[1]
+            if self.trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                record['tracemalloc_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 3)
+                tracemalloc.stop()
+                record['top_allocations'] = [f"{stat.traceback[0].filename}:{stat.traceback[0].lineno} {stat.size / 1024:.1f} KiB"
+                                             for stat in snapshot.statistics('lineno')[:5]]
+            if profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record['profile'] = os.path.join(self.profile_dir, f"{self.run_name}_{name}.prof")
+                profiler.dump_stats(record['profile'])
+            self.stages.append(record)
+
+    # Function to summarise the run as a JSON-serialisable dict
+    def to_dict(self):
+        return {
+            'run': self.run_name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'argv': sys.argv,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'total_wall_s': round(time.perf_counter() - self.started_counter, 6),
+            'stages': self.stages,
+        }
+
+    # Function to write the metrics JSON file
+    def write(self, metrics_file):
+        with open(metrics_file, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+        print(f"Run metrics saved to {metrics_file}")
+
+    # Function to print one line per stage (and the hottest functions of profiled stages)
+    def print_summary(self):
+        for record in self.stages:
+            rows_in, rows_out = (('-' if rows is None else rows) for rows in (record['rows_in'], record['rows_out']))
+            rows = f"{rows_in:>9} -> {rows_out:>9} rows"
+            print(f"{record['stage']:<28} wall {record['wall_s']:8.3f} s  cpu {record['cpu_s']:8.3f} s  "
+                  f"peak RSS {record['peak_rss_mb']:8.1f} MB  {rows}")
+            if 'profile' in record:
+                pstats.Stats(record['profile']).sort_stats('cumulative').print_stats(5)
@@ -0,0 +1,296 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+from bulk_ingest import iter_json_array, parse_iso8601_utc
+from energy_trading5 import forecast_file_for_asset, invoices_from_totals, load_csv_to_dataframe
+from settlement_core import AssetRegistry, allocate_merit_order, imbalance_penalty_matrix, interval_fee_parts
+from trade_book import SIDE_SIGNS
+
+# Settlement state of one delivery interval (values in MW, prices in EUR/MWh)
+class IntervalState:
+    def __init__(self, meters):
+        self.net_quantity = 0.0
+        self.has_trade = False
+        self.has_measured = False
+        self.measured = np.full(meters, np.nan)
+        self.forecast = np.full(meters, np.nan)
+        self.market_price = np.nan
+        self.prices = None
+        self.active = None
+        self.imbalance_penalty = np.nan
+        self.contribution = np.zeros(meters)
+        self.fee_part = np.zeros(meters)
+        self.fee_weight = np.zeros(meters)
+        self.revenue = np.zeros(meters)
+        self.penalty = np.zeros(meters)
+
+# Live settlement of a fleet: every event only recomputes the delivery interval it touches
+# Allocation, revenue and penalty of that interval are recomputed with the same kernels as the batch
+# pipeline (allocate_merit_order, AssetRegistry.price_matrix, imbalance_penalty_matrix) and the
+# difference to the previous values is applied to the per-asset totals. Trades are netted by side and
+# mapped onto the interval (of length resolution) containing their delivery_start, like trade_book.py.
+class LiveSettlement:
+    def __init__(self, assets_df, resolution="1h"):
+        self.assets_df = assets_df
+        self.registry = AssetRegistry(assets_df)
+        self.asset_ids = list(self.registry.asset_ids)
+        self.meter_slots = {mp: i for i, mp in enumerate(self.registry.metering_point_ids)}
+        self.asset_slots = {asset_id: i for i, asset_id in enumerate(self.asset_ids)}
+        self.step = pd.Timedelta(resolution).value
+        self.step_days = self.step / pd.Timedelta(days=1).value
+        self.intervals = {}
+        meters = len(self.asset_ids)
+        self.total_contribution = np.zeros(meters)
+        self.total_fee_part = np.zeros(meters)
+        self.total_fee_weight = np.zeros(meters)
+        self.total_revenue = np.zeros(meters)
+        self.total_penalty = np.zeros(meters)
+        self.market_price_sum, self.market_price_count = 0.0, 0
+        self.events = 0
+        self.timings = deque(maxlen=100_000)
+
+    def _interval(self, key):
+        if key not in self.intervals:
+            self.intervals[key] = IntervalState(len(self.asset_ids))
+        return self.intervals[key]
+
+    def _key(self, timestamp):
+        value = pd.Timestamp(timestamp).value
+        return value - value % self.step
+
+    # Recompute allocation and revenue of one interval and move the per-asset totals by the change
+    # The asset prices of the interval only change with its market price, so they are kept on the state,
+    # and so is which assets are under contract there (the others take no volume and pay no fee).
+    # A measured interval is settled even without trades, so its capacity fees are charged too.
+    def _reallocate(self, key):
+        state = self.intervals[key]
+        if not (state.has_trade or state.has_measured):
+            return
+        delivery_start = pd.DatetimeIndex([key], tz='UTC')
+        if state.prices is None:
+            state.prices = self.registry.price_matrix(delivery_start, [state.market_price])[:, 0]
+        if state.active is None:
+            state.active = self.registry.active_mask(delivery_start)[:, 0]
+        contribution = allocate_merit_order([state.net_quantity], np.where(state.active, state.measured, 0.0)[None, :])[0][0]
+        revenue = np.nan_to_num(contribution * state.prices)
+        fee_part, fee_weight = (part[:, 0] for part in interval_fee_parts(self.registry, contribution[:, None], delivery_start,
+                                                                          self.step_days))
+        self.total_contribution += contribution - state.contribution
+        self.total_fee_part += fee_part - state.fee_part
+        self.total_fee_weight += fee_weight - state.fee_weight
+        self.total_revenue += revenue - state.revenue
+        state.contribution, state.revenue = contribution, revenue
+        state.fee_part, state.fee_weight = fee_part, fee_weight
+
+    # Recompute the imbalance penalty of one interval and move the per-asset totals by the change
+    def _repenalize(self, key):
+        state = self.intervals[key]
+        penalty = np.nan_to_num(imbalance_penalty_matrix(state.measured[:, None], state.forecast[:, None],
+                                                         [state.imbalance_penalty])[:, 0])
+        self.total_penalty += penalty - state.penalty
+        state.penalty = penalty
+
+    # A trade record as in trades.json (block products are split evenly across their intervals)
+    def apply_trade(self, trade):
+        start, end = pd.Timestamp(trade['delivery_start']).value, pd.Timestamp(trade['delivery_end']).value
+        keys = list(range(start - start % self.step, max(end, start + 1), self.step))
+        signed = float(trade['quantity']) * SIDE_SIGNS[trade.get('side', 'sell')] / len(keys)
+        for key in keys:
+            state = self._interval(key)
+            state.net_quantity += signed
+            state.has_trade = True
+            self._reallocate(key)
+
+    # Measured production of one interval in kW per metering point
+    def apply_measured(self, delivery_start, values_kw):
+        key = self._key(delivery_start)
+        state = self._interval(key)
+        for mp, value in values_kw.items():
+            if mp in self.meter_slots:
+                state.measured[self.meter_slots[mp]] = value / 1000
+        state.has_measured = True
+        self._reallocate(key)
+        self._repenalize(key)
+
+    # Forecast of one asset for one interval in kW
+    def apply_forecast(self, asset_id, delivery_start, value_kw):
+        key = self._key(delivery_start)
+        self._interval(key).forecast[self.asset_slots[asset_id]] = value_kw / 1000
+        self._repenalize(key)
+
+    def apply_market_price(self, delivery_start, price):
+        key = self._key(delivery_start)
+        state = self._interval(key)
+        if np.isnan(state.market_price):
+            self.market_price_count += 1
+        else:
+            self.market_price_sum -= state.market_price
+        state.market_price, state.prices = price, None
+        self.market_price_sum += price
+        self._reallocate(key)
+
+    def apply_imbalance_penalty(self, delivery_start, price):
+        key = self._key(delivery_start)
+        self._interval(key).imbalance_penalty = price
+        self._repenalize(key)
+
+    # Apply one event from the feed; records the latency since it was put on the queue (including the
+    # time spent waiting there) and the time spent updating the state
+    def apply(self, event):
+        kind, payload, enqueued = event
+        started = time.perf_counter()
+        if kind == 'trade':
+            self.apply_trade(payload)
+        elif kind == 'measured':
+            self.apply_measured(*payload)
+        elif kind == 'forecast':
+            self.apply_forecast(*payload)
+        elif kind == 'market_price':
+            self.apply_market_price(*payload)
+        elif kind == 'imbalance_penalty':
+            self.apply_imbalance_penalty(*payload)
+        else:
+            raise ValueError(f"Unknown event type {kind}")
+        self.events += 1
+        finished = time.perf_counter()
+        self.timings.append((kind, finished - enqueued, finished - started))
+
+    # Current per-asset totals
+    def totals(self):
+        return {asset_id: {'total_contribution': self.total_contribution[i], 'total_revenue': self.total_revenue[i],
+                           'total_penalty': self.total_penalty[i]}
+                for i, asset_id in enumerate(self.asset_ids)}
+
+    # Invoices for the intervals seen so far (same fee logic as the batch run)
+    def invoices(self):
+        avg_market_price = self.market_price_sum / self.market_price_count if self.market_price_count else np.nan
+        return invoices_from_totals(self.assets_df, dict(zip(self.asset_ids, self.total_fee_part)),
+                                    dict(zip(self.asset_ids, self.total_fee_weight)), dict(zip(self.asset_ids, self.total_revenue)),
+                                    avg_market_price, self.registry)
+
+    # Latency (queued to applied, including waiting in the queue) and service time (applying only)
+    # percentiles in milliseconds per event type over the most recent events
+    def latency_stats(self):
+        stats = {'events': self.events}
+        if not self.timings:
+            return stats
+        timings = pd.DataFrame(list(self.timings), columns=['kind', 'latency', 'service'])
+        for kind, group in timings.groupby('kind'):
+            latency, service = group['latency'].to_numpy() * 1000, group['service'].to_numpy() * 1000
+            stats[kind] = {'events': len(group), 'latency_p50_ms': round(float(np.percentile(latency, 50)), 3),
+                           'latency_p99_ms': round(float(np.percentile(latency, 99)), 3),
+                           'service_p50_ms': round(float(np.percentile(service, 50)), 3),
+                           'service_max_ms': round(float(service.max()), 3)}
+        return stats
+
+# Function to consume events from the queue until the end-of-feed marker (None)
+async def consume(service, queue):
+    while True:
+        event = await queue.get()
+        if event is None:
+            return
+        service.apply(event)
+
+# Function to answer GET /totals, /invoices and /latency with JSON on a local port
+async def serve_queries(service, host="127.0.0.1", port=8765):
+    async def handle(reader, writer):
+        request_line = (await reader.readline()).decode(errors='replace').split()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line[1] if len(request_line) > 1 else "/"
+        if path == "/totals":
+            body, status = json.dumps(service.totals()), "200 OK"
+        elif path == "/invoices":
+            body, status = service.invoices().to_json(orient='records'), "200 OK"
+        elif path == "/latency":
+            body, status = json.dumps(service.latency_stats()), "200 OK"
+        else:
+            body, status = json.dumps({'error': f"unknown path {path}", 'paths': ["/totals", "/invoices", "/latency"]}), "404 Not Found"
+        writer.write(f"HTTP/1.0 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body.encode())}\r\n\r\n{body}".encode())
+        await writer.drain()
+        writer.close()
+    return await asyncio.start_server(handle, host, port)
+
+# Function to build the replay feed from the input files as (event_time, kind, payload), in time order
+# Trades arrive at their execution_time, forecasts (one file per asset, also for assets with several
+# contract terms) and market prices before the first trade, measured values and imbalance penalty
+# prices at the end of their interval.
+def replay_events(assets_df, measured_file="measured_20241013.csv", trades_file="trades.json", resolution="1h"):
+    step = pd.Timedelta(resolution)
+    events = []
+    for trade in iter_json_array(trades_file):
+        events.append((parse_iso8601_utc([trade['execution_time']])[0], 'trade', trade))
+    first_time = min(event[0] for event in events) - pd.Timedelta(seconds=1) if events else pd.Timestamp.min.tz_localize('UTC')
+
+    for asset_id in AssetRegistry(assets_df).asset_ids:
+        with open(forecast_file_for_asset(asset_id), 'r') as file:
+            values = json.load(file)['values']
+        events += [(first_time, 'forecast', (asset_id, start, value)) for start, value in zip(parse_iso8601_utc(list(values)), values.values())]
+    market_index_df = load_csv_to_dataframe("market_index_price.csv", delimiter=";")
+    events += [(first_time, 'market_price', (start, price)) for start, price in
+               zip(pd.to_datetime(market_index_df['delivery_start'], utc=True), market_index_df['market_index_price'])]
+    imbalance_penalty_df = load_csv_to_dataframe("imbalance_penalty.csv", delimiter=";")
+    events += [(start + step, 'imbalance_penalty', (start, price)) for start, price in
+               zip(pd.to_datetime(imbalance_penalty_df['delivery_start'], utc=True), imbalance_penalty_df['imbalance_penalty'])]
+    measured_df = load_csv_to_dataframe(measured_file, delimiter=";")
+    meter_columns = [column for column in measured_df.columns if column != 'delivery_start']
+    for start, values in zip(pd.to_datetime(measured_df['delivery_start'], utc=True), measured_df[meter_columns].to_dict('records')):
+        events.append((start + step, 'measured', (start, values)))
+    order = {'forecast': 0, 'market_price': 1, 'trade': 2, 'measured': 3, 'imbalance_penalty': 4}
+    events.sort(key=lambda event: (event[0], order[event[1]]))
+    return events
+
+# Function to stream the feed into the queue; speed is feed seconds per wall-clock second (0: no waiting)
+async def replay(queue, events, speed=0.0):
+    if events:
+        feed_start, wall_start = events[0][0], time.perf_counter()
+        for i, (event_time, kind, payload) in enumerate(events):
+            if speed > 0:
+                delay = (event_time - feed_start).total_seconds() / speed - (time.perf_counter() - wall_start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif i % 1000 == 0:
+                await asyncio.sleep(0)
+            await queue.put((kind, payload, time.perf_counter()))
+    await queue.put(None)
+
+# Function to run the service against a replayed feed and keep answering queries while it runs
+async def run_live(measured_file="measured_20241013.csv", trades_file="trades.json", resolution="1h", speed=0.0,
+                   port=8765, serve_after=False):
+    assets_df = load_csv_to_dataframe("assets_base_data.csv", delimiter=";")
+    if assets_df is None:
+        return None
+    service = LiveSettlement(assets_df, resolution)
+    events = replay_events(assets_df, measured_file, trades_file, resolution)
+    print(f"Replaying {len(events)} events (speed {speed or 'unthrottled'}); queries on http://127.0.0.1:{port}/totals")
+    server = await serve_queries(service, port=port)
+    queue = asyncio.Queue(maxsize=10_000)
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(replay(queue, events, speed), consume(service, queue))
+        elapsed = time.perf_counter() - started
+        print(f"Replay finished: {service.events} events in {elapsed:.2f} s")
+        for kind, stats in service.latency_stats().items():
+            if kind != 'events':
+                print(f"  {kind:<18} {stats}")
+        if serve_after:
+            print("Serving queries until interrupted.")
+            await server.serve_forever()
+    return service
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Live settlement service fed by a replay of the input files.")
+    parser.add_argument("--measured-file", default="measured_20241013.csv")
+    parser.add_argument("--trades-file", default="trades.json")
+    parser.add_argument("--resolution", default="1h", help="length of the delivery intervals")
+    parser.add_argument("--speed", type=float, default=0.0, help="feed seconds per second, e.g. 3600 (0: as fast as possible)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve-after", action="store_true", help="keep serving queries after the replay")
+    args = parser.parse_args()
+    service = asyncio.run(run_live(args.measured_file, args.trades_file, args.resolution, args.speed, args.port, args.serve_after))
+    if service is not None:
+        print(service.invoices().to_string(index=False))
@@ -1,12 +1,22 @@
+import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import os
+from columnar_storage import is_columnar, latest_variant, read_table
+from instrumentation import RunMetrics, count_rows
+import results_store
+import rollup_cube
+from downsampling import DEFAULT_MAX_POINTS, MARKER_MAX_POINTS, downsample, time_axis_locator
 
 # Function to load CSV file into a DataFrame
-def load_csv_to_dataframe(file_path, delimiter=","):
+# Arrow/Parquet results are read through the columnar backend; columns restricts the load to a subset.
+def load_csv_to_dataframe(file_path, delimiter=",", columns=None):
     try:
-        df = pd.read_csv(file_path, delimiter=delimiter)
+        if is_columnar(file_path):
+            df = read_table(file_path, columns=columns)
+        else:
+            df = pd.read_csv(file_path, delimiter=delimiter, usecols=columns)
         print(f"Loaded {file_path} successfully.")
         return df
     except FileNotFoundError:
@@ -16,14 +26,21 @@ def load_csv_to_dataframe(file_path, delimiter=","):
         print(f"Error loading {file_path}: {e}")
         return None
 
+# Function to read the metering_point_id -> asset_id mapping from the asset base data
+def load_meter_to_asset(file_path="assets_base_data.csv"):
+    assets_df = load_csv_to_dataframe(file_path, delimiter=";")
+    if assets_df is None:
+        return None
+    return dict(zip(assets_df['metering_point_id'], assets_df['asset_id']))
+
 # Function to create and save the revenue line plot
-def plot_asset_revenues(asset_revenue_df):
+def plot_asset_revenues(asset_revenue_df, meter_to_asset, dpi=300, output_folder="Output", max_points=DEFAULT_MAX_POINTS):
     asset_revenue_df['delivery_start'] = pd.to_datetime(asset_revenue_df['delivery_start'])
     plt.figure(figsize=(12, 6))
-    plt.plot(asset_revenue_df['delivery_start'], asset_revenue_df['mp_1_revenue'], label='Asset a_1 (mp_1)', marker='o')
-    plt.plot(asset_revenue_df['delivery_start'], asset_revenue_df['mp_2_revenue'], label='Asset a_2 (mp_2)', marker='o')
-    plt.plot(asset_revenue_df['delivery_start'], asset_revenue_df['mp_3_revenue'], label='Asset a_3 (mp_3)', marker='o')
-    plt.plot(asset_revenue_df['delivery_start'], asset_revenue_df['mp_4_revenue'], label='Asset a_4 (mp_4)', marker='o')
+    for mp, asset_id in meter_to_asset.items():
+        # Long ranges are decimated with LTTB to the point budget before drawing
+        times, values = downsample(asset_revenue_df['delivery_start'], asset_revenue_df[f"{mp}_revenue"], max_points, method="lttb")
+        plt.plot(times, values, label=f'Asset {asset_id} ({mp})', marker='o' if len(values) <= MARKER_MAX_POINTS else None)
     plt.title('Revenue per Asset Over Time', fontsize=14, fontweight='bold')
     plt.xlabel('Time (HH:MM)', fontsize=12)
     plt.ylabel('Revenue (€)', fontsize=12)
@@ -31,26 +48,25 @@ def plot_asset_revenues(asset_revenue_df):
     plt.grid(True, linestyle='--', alpha=0.7)
     ax = plt.gca()
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%d-%b %H:%M'))
-    ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    ax.xaxis.set_major_locator(time_axis_locator(asset_revenue_df['delivery_start']))
     plt.xticks(rotation=45)
     plt.tight_layout()
-    output_folder = "Output"
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
         print(f"Created folder: {output_folder}")
     output_file = os.path.join(output_folder, "asset_revenue_plot.png")
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
     print(f"Revenue plot saved to {output_file}")
     plt.close()
 
 # Function to create and save the imbalance penalty line plot
-def plot_imbalance_penalties(imbalance_penalty_df):
+def plot_imbalance_penalties(imbalance_penalty_df, meter_to_asset, dpi=300, output_folder="Output", max_points=DEFAULT_MAX_POINTS):
     imbalance_penalty_df['delivery_start'] = pd.to_datetime(imbalance_penalty_df['delivery_start'])
     plt.figure(figsize=(12, 6))
-    plt.plot(imbalance_penalty_df['delivery_start'], imbalance_penalty_df['a_1_penalty'], label='Asset a_1', marker='o')
-    plt.plot(imbalance_penalty_df['delivery_start'], imbalance_penalty_df['a_2_penalty'], label='Asset a_2', marker='o')
-    plt.plot(imbalance_penalty_df['delivery_start'], imbalance_penalty_df['a_3_penalty'], label='Asset a_3', marker='o')
-    plt.plot(imbalance_penalty_df['delivery_start'], imbalance_penalty_df['a_4_penalty'], label='Asset a_4', marker='o')
+    for asset_id in meter_to_asset.values():
+        # Min/max envelope per bucket, so no penalty spike is dropped by the decimation
+        times, values = downsample(imbalance_penalty_df['delivery_start'], imbalance_penalty_df[f"{asset_id}_penalty"], max_points, method="minmax")
+        plt.plot(times, values, label=f'Asset {asset_id}', marker='o' if len(values) <= MARKER_MAX_POINTS else None)
     plt.title('Imbalance Penalty per Asset Over Time', fontsize=14, fontweight='bold')
     plt.xlabel('Time (HH:MM)', fontsize=12)
     plt.ylabel('Imbalance Penalty (€)', fontsize=12)
@@ -58,20 +74,19 @@ def plot_imbalance_penalties(imbalance_penalty_df):
     plt.grid(True, linestyle='--', alpha=0.7)
     ax = plt.gca()
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%d-%b %H:%M'))
-    ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    ax.xaxis.set_major_locator(time_axis_locator(imbalance_penalty_df['delivery_start']))
     plt.xticks(rotation=45)
     plt.tight_layout()
-    output_folder = "Output"
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
         print(f"Created folder: {output_folder}")
     output_file = os.path.join(output_folder, "imbalance_penalty_plot.png")
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
     print(f"Imbalance penalty plot saved to {output_file}")
     plt.close()
 
 # Function to create and save the revenue breakdown bar and point plot
-def plot_revenue_breakdown(asset_invoices_df):
+def plot_revenue_breakdown(asset_invoices_df, dpi=300, output_folder="Output"):
     # Create the plot
     plt.figure(figsize=(10, 6))
 
@@ -112,15 +127,14 @@ def plot_revenue_breakdown(asset_invoices_df):
     # Adjust layout
     plt.tight_layout()
 
-    # Create Output folder if it doesn't exist
-    output_folder = "Output"
+    # Create output folder if it doesn't exist
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
         print(f"Created folder: {output_folder}")
 
     # Save the plot as PNG
     output_file = os.path.join(output_folder, "revenue_breakdown_plot.png")
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
     print(f"Revenue breakdown plot saved to {output_file}")
 
     # Close the plot to free memory
@@ -128,25 +142,66 @@ def plot_revenue_breakdown(asset_invoices_df):
 
 # Main execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot the results of all assets together.")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--max-points", type=int, default=DEFAULT_MAX_POINTS, help="points drawn per line (0: all)")
+    parser.add_argument("--metrics-file", default=None, help="write per-stage timings and memory as JSON")
+    parser.add_argument("--profile-stages", nargs="+", default=None, help="run these stages (or 'all') under cProfile")
+    parser.add_argument("--results-db", default=None, help="read the results from this SQLite database instead of the CSVs")
+    parser.add_argument("--rollup-cube", default=None, help="read the results from this rollup cube instead of the CSVs")
+    parser.add_argument("--level", choices=rollup_cube.LEVELS, default=None, help="plot daily or monthly totals (with --rollup-cube)")
+    parser.add_argument("--start", default=None, help="first delivery_start to plot (with --results-db or --rollup-cube)")
+    parser.add_argument("--end", default=None, help="end of the plotted range, exclusive (with --results-db or --rollup-cube)")
+    args = parser.parse_args()
+    if (args.start or args.end) and args.results_db is None and args.rollup_cube is None:
+        parser.error("--start/--end need --results-db or --rollup-cube (the result files are always plotted whole)")
+    metrics = RunMetrics("plotter3", profile_stages=args.profile_stages)
+
     # Load the data
-    asset_revenue_df = load_csv_to_dataframe("asset_revenue.csv", delimiter=",")
-    imbalance_penalty_df = load_csv_to_dataframe("imbalance_penalties.csv", delimiter=",")
-    asset_invoices_df = load_csv_to_dataframe("asset_invoices.csv", delimiter=",")
+    if args.results_db is None:
+        meter_to_asset = load_meter_to_asset()
+    else:
+        asset_to_meter = results_store.load_asset_to_meter(args.results_db)
+        meter_to_asset = {mp: asset_id for asset_id, mp in asset_to_meter.items()} if asset_to_meter is not None else None
+    if meter_to_asset is None:
+        print(f"Failed to load {args.results_db or 'assets_base_data.csv'}. Plotting aborted.")
+        raise SystemExit(1)
+    with metrics.stage('load_results') as record:
+        if args.results_db is not None:
+            results = results_store.load_results(args.results_db, start=args.start, end=args.end)
+            asset_revenue_df, imbalance_penalty_df, asset_invoices_df = (
+                results['asset_revenue'], results['imbalance_penalties'], results['asset_invoices'])
+        elif args.rollup_cube is not None:
+            results = rollup_cube.load_results(args.rollup_cube, start=args.start, end=args.end, level=args.level) or {}
+            asset_revenue_df, imbalance_penalty_df, asset_invoices_df = (
+                results.get('asset_revenue'), results.get('imbalance_penalties'), results.get('asset_invoices'))
+        else:
+            asset_revenue_df = load_csv_to_dataframe(latest_variant("asset_revenue.csv"), delimiter=",")
+            imbalance_penalty_df = load_csv_to_dataframe(latest_variant("imbalance_penalties.csv"), delimiter=",")
+            asset_invoices_df = load_csv_to_dataframe(latest_variant("asset_invoices.csv"), delimiter=",")
+        record['rows_out'] = count_rows([asset_revenue_df, imbalance_penalty_df, asset_invoices_df])
 
     # Plot revenue if data loaded successfully
     if asset_revenue_df is not None:
-        plot_asset_revenues(asset_revenue_df)
+        with metrics.stage('plot_asset_revenues', rows_in=asset_revenue_df):
+            plot_asset_revenues(asset_revenue_df, meter_to_asset, dpi=args.dpi, max_points=args.max_points or None)
     else:
         print("Failed to load asset_revenue.csv. Revenue plotting aborted.")
 
     # Plot imbalance penalties if data loaded successfully
     if imbalance_penalty_df is not None:
-        plot_imbalance_penalties(imbalance_penalty_df)
+        with metrics.stage('plot_imbalance_penalties', rows_in=imbalance_penalty_df):
+            plot_imbalance_penalties(imbalance_penalty_df, meter_to_asset, dpi=args.dpi, max_points=args.max_points or None)
     else:
         print("Failed to load imbalance_penalties.csv. Imbalance penalty plotting aborted.")
 
     # Plot revenue breakdown if data loaded successfully
     if asset_invoices_df is not None:
-        plot_revenue_breakdown(asset_invoices_df)
+        with metrics.stage('plot_revenue_breakdown', rows_in=asset_invoices_df):
+            plot_revenue_breakdown(asset_invoices_df, dpi=args.dpi)
     else:
-        print("Failed to load asset_invoices.csv. Revenue breakdown plotting aborted.")
\ No newline at end of file
+        print("Failed to load asset_invoices.csv. Revenue breakdown plotting aborted.")
+
+    if args.metrics_file is not None:
+        metrics.print_summary()
+        metrics.write(args.metrics_file)
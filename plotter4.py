@@ -1,12 +1,22 @@
+import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import os
+from columnar_storage import is_columnar, latest_variant, read_table
+from instrumentation import RunMetrics, count_rows
+import results_store
+import rollup_cube
+from downsampling import DEFAULT_MAX_POINTS, MARKER_MAX_POINTS, downsample, time_axis_locator
 
 # Function to load CSV file into a DataFrame
-def load_csv_to_dataframe(file_path, delimiter=","):
+# Arrow/Parquet results are read through the columnar backend; columns restricts the load to a subset.
+def load_csv_to_dataframe(file_path, delimiter=",", columns=None):
     try:
-        df = pd.read_csv(file_path, delimiter=delimiter)
+        if is_columnar(file_path):
+            df = read_table(file_path, columns=columns)
+        else:
+            df = pd.read_csv(file_path, delimiter=delimiter, usecols=columns)
         print(f"Loaded {file_path} successfully.")
         return df
     except FileNotFoundError:
@@ -16,18 +26,25 @@ def load_csv_to_dataframe(file_path, delimiter=","):
         print(f"Error loading {file_path}: {e}")
         return None
 
+# Function to read the asset_id -> metering_point_id mapping from the asset base data
+def load_asset_to_meter(file_path="assets_base_data.csv"):
+    assets_df = load_csv_to_dataframe(file_path, delimiter=";")
+    if assets_df is None:
+        return None
+    return dict(zip(assets_df['asset_id'], assets_df['metering_point_id']))
+
 # Function to create and save the revenue line plot for a specific asset
-def plot_asset_revenues(asset_revenue_df, selected_asset):
+def plot_asset_revenues(asset_revenue_df, selected_asset, metering_point_id, dpi=300, output_folder="Output", max_points=DEFAULT_MAX_POINTS):
     asset_revenue_df['delivery_start'] = pd.to_datetime(asset_revenue_df['delivery_start'])
     plt.figure(figsize=(12, 6))
     
     # Map asset to its revenue column
-    asset_map = {'a_1': 'mp_1_revenue', 'a_2': 'mp_2_revenue', 'a_3': 'mp_3_revenue', 'a_4': 'mp_4_revenue'}
-    revenue_col = asset_map[selected_asset]
+    revenue_col = f"{metering_point_id}_revenue"
     
-    # Plot only the selected asset's revenue
-    plt.plot(asset_revenue_df['delivery_start'], asset_revenue_df[revenue_col], 
-             label=f'Asset {selected_asset}', marker='o')
+    # Plot only the selected asset's revenue, decimated with LTTB for long ranges
+    times, values = downsample(asset_revenue_df['delivery_start'], asset_revenue_df[revenue_col], max_points, method="lttb")
+    plt.plot(times, values, 
+             label=f'Asset {selected_asset}', marker='o' if len(values) <= MARKER_MAX_POINTS else None)
     
     plt.title(f'Revenue for Asset {selected_asset} Over Time', fontsize=14, fontweight='bold')
     plt.xlabel('Time (HH:MM)', fontsize=12)
@@ -36,32 +53,31 @@ def plot_asset_revenues(asset_revenue_df, selected_asset):
     plt.grid(True, linestyle='--', alpha=0.7)
     ax = plt.gca()
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%d-%b %H:%M'))
-    ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    ax.xaxis.set_major_locator(time_axis_locator(asset_revenue_df['delivery_start']))
     plt.xticks(rotation=45)
     plt.tight_layout()
     
-    output_folder = "Output"
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
         print(f"Created folder: {output_folder}")
     
     output_file = os.path.join(output_folder, f"asset_revenue_plot_{selected_asset}.png")
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
     print(f"Revenue plot for {selected_asset} saved to {output_file}")
     plt.close()
 
 # Function to create and save the imbalance penalty line plot for a specific asset
-def plot_imbalance_penalties(imbalance_penalty_df, selected_asset):
+def plot_imbalance_penalties(imbalance_penalty_df, selected_asset, dpi=300, output_folder="Output", max_points=DEFAULT_MAX_POINTS):
     imbalance_penalty_df['delivery_start'] = pd.to_datetime(imbalance_penalty_df['delivery_start'])
     plt.figure(figsize=(12, 6))
     
     # Map asset to its penalty column
-    asset_map = {'a_1': 'a_1_penalty', 'a_2': 'a_2_penalty', 'a_3': 'a_3_penalty', 'a_4': 'a_4_penalty'}
-    penalty_col = asset_map[selected_asset]
+    penalty_col = f"{selected_asset}_penalty"
     
-    # Plot only the selected asset's penalty
-    plt.plot(imbalance_penalty_df['delivery_start'], imbalance_penalty_df[penalty_col], 
-             label=f'Asset {selected_asset}', marker='o')
+    # Plot only the selected asset's penalty, decimated to a min/max envelope so spikes are kept
+    times, values = downsample(imbalance_penalty_df['delivery_start'], imbalance_penalty_df[penalty_col], max_points, method="minmax")
+    plt.plot(times, values, 
+             label=f'Asset {selected_asset}', marker='o' if len(values) <= MARKER_MAX_POINTS else None)
     
     plt.title(f'Imbalance Penalty for Asset {selected_asset} Over Time', fontsize=14, fontweight='bold')
     plt.xlabel('Time (HH:MM)', fontsize=12)
@@ -70,22 +86,21 @@ def plot_imbalance_penalties(imbalance_penalty_df, selected_asset):
     plt.grid(True, linestyle='--', alpha=0.7)
     ax = plt.gca()
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%d-%b %H:%M'))
-    ax.xaxis.set_major_locator(mdates.HourLocator(interval=2))
+    ax.xaxis.set_major_locator(time_axis_locator(imbalance_penalty_df['delivery_start']))
     plt.xticks(rotation=45)
     plt.tight_layout()
     
-    output_folder = "Output"
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
         print(f"Created folder: {output_folder}")
     
     output_file = os.path.join(output_folder, f"imbalance_penalty_plot_{selected_asset}.png")
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
     print(f"Imbalance penalty plot for {selected_asset} saved to {output_file}")
     plt.close()
 
 # Function to create and save the revenue breakdown bar and point plot for a specific asset
-def plot_revenue_breakdown(asset_invoices_df, selected_asset):
+def plot_revenue_breakdown(asset_invoices_df, selected_asset, dpi=300, output_folder="Output"):
     # Filter DataFrame for the selected asset
     asset_data = asset_invoices_df[asset_invoices_df['asset_id'] == selected_asset]
     if asset_data.empty:
@@ -130,53 +145,97 @@ def plot_revenue_breakdown(asset_invoices_df, selected_asset):
     
     plt.tight_layout()
     
-    output_folder = "Output"
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
         print(f"Created folder: {output_folder}")
     
     output_file = os.path.join(output_folder, f"revenue_breakdown_plot_{selected_asset}.png")
-    plt.savefig(output_file, dpi=300, bbox_inches='tight')
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight')
     print(f"Revenue breakdown plot for {selected_asset} saved to {output_file}")
     plt.close()
 
 # Function to get user input for asset selection
-def get_user_asset_choice():
-    valid_assets = ['a_1', 'a_2', 'a_3', 'a_4']
+def get_user_asset_choice(valid_assets):
     print("What asset do you want to see the results for?")
-    print("Options: a_1, a_2, a_3, a_4")
+    print(f"Options: {', '.join(valid_assets)}")
     
     while True:
-        choice = input("Enter your choice (e.g., a_1): ").strip().lower()
+        choice = input(f"Enter your choice (e.g., {valid_assets[0]}): ").strip().lower()
         if choice in valid_assets:
             return choice
         else:
-            print("Invalid choice. Please enter one of: a_1, a_2, a_3, a_4")
+            print(f"Invalid choice. Please enter one of: {', '.join(valid_assets)}")
 
 # Main execution
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot the results of one asset (use batch_plotter.py for many).")
+    parser.add_argument("--asset", default=None, help="asset to plot, e.g. a_1 (asked interactively if omitted)")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--max-points", type=int, default=DEFAULT_MAX_POINTS, help="points drawn per line (0: all)")
+    parser.add_argument("--metrics-file", default=None, help="write per-stage timings and memory as JSON")
+    parser.add_argument("--profile-stages", nargs="+", default=None, help="run these stages (or 'all') under cProfile")
+    parser.add_argument("--results-db", default=None, help="read the results from this SQLite database instead of the CSVs")
+    parser.add_argument("--rollup-cube", default=None, help="read the results from this rollup cube instead of the CSVs")
+    parser.add_argument("--level", choices=rollup_cube.LEVELS, default=None, help="plot daily or monthly totals (with --rollup-cube)")
+    parser.add_argument("--start", default=None, help="first delivery_start to plot (with --results-db or --rollup-cube)")
+    parser.add_argument("--end", default=None, help="end of the plotted range, exclusive (with --results-db or --rollup-cube)")
+    args = parser.parse_args()
+    if (args.start or args.end) and args.results_db is None and args.rollup_cube is None:
+        parser.error("--start/--end need --results-db or --rollup-cube (the result files are always plotted whole)")
+    metrics = RunMetrics("plotter4", profile_stages=args.profile_stages)
+
     # Get user input for asset selection
-    selected_asset = get_user_asset_choice()
+    asset_to_meter = load_asset_to_meter() if args.results_db is None else results_store.load_asset_to_meter(args.results_db)
+    if asset_to_meter is None:
+        print(f"Failed to load {args.results_db or 'assets_base_data.csv'}. Plotting aborted.")
+        raise SystemExit(1)
+    if args.asset in asset_to_meter:
+        selected_asset = args.asset
+    else:
+        if args.asset is not None:
+            print(f"Unknown asset {args.asset}.")
+        selected_asset = get_user_asset_choice(list(asset_to_meter))
 
-    # Load the data
-    asset_revenue_df = load_csv_to_dataframe("asset_revenue.csv", delimiter=",")
-    imbalance_penalty_df = load_csv_to_dataframe("imbalance_penalties.csv", delimiter=",")
-    asset_invoices_df = load_csv_to_dataframe("asset_invoices.csv", delimiter=",")
+    # Load the data (only the selected asset's columns, or its rows in the time range from the database)
+    with metrics.stage('load_results') as record:
+        if args.results_db is not None:
+            results = results_store.load_results(args.results_db, [selected_asset], args.start, args.end)
+            asset_revenue_df, imbalance_penalty_df, asset_invoices_df = (
+                results['asset_revenue'], results['imbalance_penalties'], results['asset_invoices'])
+        elif args.rollup_cube is not None:
+            results = rollup_cube.load_results(args.rollup_cube, asset_ids=[selected_asset], start=args.start, end=args.end,
+                                               level=args.level) or {}
+            asset_revenue_df, imbalance_penalty_df, asset_invoices_df = (
+                results.get('asset_revenue'), results.get('imbalance_penalties'), results.get('asset_invoices'))
+        else:
+            asset_revenue_df = load_csv_to_dataframe(latest_variant("asset_revenue.csv"), delimiter=",",
+                                                     columns=['delivery_start', f"{asset_to_meter[selected_asset]}_revenue"])
+            imbalance_penalty_df = load_csv_to_dataframe(latest_variant("imbalance_penalties.csv"), delimiter=",",
+                                                         columns=['delivery_start', f"{selected_asset}_penalty"])
+            asset_invoices_df = load_csv_to_dataframe(latest_variant("asset_invoices.csv"), delimiter=",")
+        record['rows_out'] = count_rows([asset_revenue_df, imbalance_penalty_df, asset_invoices_df])
 
     # Plot revenue if data loaded successfully
     if asset_revenue_df is not None:
-        plot_asset_revenues(asset_revenue_df, selected_asset)
+        with metrics.stage('plot_asset_revenues', rows_in=asset_revenue_df):
+            plot_asset_revenues(asset_revenue_df, selected_asset, asset_to_meter[selected_asset], dpi=args.dpi, max_points=args.max_points or None)
     else:
         print(f"Failed to load asset_revenue.csv. Revenue plotting for {selected_asset} aborted.")
 
     # Plot imbalance penalties if data loaded successfully
     if imbalance_penalty_df is not None:
-        plot_imbalance_penalties(imbalance_penalty_df, selected_asset)
+        with metrics.stage('plot_imbalance_penalties', rows_in=imbalance_penalty_df):
+            plot_imbalance_penalties(imbalance_penalty_df, selected_asset, dpi=args.dpi, max_points=args.max_points or None)
     else:
         print(f"Failed to load imbalance_penalties.csv. Imbalance penalty plotting for {selected_asset} aborted.")
 
     # Plot revenue breakdown if data loaded successfully
     if asset_invoices_df is not None:
-        plot_revenue_breakdown(asset_invoices_df, selected_asset)
+        with metrics.stage('plot_revenue_breakdown', rows_in=asset_invoices_df):
+            plot_revenue_breakdown(asset_invoices_df, selected_asset, dpi=args.dpi)
     else:
-        print(f"Failed to load asset_invoices.csv. Revenue breakdown plotting for {selected_asset} aborted.")
\ No newline at end of file
+        print(f"Failed to load asset_invoices.csv. Revenue breakdown plotting for {selected_asset} aborted.")
+
+    if args.metrics_file is not None:
+        metrics.print_summary()
+        metrics.write(args.metrics_file)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from trade_book import signed_quantities
+
+# How a column behaves when its intervals are split or merged:
+#   'energy' - volume per interval (MWh): split evenly when upsampling, summed when downsampling
+#   'power'  - average rate (MW): held when upsampling, averaged when downsampling
+#   'price'  - EUR/MWh: held when upsampling, averaged when downsampling
+SPLIT_KINDS = {'energy'}
+
+# Function to infer the interval length of a delivery_start series (smallest gap between intervals)
+def infer_resolution(delivery_start):
+    times = pd.DatetimeIndex(delivery_start).unique().sort_values()
+    if len(times) < 2:
+        return None
+    return pd.Timedelta(np.diff(times.asi8).min(), unit=times.unit)
+
+# Function to resample the given columns of a frame to the target interval length
+# columns maps column name to its kind ('energy', 'power' or 'price'); other columns are dropped,
+# except that upsampling repeats them unchanged. interval_lengths optionally gives every row its own
+# length (e.g. delivery_end - delivery_start of a trade) instead of the inferred resolution.
+def resample_to_resolution(df, columns, target, interval_lengths=None):
+    target = pd.Timedelta(target)
+    if df.empty:
+        return df
+    if interval_lengths is None:
+        source = infer_resolution(df['delivery_start'])
+        if source is None or source == target:
+            return df
+        interval_lengths = pd.Series(source, index=df.index)
+    lengths = pd.to_timedelta(interval_lengths).to_numpy()
+
+    # Upsample rows longer than the target: repeat each row k times and split energy by k
+    step = target.to_timedelta64()
+    longer, shorter = lengths > step, lengths < step
+    starts = pd.DatetimeIndex(df['delivery_start'])
+    last_instants = starts + pd.to_timedelta(lengths) - pd.Timedelta(1, unit='ns')
+    if (lengths[longer] % step != np.timedelta64(0)).any():
+        raise ValueError(f"Interval lengths are not a multiple of {target}")
+    if (starts[shorter].floor(target) != last_instants[shorter].floor(target)).any():
+        raise ValueError(f"Intervals cross a {target} boundary and cannot be aggregated")
+    factors = np.where(longer, lengths // step, 1).astype(np.int64)
+    if longer.any():
+        row_index = np.repeat(np.arange(len(df)), factors)
+        offsets = np.arange(len(row_index)) - np.repeat(np.cumsum(factors) - factors, factors)
+        df = df.iloc[row_index].reset_index(drop=True)
+        df['delivery_start'] = df['delivery_start'] + pd.to_timedelta(offsets * step)
+        if 'delivery_end' in df.columns:
+            df['delivery_end'] = df['delivery_start'] + target
+        repeated = np.repeat(factors, factors)
+        for column, kind in columns.items():
+            if kind in SPLIT_KINDS:
+                df[column] = df[column].to_numpy(dtype=float) / repeated
+
+    # Downsample rows shorter than the target: sum energy and average prices per target interval
+    if shorter.any():
+        bucket = df['delivery_start'].dt.floor(target)
+        aggregations = {column: 'sum' if kind in SPLIT_KINDS else 'mean' for column, kind in columns.items()}
+        df = df.groupby(bucket, sort=True).agg(aggregations).reset_index()
+    return df
+
+# Function to bring every pipeline input to one interval length before settlement
+# Measured production, forecasts and (signed) trade quantities are treated as energy per interval,
+# market and penalty prices are held or averaged. Trades use their own delivery_end when present.
+def align_inputs(inputs, target):
+    aligned = dict(inputs)
+    meter_columns = [column for column in inputs['measured'].columns if column != 'delivery_start']
+    aligned['measured'] = resample_to_resolution(inputs['measured'], {column: 'energy' for column in meter_columns}, target)
+
+    # Buys are netted by sign here because aggregating drops the side column
+    trades_df = inputs['trades']
+    if 'side' in trades_df.columns:
+        trades_df = trades_df.assign(quantity=signed_quantities(trades_df)).drop(columns='side')
+    trade_lengths = None
+    if 'delivery_end' in trades_df.columns:
+        trade_lengths = pd.to_datetime(trades_df['delivery_end']) - pd.to_datetime(trades_df['delivery_start'])
+    aligned['trades'] = resample_to_resolution(trades_df, {'quantity': 'energy'}, target, trade_lengths)
+
+    aligned['market_index'] = resample_to_resolution(inputs['market_index'], {'market_index_price': 'price'}, target)
+    aligned['imbalance_penalty'] = resample_to_resolution(inputs['imbalance_penalty'], {'imbalance_penalty': 'price'}, target)
+    aligned['forecasts'] = {asset_id: resample_to_resolution(df, {'forecast': 'energy'}, target)
+                            for asset_id, df in inputs['forecasts'].items()}
+    return aligned
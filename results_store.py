@@ -0,0 +1,289 @@
+import argparse
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from settlement_core import AssetRegistry, SettlementCore, invoice_amounts, invoice_fees
+
+DEFAULT_DATABASE = "results.sqlite"
+
+# Interval results are keyed by (asset_id, delivery_start) so reading one asset over a time range is a
+# range scan of the primary key; re-settling an interval replaces its row and records the new run.
+# delivery_start is stored as UTC text in the format of the result CSVs, which sorts chronologically.
+# The fee parts of every settled interval (see settlement_core.interval_fee_parts) and the market
+# prices are kept the same way, so invoices over any range are built from the latest interval rows.
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        run_date TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        period_start TEXT,
+        period_end TEXT)""",
+    "CREATE INDEX IF NOT EXISTS runs_run_date ON runs (run_date)",
+    """CREATE TABLE IF NOT EXISTS assets (
+        asset_id TEXT PRIMARY KEY,
+        metering_point_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        capacity_kw REAL)""",
+    """CREATE TABLE IF NOT EXISTS asset_revenue (
+        asset_id TEXT NOT NULL,
+        delivery_start TEXT NOT NULL,
+        run_id INTEGER NOT NULL,
+        revenue REAL,
+        PRIMARY KEY (asset_id, delivery_start)) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS asset_revenue_run ON asset_revenue (run_id)",
+    """CREATE TABLE IF NOT EXISTS imbalance_penalties (
+        asset_id TEXT NOT NULL,
+        delivery_start TEXT NOT NULL,
+        run_id INTEGER NOT NULL,
+        penalty REAL,
+        PRIMARY KEY (asset_id, delivery_start)) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS imbalance_penalties_run ON imbalance_penalties (run_id)",
+    """CREATE TABLE IF NOT EXISTS interval_fees (
+        asset_id TEXT NOT NULL,
+        delivery_start TEXT NOT NULL,
+        run_id INTEGER NOT NULL,
+        fee_part REAL,
+        fee_weight REAL,
+        PRIMARY KEY (asset_id, delivery_start)) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS market_prices (
+        delivery_start TEXT PRIMARY KEY,
+        run_id INTEGER NOT NULL,
+        market_index_price REAL) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS asset_invoices (
+        run_id INTEGER NOT NULL,
+        asset_id TEXT NOT NULL,
+        net_revenue REAL,
+        unit_net_revenue REAL,
+        gross_revenue REAL,
+        PRIMARY KEY (run_id, asset_id)) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS asset_invoices_asset ON asset_invoices (asset_id, run_id)",
+]
+
+# Function to open the results database, creating the tables and indexes on first use
+def connect(database=DEFAULT_DATABASE):
+    connection = sqlite3.connect(database)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    for statement in SCHEMA:
+        connection.execute(statement)
+    if 'capacity_kw' not in [row[1] for row in connection.execute("PRAGMA table_info(assets)")]:
+        connection.execute("ALTER TABLE assets ADD COLUMN capacity_kw REAL")
+    return connection
+
+# Function to format timestamps as stored UTC text (naive timestamps are taken as UTC)
+def utc_text(times):
+    times = pd.DatetimeIndex(pd.to_datetime(times))
+    if times.tz is None:
+        times = times.tz_localize('UTC')
+    return times.tz_convert('UTC').strftime("%Y-%m-%d %H:%M:%S+00:00")
+
+# Function to turn a wide result frame (delivery_start + one column per asset) into insert rows
+def _long_rows(wide_df, columns, asset_ids, run_id):
+    times = utc_text(wide_df['delivery_start'])
+    values = wide_df[columns].to_numpy(dtype=float)
+    values = np.where(np.isnan(values), None, values).ravel().tolist()
+    return zip(np.tile(asset_ids, len(times)).tolist(), np.repeat(np.asarray(times), len(asset_ids)).tolist(),
+               [run_id] * len(values), values)
+
+# Function to turn the fee parts of every settled interval of a run into insert rows: the measured
+# intervals (the imbalance penalty rows) and the traded ones, charged with the allocated contributions
+def _fee_rows(outputs, registry, run_id):
+    settled = pd.DatetimeIndex(pd.to_datetime(outputs['trade_allocation']['delivery_start'])).union(
+        pd.DatetimeIndex(pd.to_datetime(outputs['imbalance_penalties']['delivery_start'])))
+    core = SettlementCore(registry, settled)
+    core.set_allocation(outputs['trade_allocation'])
+    fee_part, fee_weight = core.fee_parts()
+    asset_ids = list(registry.asset_ids)
+    return zip(np.tile(asset_ids, len(settled)).tolist(), np.repeat(np.asarray(utc_text(settled)), len(asset_ids)).tolist(),
+               [run_id] * fee_part.size, fee_part.T.ravel().tolist(), fee_weight.T.ravel().tolist())
+
+# Function to write the results of one pipeline run with bulk inserts in a single transaction
+# outputs holds the asset_revenue, imbalance_penalties and asset_invoices frames of energy_trading5;
+# with its trade_allocation frame the fee parts of every interval are stored too and market_index_df
+# adds the market prices, which read_invoices needs to invoice a range. Returns the run_id.
+def store_results(outputs, assets_df, database=DEFAULT_DATABASE, run_date=None, market_index_df=None):
+    now = datetime.now(timezone.utc)
+    run_date = run_date or now.strftime("%Y-%m-%d")
+    registry = AssetRegistry(assets_df)
+    asset_ids = list(registry.asset_ids)
+    meter_ids = list(registry.metering_point_ids)
+    revenue_df, penalty_df = outputs['asset_revenue'], outputs['imbalance_penalties']
+    times = pd.concat([pd.Series(utc_text(revenue_df['delivery_start'])), pd.Series(utc_text(penalty_df['delivery_start']))])
+    connection = connect(database)
+    try:
+        with connection:
+            run_id = connection.execute(
+                "INSERT INTO runs (run_date, created_at, period_start, period_end) VALUES (?, ?, ?, ?)",
+                (run_date, now.isoformat(timespec='seconds'), times.min() if len(times) else None,
+                 times.max() if len(times) else None)).lastrowid
+            connection.executemany("INSERT OR REPLACE INTO assets (asset_id, metering_point_id, position, capacity_kw) VALUES (?, ?, ?, ?)",
+                                   zip(asset_ids, meter_ids, range(len(asset_ids)), registry.capacity_kw.astype(float).tolist()))
+            connection.executemany("INSERT OR REPLACE INTO asset_revenue (asset_id, delivery_start, run_id, revenue) VALUES (?, ?, ?, ?)",
+                                   _long_rows(revenue_df, [f"{mp}_revenue" for mp in meter_ids], asset_ids, run_id))
+            connection.executemany("INSERT OR REPLACE INTO imbalance_penalties (asset_id, delivery_start, run_id, penalty) VALUES (?, ?, ?, ?)",
+                                   _long_rows(penalty_df, [f"{asset_id}_penalty" for asset_id in asset_ids], asset_ids, run_id))
+            if 'trade_allocation' in outputs:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO interval_fees (asset_id, delivery_start, run_id, fee_part, fee_weight) VALUES (?, ?, ?, ?, ?)",
+                    _fee_rows(outputs, registry, run_id))
+            if market_index_df is not None:
+                connection.executemany("INSERT OR REPLACE INTO market_prices (delivery_start, run_id, market_index_price) VALUES (?, ?, ?)",
+                                       zip(utc_text(market_index_df['delivery_start']).tolist(), [run_id] * len(market_index_df),
+                                           market_index_df['market_index_price'].astype(float).tolist()))
+            invoices_df = outputs['asset_invoices']
+            connection.executemany(
+                "INSERT OR REPLACE INTO asset_invoices (run_id, asset_id, net_revenue, unit_net_revenue, gross_revenue) VALUES (?, ?, ?, ?, ?)",
+                zip([run_id] * len(invoices_df), invoices_df['asset_id'].tolist(), invoices_df['net_revenue'].tolist(),
+                    invoices_df['unit_net_revenue'].tolist(), invoices_df['gross_revenue'].tolist()))
+    finally:
+        connection.close()
+    print(f"Results of run {run_id} stored in {database}")
+    return run_id
+
+# Function to read the stored assets as an asset_id -> metering_point_id mapping in file order
+def load_asset_to_meter(database=DEFAULT_DATABASE):
+    if not os.path.exists(database):
+        print(f"Error: {database} not found.")
+        return None
+    connection = connect(database)
+    try:
+        rows = connection.execute("SELECT asset_id, metering_point_id FROM assets ORDER BY position").fetchall()
+    finally:
+        connection.close()
+    return dict(rows)
+
+# Function to build the WHERE conditions and parameters selecting the given assets (all if None) and
+# the delivery_start range [start, end)
+def _interval_conditions(asset_ids=None, start=None, end=None):
+    conditions, params = [], []
+    if asset_ids is not None:
+        conditions.append(f"asset_id IN ({', '.join('?' * len(asset_ids))})")
+        params += list(asset_ids)
+    if start is not None:
+        conditions.append("delivery_start >= ?")
+        params.append(utc_text([start])[0])
+    if end is not None:
+        conditions.append("delivery_start < ?")
+        params.append(utc_text([end])[0])
+    return " AND ".join(conditions) or "1", params
+
+# Function to fetch the interval values of the given assets in [start, end) and lay them out like the
+# result CSVs (delivery_start plus one column per asset, named by column_name(asset_id, metering_point_id))
+def _read_intervals(database, table, value_column, column_name, asset_ids=None, start=None, end=None):
+    asset_to_meter = load_asset_to_meter(database)
+    asset_ids = list(asset_to_meter) if asset_ids is None else [asset_id for asset_id in asset_ids if asset_id in asset_to_meter]
+    where, params = _interval_conditions(asset_ids, start, end)
+    connection = connect(database)
+    try:
+        long_df = pd.read_sql_query(f"SELECT asset_id, delivery_start, {value_column} FROM {table} "
+                                    f"WHERE {where}", connection, params=params)
+    finally:
+        connection.close()
+    wide_df = long_df.pivot(index='delivery_start', columns='asset_id', values=value_column).reindex(columns=asset_ids)
+    wide_df.columns = [column_name(asset_id, asset_to_meter[asset_id]) for asset_id in asset_ids]
+    wide_df = wide_df.sort_index().reset_index()
+    wide_df['delivery_start'] = pd.to_datetime(wide_df['delivery_start'])
+    return wide_df
+
+# Function to read revenues in the layout of asset_revenue.csv, only for the given assets and time range
+def read_revenue(database=DEFAULT_DATABASE, asset_ids=None, start=None, end=None):
+    return _read_intervals(database, 'asset_revenue', 'revenue', lambda asset_id, mp: f"{mp}_revenue", asset_ids, start, end)
+
+# Function to read imbalance penalties in the layout of imbalance_penalties.csv, only for the given
+# assets and time range (total_penalty sums the assets read)
+def read_penalties(database=DEFAULT_DATABASE, asset_ids=None, start=None, end=None):
+    penalty_df = _read_intervals(database, 'imbalance_penalties', 'penalty', lambda asset_id, mp: f"{asset_id}_penalty",
+                                 asset_ids, start, end)
+    penalty_df['total_penalty'] = penalty_df.drop(columns='delivery_start').sum(axis=1)
+    return penalty_df
+
+# Function to read invoices in the layout of asset_invoices.csv
+# Without a range the invoices stored with the latest run (of run_date, if given) are returned. With
+# start/end they are built from the interval rows in [start, end): revenue, fee parts and market prices
+# are kept per interval and replaced when the interval is re-settled, so every interval counts once,
+# from the latest run that settled it, also where a partial re-settlement overlaps an older and longer
+# run. The market-linked fees are priced at the average market price of the range. The runs used are
+# printed.
+def read_invoices(database=DEFAULT_DATABASE, asset_ids=None, run_date=None, start=None, end=None):
+    if start is None and end is None:
+        return _read_run_invoices(database, asset_ids, run_date)
+    where, params = _interval_conditions(None, start, end)
+    connection = connect(database)
+    try:
+        assets_df = pd.read_sql_query("SELECT asset_id, capacity_kw FROM assets ORDER BY position", connection)
+        revenue = pd.read_sql_query(f"SELECT asset_id, SUM(revenue) AS revenue FROM asset_revenue WHERE {where} GROUP BY asset_id",
+                                    connection, params=params).set_index('asset_id')['revenue']
+        fees_df = pd.read_sql_query(f"SELECT asset_id, SUM(fee_part) AS fee_part, SUM(fee_weight) AS fee_weight FROM interval_fees "
+                                    f"WHERE {where} GROUP BY asset_id", connection, params=params).set_index('asset_id')
+        avg_market_price = connection.execute(f"SELECT AVG(market_index_price) FROM market_prices WHERE {where}", params).fetchone()[0]
+        run_ids = [row[0] for row in connection.execute(
+            f"SELECT run_id FROM asset_revenue WHERE {where} UNION SELECT run_id FROM interval_fees WHERE {where} ORDER BY run_id",
+            params + params).fetchall()]
+    finally:
+        connection.close()
+    columns = ['asset_id', 'net_revenue', 'unit_net_revenue', 'gross_revenue']
+    if not run_ids:
+        print("No stored run covers the requested range; invoices are empty.")
+        return pd.DataFrame(columns=columns)
+    print(f"Invoices of {start or 'the first interval'} to {end or 'the last interval'} from the interval rows of "
+          f"run(s) {', '.join(map(str, run_ids))}")
+    asset_order = list(assets_df['asset_id'])
+    fees_df = fees_df.reindex(asset_order, fill_value=0.0)
+    fees = invoice_fees(fees_df['fee_part'].to_numpy(), fees_df['fee_weight'].to_numpy(),
+                        np.nan if avg_market_price is None else avg_market_price)[0]
+    net_revenue, unit_net_revenue, gross_revenue = invoice_amounts(revenue.reindex(asset_order, fill_value=0.0).to_numpy(dtype=float),
+                                                                   fees, assets_df['capacity_kw'].to_numpy(dtype=float))
+    invoices_df = pd.DataFrame(dict(zip(columns, [asset_order, net_revenue, unit_net_revenue, gross_revenue])))
+    if asset_ids is not None:
+        invoices_df = invoices_df[invoices_df['asset_id'].isin(asset_ids)].reset_index(drop=True)
+    return invoices_df
+
+# Function to read the invoices stored with the latest run (of run_date, if given)
+def _read_run_invoices(database, asset_ids=None, run_date=None):
+    connection = connect(database)
+    try:
+        run = connection.execute("SELECT run_id, period_start, period_end FROM runs" + (" WHERE run_date = ?" if run_date else "")
+                                 + " ORDER BY run_id DESC LIMIT 1", (run_date,) if run_date else ()).fetchone()
+        invoices_df = pd.read_sql_query("SELECT asset_id, net_revenue, unit_net_revenue, gross_revenue FROM asset_invoices "
+                                        "WHERE run_id = ?", connection, params=[run[0] if run else None])
+    finally:
+        connection.close()
+    if run:
+        print(f"Invoices of run {run[0]} covering {run[1]} to {run[2]}")
+    else:
+        print("No stored run found; invoices are empty.")
+    if asset_ids is not None:
+        invoices_df = invoices_df[invoices_df['asset_id'].isin(asset_ids)].reset_index(drop=True)
+    return invoices_df
+
+# Function to load the results the plotters need from the database (a subset of assets and time range)
+def load_results(database=DEFAULT_DATABASE, asset_ids=None, start=None, end=None):
+    if not os.path.exists(database):
+        print(f"Error: {database} not found.")
+        return None
+    results = {
+        'asset_revenue': read_revenue(database, asset_ids, start, end),
+        'imbalance_penalties': read_penalties(database, asset_ids, start, end),
+        'asset_invoices': read_invoices(database, asset_ids, start=start, end=end),
+    }
+    print(f"Loaded results from {database} successfully.")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the results database written by energy_trading5.py --results-db.")
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument("--assets", nargs="+", default=None, help="assets to read (default: all)")
+    parser.add_argument("--start", default=None, help="first delivery_start (UTC), e.g. 2024-10-13")
+    parser.add_argument("--end", default=None, help="end of the range (exclusive)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    results = load_results(args.database, args.assets, args.start, args.end)
+    elapsed = time.perf_counter() - started
+    for name, df in (results or {}).items():
+        print(f"{name}: {len(df)} rows")
+        print(df.head().to_string(index=False))
+    print(f"Query took {elapsed * 1000:.1f} ms")
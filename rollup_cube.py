@@ -0,0 +1,303 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from settlement_core import (AssetRegistry, billing_periods, interval_days, interval_fee_parts, invoice_amounts, invoice_fees,
+                             utc_nanoseconds)
+
+DEFAULT_CUBE = "rollup_cube.npz"
+
+# Per-asset measures held in the cube (market_price is a single series shared by all assets)
+ASSET_MEASURES = ['contribution', 'revenue', 'penalty']
+
+# Per-asset fee parts held in the cube: fee = fee_part + fee_weight * average market price
+# (see settlement_core.interval_fee_parts)
+FEE_MEASURES = ['fee_part', 'fee_weight']
+
+# Materialized aggregation levels (billing periods of the local delivery date, see settlement_core)
+LEVELS = ['day', 'month']
+
+# Function to turn one timestamp into UTC nanoseconds (naive timestamps are taken as UTC)
+def _nanoseconds(timestamp):
+    timestamp = pd.Timestamp(timestamp)
+    return (timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp).as_unit('ns').value
+
+# Prefix-sum rollup of the settlement results along the time axis
+# For every measure the cube stores cumulative sums with a leading zero, cumulative[:, k] being the
+# sum over the first k intervals, so the total over any range of intervals is the difference of two
+# columns and the average market price over a range is a difference of sums divided by a difference
+# of counts. Missing values count as zero (the market price keeps a count of the priced intervals).
+# Every day and month of the local delivery date is materialized as its first interval position plus
+# its totals. New intervals are appended after the last one without touching the existing sums.
+class RollupCube:
+    def __init__(self, asset_ids, metering_point_ids):
+        self.asset_ids = np.asarray(asset_ids, dtype=object)
+        self.metering_point_ids = np.asarray(metering_point_ids, dtype=object)
+        self.times = np.empty(0, dtype=np.int64)
+        self.cumulative = {measure: np.zeros((len(self.asset_ids), 1)) for measure in ASSET_MEASURES + FEE_MEASURES}
+        self.cumulative['market_price'] = np.zeros(1)
+        self.cumulative['price_count'] = np.zeros(1)
+        self.levels = {level: {'labels': np.empty(0, dtype=object), 'starts': np.empty(0, dtype=np.int64)} for level in LEVELS}
+        self.level_totals = {level: {} for level in LEVELS}
+
+    def __len__(self):
+        return len(self.times)
+
+    # Build a cube from the result frames of energy_trading5 (trade_allocation, asset_revenue and
+    # imbalance_penalties) and the market index
+    @classmethod
+    def from_outputs(cls, outputs, assets_df, market_index_df):
+        registry = AssetRegistry(assets_df)
+        cube = cls(registry.asset_ids, registry.metering_point_ids)
+        cube.append_outputs(outputs, assets_df, market_index_df, registry)
+        return cube
+
+    # Function to line up the result frames on one sorted time axis as (assets, intervals) arrays
+    # The fee parts of every settled interval are computed from the trade allocation.
+    def _arrays_from_outputs(self, outputs, market_index_df, registry):
+        frames = {
+            'contribution': (outputs['trade_allocation'], [f"{mp}_contribution" for mp in self.metering_point_ids]),
+            'revenue': (outputs['asset_revenue'], [f"{mp}_revenue" for mp in self.metering_point_ids]),
+            'penalty': (outputs['imbalance_penalties'], [f"{asset_id}_penalty" for asset_id in self.asset_ids]),
+            'market_price': (market_index_df, ['market_index_price']),
+        }
+        times = np.unique(np.concatenate([utc_nanoseconds(df['delivery_start']) for df, _ in frames.values()]))
+        arrays = {}
+        for measure, (df, columns) in frames.items():
+            values = pd.DataFrame(df[columns].to_numpy(dtype=float), index=utc_nanoseconds(df['delivery_start'])).groupby(level=0)
+            arrays[measure] = values.sum(min_count=1).reindex(times).to_numpy().T
+            if measure == 'market_price':
+                arrays['price_count'] = values.count().reindex(times, fill_value=0).to_numpy()[:, 0]
+        arrays['market_price'] = arrays['market_price'][0]
+        # Fees accrue over the settled period: the measured intervals (the imbalance penalty rows) and the
+        # traded ones, whether or not anything traded there
+        settled = np.isin(times, np.concatenate([utc_nanoseconds(outputs[name]['delivery_start'])
+                                                 for name in ['trade_allocation', 'imbalance_penalties']]))
+        fee_parts = interval_fee_parts(registry, np.nan_to_num(arrays['contribution'], nan=0.0), pd.DatetimeIndex(times, tz='UTC'),
+                                       interval_days(pd.DatetimeIndex(times[settled], tz='UTC')))
+        arrays['fee_part'], arrays['fee_weight'] = (np.where(settled, part, 0.0) for part in fee_parts)
+        return times, arrays
+
+    # Function to append the results of a new run (its intervals must all follow the cube's last one)
+    def append_outputs(self, outputs, assets_df, market_index_df, registry=None):
+        registry = registry if registry is not None else AssetRegistry(assets_df)
+        times, arrays = self._arrays_from_outputs(outputs, market_index_df, registry)
+        self.append(times, arrays['contribution'], arrays['revenue'], arrays['penalty'], arrays['market_price'],
+                    arrays['price_count'], arrays['fee_part'], arrays['fee_weight'])
+
+    # Function to append intervals: delivery_start (UTC nanoseconds or timestamps) and the (assets, n)
+    # contribution, revenue and penalty arrays plus the (n,) market price (price_count says how many
+    # prices were summed into each interval; by default one where it is not NaN) and the (assets, n)
+    # fee parts (none by default). The cumulative sums are extended from their last column and only the
+    # last day/month and the new ones are re-aggregated.
+    def append(self, delivery_start, contribution, revenue, penalty, market_price, price_count=None, fee_part=None,
+               fee_weight=None):
+        times = np.asarray(delivery_start, dtype=np.int64) if np.asarray(delivery_start).dtype == np.int64 \
+            else utc_nanoseconds(delivery_start)
+        if len(times) == 0:
+            return
+        if (np.diff(times) <= 0).any():
+            raise ValueError("Intervals appended to the rollup cube must be sorted and unique")
+        if len(self.times) and times[0] <= self.times[-1]:
+            raise ValueError(f"Intervals from {pd.Timestamp(times[0], tz='UTC')} are already in the rollup cube; "
+                             f"only intervals after {pd.Timestamp(self.times[-1], tz='UTC')} can be appended")
+        no_fees = np.zeros((len(self.asset_ids), len(times)))
+        for measure, values in [('contribution', contribution), ('revenue', revenue), ('penalty', penalty),
+                                ('fee_part', no_fees if fee_part is None else fee_part),
+                                ('fee_weight', no_fees if fee_weight is None else fee_weight)]:
+            values = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+            cumulative = self.cumulative[measure]
+            self.cumulative[measure] = np.hstack([cumulative, cumulative[:, -1:] + np.cumsum(values, axis=1)])
+        market_price = np.asarray(market_price, dtype=float)
+        price_count = ~np.isnan(market_price) if price_count is None else np.asarray(price_count, dtype=float)
+        self.cumulative['market_price'] = np.append(self.cumulative['market_price'],
+                                                    self.cumulative['market_price'][-1] + np.cumsum(np.nan_to_num(market_price, nan=0.0)))
+        self.cumulative['price_count'] = np.append(self.cumulative['price_count'],
+                                                   self.cumulative['price_count'][-1] + np.cumsum(price_count))
+        first_new = len(self.times)
+        self.times = np.concatenate([self.times, times])
+        for level in LEVELS:
+            self._extend_level(level, first_new, times)
+
+    # Function to add the periods of newly appended intervals to a level and refresh its totals from
+    # the last existing period on (which the new intervals may extend)
+    def _extend_level(self, level, first_new, times):
+        labels = np.asarray(billing_periods(pd.DatetimeIndex(times, tz='UTC'), level), dtype=object)
+        changes = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+        new_labels, new_starts = labels[np.concatenate([[0], changes])], first_new + np.concatenate([[0], changes])
+        existing = self.levels[level]
+        if len(existing['labels']) and existing['labels'][-1] == new_labels[0]:
+            new_labels, new_starts = new_labels[1:], new_starts[1:]
+        refresh_from = max(len(existing['labels']) - 1, 0)
+        existing['labels'] = np.concatenate([existing['labels'], new_labels])
+        existing['starts'] = np.concatenate([existing['starts'], new_starts]).astype(np.int64)
+        bounds = np.append(existing['starts'][refresh_from:], len(self.times))
+        for measure in ASSET_MEASURES + FEE_MEASURES + ['market_price', 'price_count']:
+            cumulative = self.cumulative[measure]
+            totals = cumulative[..., bounds[1:]] - cumulative[..., bounds[:-1]]
+            kept = self.level_totals[level].get(measure)
+            kept = kept[..., :refresh_from] if kept is not None else totals[..., :0]
+            self.level_totals[level][measure] = np.concatenate([kept, totals], axis=-1)
+
+    # Function to turn a [start, end) time range into interval positions (None leaves that side open)
+    def positions(self, start=None, end=None):
+        i = 0 if start is None else int(np.searchsorted(self.times, _nanoseconds(start), side='left'))
+        j = len(self.times) if end is None else int(np.searchsorted(self.times, _nanoseconds(end), side='left'))
+        return i, max(i, j)
+
+    # Total of a measure per asset over [start, end): one difference of the cumulative sums
+    def total(self, measure, start=None, end=None):
+        i, j = self.positions(start, end)
+        cumulative = self.cumulative[measure]
+        return cumulative[..., j] - cumulative[..., i]
+
+    # Average market price over [start, end) (NaN if no interval of the range is priced)
+    def average_market_price(self, start=None, end=None):
+        count = self.total('price_count', start, end)
+        return self.total('market_price', start, end) / count if count else np.nan
+
+    # Materialized totals of a measure per day or month as a frame (periods x assets)
+    def level(self, level, measure):
+        totals = self.level_totals[level][measure]
+        columns = self.asset_ids if totals.ndim == 2 else [measure]
+        return pd.DataFrame(np.atleast_2d(totals).T, index=pd.Index(self.levels[level]['labels'], name='billing_period'),
+                            columns=columns)
+
+    # Average market price per day or month, from the materialized sums and counts
+    def level_market_price(self, level):
+        totals = self.level_totals[level]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.Series(totals['market_price'] / totals['price_count'], index=self.levels[level]['labels'])
+
+    # Interval values of a measure over [start, end) in the layout of the result CSVs (delivery_start
+    # plus one column per asset); level 'day' or 'month' gives one row per period instead. A period cut
+    # by the range only counts its intervals inside the range, with its first one as delivery_start.
+    def series(self, measure, asset_ids=None, start=None, end=None, level=None):
+        slots = np.arange(len(self.asset_ids)) if asset_ids is None else pd.Index(self.asset_ids).get_indexer(asset_ids)
+        names = self.asset_ids if measure == 'penalty' else self.metering_point_ids
+        columns = [f"{names[slot]}_{measure}" for slot in slots]
+        i, j = self.positions(start, end)
+        if level is None:
+            times = self.times[i:j]
+            values = np.diff(self.cumulative[measure][slots, i:j + 1], axis=1)
+        else:
+            starts = self.levels[level]['starts']
+            ends = np.append(starts[1:], len(self.times))
+            periods = np.flatnonzero((starts < j) & (ends > i))
+            lower, upper = np.maximum(starts[periods], i), np.minimum(ends[periods], j)
+            times = self.times[lower]
+            cumulative = self.cumulative[measure][slots]
+            values = cumulative[:, upper] - cumulative[:, lower]
+        frame = pd.DataFrame(values.T, columns=columns)
+        frame.insert(0, 'delivery_start', pd.DatetimeIndex(times.astype('datetime64[ns]')).tz_localize('UTC'))
+        return frame
+
+    # Invoices of every asset over [start, end) in the layout of asset_invoices.csv, from the range
+    # totals and average market price (the fee parts were charged under each interval's contract term)
+    def invoices(self, assets_df, start=None, end=None, registry=None):
+        registry = registry if registry is not None else AssetRegistry(assets_df)
+        fees = invoice_fees(self.total('fee_part', start, end), self.total('fee_weight', start, end),
+                            self.average_market_price(start, end))[0]
+        net_revenue, unit_net_revenue, gross_revenue = invoice_amounts(self.total('revenue', start, end), fees, registry.capacity_kw)
+        return pd.DataFrame({'asset_id': self.asset_ids, 'net_revenue': net_revenue, 'unit_net_revenue': unit_net_revenue,
+                             'gross_revenue': gross_revenue})
+
+    # Invoices of every asset for every day or month, in the layout of asset_invoices_by_period.csv,
+    # straight from the materialized level totals
+    def invoices_by_period(self, assets_df, period="month", registry=None):
+        registry = registry if registry is not None else AssetRegistry(assets_df)
+        labels = self.levels[period]['labels']
+        totals = self.level_totals[period]
+        contribution = totals['contribution'].T
+        fees = invoice_fees(totals['fee_part'].T, totals['fee_weight'].T, self.level_market_price(period).to_numpy())
+        net_revenue, unit_net_revenue, gross_revenue = invoice_amounts(totals['revenue'].T, fees, registry.capacity_kw)
+        return pd.DataFrame({
+            'billing_period': np.repeat(labels, len(self.asset_ids)),
+            'asset_id': np.tile(self.asset_ids, len(labels)),
+            'total_contribution': contribution.ravel(),
+            'fee': fees.ravel(),
+            'net_revenue': net_revenue.ravel(),
+            'unit_net_revenue': unit_net_revenue.ravel(),
+            'gross_revenue': gross_revenue.ravel(),
+        })
+
+    # Function to write the cube (cumulative sums, time axis and materialized levels) to an .npz file
+    def save(self, file_path=DEFAULT_CUBE):
+        arrays = {'asset_ids': self.asset_ids.astype(str), 'metering_point_ids': self.metering_point_ids.astype(str),
+                  'times': self.times}
+        arrays.update({f"cumulative_{measure}": values for measure, values in self.cumulative.items()})
+        for level in LEVELS:
+            arrays[f"{level}_labels"] = self.levels[level]['labels'].astype(str)
+            arrays[f"{level}_starts"] = self.levels[level]['starts']
+            arrays.update({f"{level}_total_{measure}": values for measure, values in self.level_totals[level].items()})
+        with open(file_path, 'wb') as file:
+            np.savez(file, **arrays)
+        print(f"Rollup cube saved to {file_path}")
+
+    # Function to read a cube written by save()
+    @classmethod
+    def load(cls, file_path=DEFAULT_CUBE):
+        with np.load(file_path) as arrays:
+            cube = cls(arrays['asset_ids'].astype(object), arrays['metering_point_ids'].astype(object))
+            cube.times = arrays['times']
+            cube.cumulative = {measure: arrays[f"cumulative_{measure}"] for measure in cube.cumulative}
+            for level in LEVELS:
+                cube.levels[level] = {'labels': arrays[f"{level}_labels"].astype(object), 'starts': arrays[f"{level}_starts"]}
+                cube.level_totals[level] = {measure: arrays[f"{level}_total_{measure}"] for measure in cube.cumulative}
+        print(f"Loaded {file_path} successfully.")
+        return cube
+
+# Function to append a run's results to the cube file, creating it on first use
+# Intervals already in the cube are refused (see RollupCube.append); returns the cube or None.
+def update_cube(file_path, outputs, assets_df, market_index_df):
+    try:
+        if os.path.exists(file_path):
+            cube = RollupCube.load(file_path)
+            if list(cube.asset_ids) != list(AssetRegistry(assets_df).asset_ids):
+                raise ValueError(f"the assets in {file_path} differ from assets_base_data.csv")
+            cube.append_outputs(outputs, assets_df, market_index_df)
+        else:
+            cube = RollupCube.from_outputs(outputs, assets_df, market_index_df)
+    except ValueError as e:
+        print(f"Error: rollup cube not updated: {e}")
+        return None
+    cube.save(file_path)
+    return cube
+
+# Function to load the results the plotters need from the cube: interval (or daily/monthly) revenue
+# and penalties of the given assets over [start, end) and their invoices for that range
+def load_results(file_path=DEFAULT_CUBE, assets_df=None, asset_ids=None, start=None, end=None, level=None):
+    if not os.path.exists(file_path):
+        print(f"Error: {file_path} not found.")
+        return None
+    cube = RollupCube.load(file_path)
+    if assets_df is None:
+        assets_df = pd.read_csv("assets_base_data.csv", delimiter=";")
+    penalty_df = cube.series('penalty', asset_ids, start, end, level)
+    penalty_df['total_penalty'] = penalty_df.drop(columns='delivery_start').sum(axis=1)
+    invoices_df = cube.invoices(assets_df, start, end)
+    return {
+        'asset_revenue': cube.series('revenue', asset_ids, start, end, level),
+        'imbalance_penalties': penalty_df,
+        'asset_invoices': invoices_df if asset_ids is None else invoices_df[invoices_df['asset_id'].isin(asset_ids)].reset_index(drop=True),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the rollup cube written by energy_trading5.py --rollup-cube.")
+    parser.add_argument("--cube", default=DEFAULT_CUBE)
+    parser.add_argument("--start", default=None, help="first delivery_start of the range (UTC)")
+    parser.add_argument("--end", default=None, help="end of the range, exclusive")
+    parser.add_argument("--period", choices=LEVELS, default=None, help="invoice every day or month instead of the range")
+    args = parser.parse_args()
+
+    cube = RollupCube.load(args.cube)
+    assets_df = pd.read_csv("assets_base_data.csv", delimiter=";")
+    print(f"{len(cube)} intervals, {len(cube.asset_ids)} assets")
+    if args.period is not None:
+        print(cube.invoices_by_period(assets_df, args.period).to_string(index=False))
+    else:
+        totals = pd.DataFrame({measure: cube.total(measure, args.start, args.end) for measure in ASSET_MEASURES},
+                              index=pd.Index(cube.asset_ids, name='asset_id'))
+        print(totals.to_string())
+        print(f"Average market price: {cube.average_market_price(args.start, args.end):.2f} EUR/MWh")
+        print(cube.invoices(assets_df, args.start, args.end).to_string(index=False))
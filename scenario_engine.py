@@ -0,0 +1,134 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from energy_trading5 import load_inputs, save_dataframe
+from settlement_core import SettlementCore, allocate_merit_order
+
+# Scenario statistics reported per asset (percentiles of the per-asset totals over all scenarios)
+PERCENTILES = [5, 50, 95]
+
+# Function to draw (scenarios, intervals, k) standard normal shocks that are AR(1)-correlated along
+# the interval axis with correlation rho (rho=0 gives independent intervals)
+def correlated_shocks(rng, scenarios, intervals, k, rho=0.0):
+    shocks = rng.standard_normal((scenarios, intervals, k))
+    if rho:
+        scale = np.sqrt(1 - rho ** 2)
+        for t in range(1, intervals):
+            shocks[:, t] = rho * shocks[:, t - 1] + scale * shocks[:, t]
+    return shocks
+
+# Monte Carlo exposure of a settled day: production, market price and imbalance penalty price are
+# perturbed per scenario around the deterministic inputs of a SettlementCore and the penalty and
+# revenue totals of every asset are collected for every scenario.
+# - production: measured (the forecast where nothing is measured yet) x max(0, 1 + production_sigma * shock)
+# - market price: market index + price_sigma * shock (EUR/MWh, one path for the whole market)
+# - penalty price: imbalance penalty x lognormal factor with volatility penalty_sigma (mean 1)
+# Shocks of production and market price are AR(1)-correlated over the intervals with correlation rho.
+# The traded quantities are fixed; every scenario is allocated in merit order (assets outside their
+# contract take no volume) and priced with each asset's contract term exactly like the deterministic
+# run, so all sigmas at 0 reproduce its totals.
+class ScenarioEngine:
+    def __init__(self, core, production_sigma=0.1, price_sigma=10.0, penalty_sigma=0.3, rho=0.8):
+        self.core = core
+        self.production_sigma, self.price_sigma, self.penalty_sigma, self.rho = production_sigma, price_sigma, penalty_sigma, rho
+        self.base_production = np.where(np.isnan(core.measured), core.forecast, core.measured).T
+        self.forecast = core.forecast.T
+        self.active = core.active.T
+        # price_matrix is affine in the market price: fixed contract part plus a 0/1 weight on the market index
+        self.fixed_price = core.registry.price_matrix(core.time_index, np.zeros(len(core.time_index))).T
+        self.market_weight = core.registry.price_matrix(core.time_index, np.ones(len(core.time_index))).T - self.fixed_price
+        self.quantity = np.where(core.has_trade, core.quantity, 0.0)
+
+    # Function to pick the number of scenarios per chunk so one (scenarios, intervals, assets) float
+    # array stays within chunk_mb; a chunk holds a handful of such arrays at a time
+    def chunk_size(self, chunk_mb=64):
+        cell_bytes = self.base_production.size * 8
+        return max(1, int(chunk_mb * 1024 ** 2 // cell_bytes))
+
+    # Function to evaluate one chunk of scenarios; returns (revenue, penalty) totals as (scenarios, assets)
+    # The (scenarios, intervals, assets) arrays are updated in place to keep the chunk footprint small.
+    def evaluate_chunk(self, rng, scenarios):
+        intervals, assets = self.base_production.shape
+        production = correlated_shocks(rng, scenarios, intervals, assets, self.rho)
+        production *= self.production_sigma
+        production += 1
+        np.maximum(production, 0.0, out=production)
+        production *= self.base_production[None]
+        market_price = self.core.market_price[None, :] + self.price_sigma * correlated_shocks(rng, scenarios, intervals, 1, self.rho)[:, :, 0]
+        penalty_price = self.core.imbalance_penalty[None, :] * rng.lognormal(-self.penalty_sigma ** 2 / 2, self.penalty_sigma,
+                                                                             (scenarios, intervals))
+
+        contribution, _ = allocate_merit_order(np.tile(self.quantity, scenarios),
+                                               np.where(self.active[None], production, 0.0).reshape(-1, assets))
+        revenue = contribution.reshape(scenarios, intervals, assets)
+        revenue *= self.fixed_price[None] + self.market_weight[None] * market_price[:, :, None]
+        production -= self.forecast[None]
+        production *= penalty_price[:, :, None]
+        return np.nansum(revenue, axis=1), np.nansum(production, axis=1)
+
+    # Function to run all scenarios chunk by chunk; memory is bounded by the chunk size plus the
+    # (scenarios, assets) totals. Returns the revenue and penalty totals of every scenario and asset.
+    def run(self, scenarios=10_000, seed=42, chunk_mb=64):
+        rng = np.random.default_rng(seed)
+        chunk = self.chunk_size(chunk_mb)
+        revenue = np.empty((scenarios, len(self.core.asset_ids)))
+        penalty = np.empty_like(revenue)
+        for start in range(0, scenarios, chunk):
+            stop = min(start + chunk, scenarios)
+            revenue[start:stop], penalty[start:stop] = self.evaluate_chunk(rng, stop - start)
+        return revenue, penalty
+
+# Function to compute the expected shortfall of every column: the mean of the worst (1 - alpha)
+# share of scenarios, the lowest values for lower_tail and the highest otherwise
+def expected_shortfall(values, alpha=0.95, lower_tail=True):
+    tail = max(1, int(np.ceil(len(values) * (1 - alpha))))
+    ordered = np.sort(values, axis=0)
+    return (ordered[:tail] if lower_tail else ordered[-tail:]).mean(axis=0)
+
+# Function to summarise the scenario totals per asset (and for the fleet) as one row per asset and metric
+# Expected shortfall is taken on the lower tail of revenue and the upper tail of the penalty.
+def risk_table(asset_ids, revenue, penalty, alpha=0.95):
+    rows = []
+    for metric, values, lower_tail in [('revenue', revenue, True), ('penalty', penalty, False)]:
+        values = np.column_stack([values, values.sum(axis=1)])
+        stats = {'mean': values.mean(axis=0), 'std': values.std(axis=0)}
+        stats.update({f"p{q:02d}": percentile for q, percentile in zip(PERCENTILES, np.percentile(values, PERCENTILES, axis=0))})
+        stats[f"es_{alpha:.0%}"] = expected_shortfall(values, alpha, lower_tail)
+        rows.append(pd.DataFrame({'asset_id': list(asset_ids) + ['fleet'], 'metric': metric, **stats}))
+    return pd.concat(rows, ignore_index=True)
+
+# Function to build the settlement core of the loaded inputs and run the scenarios on it
+def simulate(inputs, scenarios=10_000, production_sigma=0.1, price_sigma=10.0, penalty_sigma=0.3, rho=0.8, alpha=0.95,
+             seed=42, chunk_mb=64):
+    core = SettlementCore.from_frames(inputs['assets'], inputs['measured'], inputs['trades'], inputs['market_index'],
+                                      inputs['imbalance_penalty'], inputs['forecasts'])
+    engine = ScenarioEngine(core, production_sigma, price_sigma, penalty_sigma, rho)
+    revenue, penalty = engine.run(scenarios, seed, chunk_mb)
+    return risk_table(core.asset_ids, revenue, penalty, alpha)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo revenue and imbalance penalty exposure per asset.")
+    parser.add_argument("--measured-file", default="measured_20241013.csv")
+    parser.add_argument("--scenarios", type=int, default=10_000)
+    parser.add_argument("--production-sigma", type=float, default=0.1, help="relative production volatility per interval")
+    parser.add_argument("--price-sigma", type=float, default=10.0, help="market price volatility in EUR/MWh")
+    parser.add_argument("--penalty-sigma", type=float, default=0.3, help="lognormal volatility of the penalty price")
+    parser.add_argument("--rho", type=float, default=0.8, help="correlation of consecutive intervals")
+    parser.add_argument("--alpha", type=float, default=0.95, help="confidence level of the expected shortfall")
+    parser.add_argument("--chunk-mb", type=float, default=64, help="memory per scenario chunk array")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="scenario_risk.csv")
+    args = parser.parse_args()
+
+    inputs = load_inputs(measured_file=args.measured_file)
+    if inputs is None:
+        print("One or more input files failed to load. Exiting.")
+    else:
+        started = time.perf_counter()
+        risk_df = simulate(inputs, args.scenarios, args.production_sigma, args.price_sigma, args.penalty_sigma, args.rho,
+                           args.alpha, args.seed, args.chunk_mb)
+        elapsed = time.perf_counter() - started
+        print(f"Simulated {args.scenarios} scenarios in {elapsed:.2f} s")
+        print(risk_df.to_string(index=False))
+        save_dataframe(risk_df, args.output, "Scenario risk")
@@ -0,0 +1,500 @@
+import numpy as np
+import pandas as pd
+from trade_book import interval_nanoseconds, net_positions
+
+# Function to read the metering_point_id -> asset_id mapping from the asset base data, in file order
+def meter_to_asset_map(assets_df):
+    return dict(zip(assets_df['metering_point_id'], assets_df['asset_id']))
+
+# Function to allocate trade quantities to meters in merit order
+# quantity is an (n,) array and production an (n, m) array whose columns are the
+# meters in merit order. The running remainder q - p_1 - p_2 - ... is built with a
+# cumulative subtraction and clipped to each meter's production, which reproduces
+# the sequential min() chain exactly. Missing production is treated as zero.
+def allocate_merit_order(quantity, production):
+    quantity = np.asarray(quantity, dtype=float)
+    production = np.nan_to_num(np.asarray(production, dtype=float), nan=0.0)
+    running = np.subtract.accumulate(np.column_stack([quantity, production]), axis=1)
+    contributions = np.clip(running[:, :-1], 0.0, production)
+    remaining = np.maximum(0.0, running[:, -1])
+    return contributions, remaining
+
+# Function to split each interval's quantity across the meters in proportion to their production
+def allocate_pro_rata(quantity, production):
+    quantity = np.asarray(quantity, dtype=float)
+    production = np.nan_to_num(np.asarray(production, dtype=float), nan=0.0)
+    total = production.sum(axis=1)
+    share = np.clip(np.divide(quantity, total, out=np.zeros_like(total), where=total > 0), 0.0, 1.0)
+    return production * share[:, None], np.maximum(0.0, quantity - total)
+
+# Function to allocate in merit order of price: per interval the meters are filled from the lowest
+# price upwards (prices is an (n, m) array; NaN prices, e.g. outside a contract, are filled last and
+# equal prices keep file order)
+def allocate_cheapest_first(quantity, production, prices):
+    production = np.nan_to_num(np.asarray(production, dtype=float), nan=0.0)
+    order = np.argsort(np.nan_to_num(np.asarray(prices, dtype=float), nan=np.inf), axis=1, kind='stable')
+    ordered, remaining = allocate_merit_order(quantity, np.take_along_axis(production, order, axis=1))
+    contributions = np.empty_like(ordered)
+    np.put_along_axis(contributions, order, ordered, axis=1)
+    return contributions, remaining
+
+# Function to split each interval's quantity across the meters in proportion to their capacity
+# A meter never delivers more than it produced; what it cannot take is shared again among the meters
+# with production left (water filling), so at most m rounds are needed for all intervals at once.
+def allocate_capacity_weighted(quantity, production, capacity_kw):
+    quantity = np.asarray(quantity, dtype=float)
+    production = np.nan_to_num(np.asarray(production, dtype=float), nan=0.0)
+    weights = np.broadcast_to(np.asarray(capacity_kw, dtype=float), production.shape)
+    contributions = np.zeros_like(production)
+    open_quantity = np.minimum(np.maximum(quantity, 0.0), production.sum(axis=1))
+    for _ in range(production.shape[1]):
+        headroom = production - contributions
+        open_weights = np.where(headroom > 0, weights, 0.0)
+        total_weight = open_weights.sum(axis=1)
+        active = (open_quantity > 1e-12) & (total_weight > 0)
+        if not active.any():
+            break
+        share = open_quantity[:, None] * open_weights / np.where(active, total_weight, 1.0)[:, None]
+        added = np.where(active[:, None], np.minimum(share, headroom), 0.0)
+        contributions += added
+        open_quantity = open_quantity - added.sum(axis=1)
+    return contributions, np.maximum(0.0, quantity - production.sum(axis=1))
+
+# Allocation strategies by name, each called with the (n,) quantities, the (n, m) production, the
+# (n, m) asset prices and the (m,) capacities in kW and returning (contributions, remaining quantity).
+# Further strategies can be added here under their own name.
+ALLOCATION_STRATEGIES = {
+    'merit_order': lambda quantity, production, prices, capacity_kw: allocate_merit_order(quantity, production),
+    'pro_rata': lambda quantity, production, prices, capacity_kw: allocate_pro_rata(quantity, production),
+    'cheapest_price_first': lambda quantity, production, prices, capacity_kw: allocate_cheapest_first(quantity, production, prices),
+    'capacity_weighted': lambda quantity, production, prices, capacity_kw: allocate_capacity_weighted(quantity, production, capacity_kw),
+}
+
+# Function to allocate with the named strategy
+def allocate(strategy, quantity, production, prices=None, capacity_kw=None):
+    if strategy not in ALLOCATION_STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy {strategy}; expected one of {', '.join(ALLOCATION_STRATEGIES)}")
+    return ALLOCATION_STRATEGIES[strategy](quantity, production, prices, capacity_kw)
+
+# Function to compute the asset x interval imbalance penalty (measured - forecast) * penalty price
+def imbalance_penalty_matrix(measured, forecast, imbalance_penalty):
+    return (np.asarray(measured, dtype=float) - np.asarray(forecast, dtype=float)) * np.asarray(imbalance_penalty, dtype=float)[None, :]
+
+# Function to reindex a long delivery_start/asset_id/value frame onto an asset x interval array in one step
+def long_to_matrix(long_df, value_column, time_index, asset_ids):
+    wide = long_df.pivot(index='delivery_start', columns='asset_id', values=value_column)
+    return wide.reindex(index=time_index, columns=asset_ids).to_numpy(dtype=float).T
+
+# Function to list the intervals for which aligned inputs have no value
+# values is a (k, n) array aligned on time_index and labels names its k rows.
+def missing_intervals(time_index, values, labels):
+    rows, columns = np.nonzero(np.isnan(np.atleast_2d(values)))
+    return pd.DataFrame({'input': np.asarray(labels, dtype=object)[rows], 'delivery_start': time_index[columns]})
+
+# Function to print one line per input with missing intervals
+def report_missing_intervals(stage, report, max_listed=3):
+    for label, group in report.groupby('input', sort=False):
+        listed = ", ".join(str(ts) for ts in group['delivery_start'].iloc[:max_listed])
+        more = f" and {len(group) - max_listed} more" if len(group) > max_listed else ""
+        print(f"Warning: {stage}: {label} missing for {len(group)} intervals ({listed}{more}).")
+
+# Local timezone of the delivery days that billing periods are counted in
+BILLING_TIMEZONE = "Europe/Berlin"
+
+# Label formats of the billing periods (by local delivery date)
+BILLING_PERIOD_FORMATS = {'day': "%Y-%m-%d", 'month': "%Y-%m"}
+
+# Fee of each fee model in every interval as (part in EUR, weight on the average market price of the
+# billing period), so the fee of any set of intervals is the summed part plus the summed weight times
+# the period's average price. contribution is an (assets, intervals) MWh array, capacity_mw, rate and
+# percent are (assets, 1) and days is the length of each interval in days. fee__eur_per_mwh of
+# fixed_for_capacity is read as EUR per MW of capacity and day and accrues with the settled intervals,
+# so a month is billed the same as its days invoiced one by one.
+FEE_MODELS = {
+    'fixed_as_produced': lambda contribution, capacity_mw, rate, percent, days: (contribution * rate, 0.0),
+    'fixed_for_capacity': lambda contribution, capacity_mw, rate, percent, days: (capacity_mw * rate * days, 0.0),
+    'percent_of_market': lambda contribution, capacity_mw, rate, percent, days: (0.0, contribution * (percent / 100)),
+}
+
+# Function to get the length in days of the intervals of a delivery_start axis: the shortest step
+# between two intervals (one hour if there is a single interval)
+def interval_days(delivery_start):
+    return interval_nanoseconds(delivery_start) / pd.Timedelta(days=1).value
+
+# Function to compute the fee parts of all assets in every interval (see FEE_MODELS)
+# contribution is an (assets, intervals) MWh array over the delivery_start axis and days the interval
+# length in days (a scalar or one value per interval). Every interval is charged under the asset's
+# contract term active at that delivery_start and nothing is charged outside a contract; every fee
+# model is evaluated once for all assets and intervals. Returns the (assets, intervals) EUR parts and
+# market price weights.
+def interval_fee_parts(registry, contribution, delivery_start, days):
+    unknown = sorted(set(registry.term_fee_model) - set(FEE_MODELS))
+    if unknown:
+        raise ValueError(f"Unknown fee model(s): {', '.join(map(str, unknown))}")
+    contribution = np.nan_to_num(np.atleast_2d(np.asarray(contribution, dtype=float)), nan=0.0)
+    days = np.broadcast_to(np.asarray(days, dtype=float), contribution.shape[1:])[None, :]
+    terms = registry.active_terms(delivery_start)
+    term = np.maximum(terms, 0)
+    fee_models = np.where(terms >= 0, registry.term_fee_model[term], None)
+    capacity_mw = registry.term_capacity_kw[term] / 1000
+    fee_rates, fee_percents = registry.term_fee_rate[term], registry.term_fee_percent[term]
+    parts, weights = np.zeros(contribution.shape), np.zeros(contribution.shape)
+    for fee_model, fee in FEE_MODELS.items():
+        charged = fee_models == fee_model
+        if charged.any():
+            part, weight = fee(contribution, capacity_mw, fee_rates, fee_percents, days)
+            parts, weights = np.where(charged, part, parts), np.where(charged, weight, weights)
+    return parts, weights
+
+# Function to price summed fee parts: fee = part + weight * average market price
+# fee_part and fee_weight are (assets,) or (periods, assets) arrays and avg_market_price a scalar or a
+# (periods,) array. A zero weight adds nothing, also where a period has no market price.
+def invoice_fees(fee_part, fee_weight, avg_market_price):
+    avg_price = np.asarray(avg_market_price, dtype=float).reshape(-1, 1)
+    fee_weight = np.atleast_2d(np.asarray(fee_weight, dtype=float))
+    return np.atleast_2d(np.asarray(fee_part, dtype=float)) + np.where(fee_weight != 0, fee_weight * avg_price, 0.0)
+
+# Function to turn revenue and fees into net, unit net and gross (incl. 19% VAT) revenue arrays
+def invoice_amounts(total_revenue, fees, capacity_kw):
+    net_revenue = np.asarray(total_revenue, dtype=float) + fees
+    unit_net_revenue = net_revenue / (np.asarray(capacity_kw, dtype=float) / 1000)
+    gross_revenue = net_revenue * 1.19
+    return net_revenue, unit_net_revenue, gross_revenue
+
+# Function to label delivery_start timestamps with their billing period ('day' or 'month')
+def billing_periods(delivery_start, period="month"):
+    times = pd.DatetimeIndex(delivery_start)
+    if times.tz is None:
+        times = times.tz_localize('UTC')
+    return times.tz_convert(BILLING_TIMEZONE).strftime(BILLING_PERIOD_FORMATS[period])
+
+# Price models as small integer codes in the registry's term arrays (anything else earns nothing)
+PRICE_MODEL_CODES = {'fixed': 1, 'market': 2}
+
+# Function to convert delivery_start timestamps to UTC nanoseconds (naive timestamps are taken as UTC)
+def utc_nanoseconds(delivery_start):
+    times = pd.DatetimeIndex(delivery_start)
+    if times.tz is None:
+        times = times.tz_localize('UTC')
+    return times.tz_convert('UTC').as_unit('ns').asi8
+
+# Function to turn contract_begin/contract_end dates into [start, end) bounds in UTC nanoseconds
+# The dates are local delivery dates: a contract starts at local midnight of contract_begin and runs
+# through the whole contract_end day. A missing date leaves that side of the contract open.
+def contract_bounds(contract_begin, contract_end, n):
+    def local_midnights(dates, days_after, open_value):
+        if dates is None:
+            return np.full(n, open_value, dtype=np.int64)
+        dates = pd.to_datetime(pd.Series(dates).reset_index(drop=True).replace('', None), errors='coerce')
+        if dates.dt.tz is None:
+            dates = (dates + pd.Timedelta(days=days_after)).dt.tz_localize(BILLING_TIMEZONE, nonexistent='shift_forward',
+                                                                          ambiguous=False)
+        else:
+            dates = dates + pd.Timedelta(days=days_after)
+        bounds = utc_nanoseconds(dates)
+        return np.where(dates.isna().to_numpy(), open_value, bounds)
+    int64 = np.iinfo(np.int64)
+    return local_midnights(contract_begin, 0, int64.min), local_midnights(contract_end, 1, int64.max)
+
+# Preloaded, indexed view of the asset base data
+# Every asset has a fixed slot (file order of first appearance) and is found by asset_id or
+# metering_point_id without scanning the frame. Each row of the base data is a contract term with its
+# own price and fee terms, valid from contract_begin through contract_end; an asset may have several
+# terms (later rows win where they overlap). active_terms() tells which term of which asset applies at
+# every delivery_start of a time axis in one vectorized comparison against the contract intervals.
+class AssetRegistry:
+    def __init__(self, assets_df):
+        self.terms = assets_df.reset_index(drop=True)
+        self.term_asset, asset_ids = pd.factorize(self.terms['asset_id'])
+        self.asset_ids = np.asarray(asset_ids, dtype=object)
+        term_rows = pd.Series(np.arange(len(self.terms))).groupby(self.term_asset)
+        first_term, self.current_term = term_rows.first().to_numpy(), term_rows.last().to_numpy()
+        self.metering_point_ids = self.terms['metering_point_id'].to_numpy(dtype=object)[first_term]
+        self.asset_index = pd.Index(self.asset_ids)
+        self.meter_index = pd.Index(self.metering_point_ids)
+
+        # Per term: price terms and contract interval
+        self.term_price_model = self.terms['price_model'].map(PRICE_MODEL_CODES).fillna(0).to_numpy(dtype=np.int8)
+        self.term_fixed_price = pd.to_numeric(self.terms['price__eur_per_mwh'], errors='coerce').to_numpy(dtype=float)
+        self.term_start, self.term_end = contract_bounds(self.terms.get('contract_begin'), self.terms.get('contract_end'),
+                                                         len(self.terms))
+
+        # Per term: capacity and fee terms
+        self.term_capacity_kw = self.terms['capacity__kw'].to_numpy(dtype=float)
+        self.term_fee_model = self.terms['fee_model'].to_numpy(dtype=object)
+        self.term_fee_rate = pd.to_numeric(self.terms['fee__eur_per_mwh'], errors='coerce').to_numpy(dtype=float)
+        self.term_fee_percent = pd.to_numeric(self.terms['fee_percent'], errors='coerce').to_numpy(dtype=float)
+
+        # Per asset: capacity and fee terms of the current (last) contract term
+        self.capacity_kw = self.term_capacity_kw[self.current_term]
+        self.fee_model = self.term_fee_model[self.current_term]
+        self.fee_rate = self.term_fee_rate[self.current_term]
+        self.fee_percent = self.term_fee_percent[self.current_term]
+
+    def __len__(self):
+        return len(self.asset_ids)
+
+    # Slot of an asset by asset_id or metering_point_id
+    def slot(self, key):
+        if key in self.asset_index:
+            return self.asset_index.get_loc(key)
+        if key in self.meter_index:
+            return self.meter_index.get_loc(key)
+        raise KeyError(f"Unknown asset or metering point {key}")
+
+    # Slots of many assets at once
+    def slots(self, asset_ids):
+        slots = self.asset_index.get_indexer(asset_ids)
+        if (slots < 0).any():
+            raise KeyError(f"Unknown assets: {', '.join(map(str, np.asarray(asset_ids)[slots < 0]))}")
+        return slots
+
+    # Current contract term of an asset as a dict of its base data columns
+    def record(self, key):
+        return self.terms.iloc[self.current_term[self.slot(key)]].to_dict()
+
+    # Term row active for every asset and delivery_start as an (assets, intervals) array, -1 outside every contract
+    def active_terms(self, delivery_start):
+        times = utc_nanoseconds(delivery_start)
+        active = (self.term_start[:, None] <= times[None, :]) & (times[None, :] < self.term_end[:, None])
+        if len(self.terms) == len(self.asset_ids):
+            # One term per asset: the term row is the asset slot
+            return np.where(active, np.arange(len(self.asset_ids))[:, None], -1)
+        terms = np.full((len(self.asset_ids), len(times)), -1, dtype=np.int64)
+        for row, asset_slot in enumerate(self.term_asset):
+            terms[asset_slot, active[row]] = row
+        return terms
+
+    # Whether each asset is under contract at each delivery_start, as an (assets, intervals) array
+    def active_mask(self, delivery_start):
+        return self.active_terms(delivery_start) >= 0
+
+    # asset_ids under contract at one delivery_start
+    def active_assets(self, delivery_start):
+        return list(self.asset_ids[self.active_mask([delivery_start])[:, 0]])
+
+    # Price of every asset in every interval under its active term: the contract price for 'fixed',
+    # the market index for 'market' and zero outside a contract, so no revenue is earned there
+    def price_matrix(self, delivery_start, market_price):
+        terms = self.active_terms(delivery_start)
+        term = np.maximum(terms, 0)
+        price_model = np.where(terms >= 0, self.term_price_model[term], 0)
+        market_price = np.asarray(market_price, dtype=float)
+        prices = np.where(price_model == PRICE_MODEL_CODES['fixed'], self.term_fixed_price[term], 0.0)
+        return np.where(price_model == PRICE_MODEL_CODES['market'], market_price[None, :], prices)
+
+# Function to build the invoice table of every asset from its summed revenue and fee parts
+# fee_part, fee_weight and total_revenue are (assets,) arrays in registry order.
+def invoice_table(registry, fee_part, fee_weight, total_revenue, avg_market_price):
+    fees = invoice_fees(fee_part, fee_weight, avg_market_price)[0]
+    net_revenue, unit_net_revenue, gross_revenue = invoice_amounts(total_revenue, fees, registry.capacity_kw)
+    return pd.DataFrame({
+        'asset_id': list(registry.asset_ids),
+        'net_revenue': net_revenue,
+        'unit_net_revenue': unit_net_revenue,
+        'gross_revenue': gross_revenue,
+    })
+
+# Settlement state for a set of assets held as dense asset x interval arrays over one shared time index
+# The energy_trading5 stages fill the arrays they need from their input frames (set_measured,
+# set_positions, ...), run one broadcasted step over all assets (allocate, compute_revenue,
+# compute_penalty, invoices) and lay the result out as their output frame, so every stage works the
+# same for any number of assets. from_frames fills everything at once for whole-day work such as the
+# scenario engine.
+class SettlementCore:
+    def __init__(self, registry, time_index):
+        self.registry = registry
+        self.asset_ids = self.registry.asset_ids
+        self.metering_point_ids = self.registry.metering_point_ids
+        self.time_index = pd.DatetimeIndex(time_index)
+        self.active = self.registry.active_mask(self.time_index)
+        shape = (len(self.asset_ids), len(self.time_index))
+        self.measured = np.full(shape, np.nan)
+        self.forecast = np.full(shape, np.nan)
+        self.contribution = np.zeros(shape)
+        self.revenue = np.zeros(shape)
+        self.penalty = np.full(shape, np.nan)
+        self.quantity = np.zeros(len(self.time_index))
+        self.has_trade = np.zeros(len(self.time_index), dtype=bool)
+        self.has_measured = np.zeros(len(self.time_index), dtype=bool)
+        self.remaining = np.zeros(len(self.time_index))
+        self.market_price = np.full(len(self.time_index), np.nan)
+        self.imbalance_penalty = np.full(len(self.time_index), np.nan)
+        self.missing_report = missing_intervals(self.time_index[:0], np.empty((0, 0)), [])
+
+    # Build the core from the loaded input frames (measured and forecast values in MW)
+    # forecast_dfs maps asset_id to that asset's forecast frame. Trades are netted onto the measured
+    # intervals with trade_book.net_positions, exactly like the pipeline, so partial-hour products land
+    # in their interval and block products are split across theirs.
+    @classmethod
+    def from_frames(cls, assets_df, measured_df, trades_df, market_index_df, imbalance_penalty_df, forecast_dfs):
+        measured_times = pd.DatetimeIndex(pd.to_datetime(measured_df['delivery_start']).unique()).sort_values()
+        trades_df = trades_df.assign(delivery_start=pd.to_datetime(trades_df['delivery_start']))
+        positions_df = net_positions(trades_df, measured_times)
+        time_index = measured_times.union(pd.DatetimeIndex(positions_df['delivery_start'])).sort_values()
+        core = cls(AssetRegistry(assets_df), time_index)
+        core.set_measured(measured_df)
+        core.set_positions(positions_df)
+        core.set_market_price(market_index_df)
+        core.set_imbalance_penalty(imbalance_penalty_df)
+        core.set_forecasts(forecast_dfs)
+        return core
+
+    # Function to reindex one column of a delivery_start frame onto the time index
+    def _series_on_index(self, df, column):
+        series = pd.Series(df[column].to_numpy(dtype=float), index=pd.to_datetime(df['delivery_start']))
+        return series[~series.index.duplicated()].reindex(self.time_index).to_numpy(dtype=float)
+
+    # Function to reindex several columns of a delivery_start frame onto the time index as a (columns, intervals) array
+    def _columns_on_index(self, df, columns):
+        by_time = df.set_index(pd.to_datetime(df['delivery_start']))
+        by_time = by_time[~by_time.index.duplicated()]
+        return by_time[list(columns)].reindex(self.time_index).to_numpy(dtype=float).T
+
+    # Measured production (MW) of every meter; marks the intervals present in measured_df
+    def set_measured(self, measured_df):
+        self.measured = self._columns_on_index(measured_df, self.metering_point_ids)
+        self.has_measured = self.time_index.isin(pd.to_datetime(measured_df['delivery_start']))
+
+    # Net positions (see trade_book.net_positions); marks the traded intervals
+    def set_positions(self, positions_df):
+        times = pd.DatetimeIndex(positions_df['delivery_start'])
+        quantity = pd.Series(positions_df['net_quantity'].to_numpy(dtype=float), index=times)
+        self.quantity = quantity.reindex(self.time_index, fill_value=0.0).to_numpy(dtype=float)
+        self.has_trade = self.time_index.isin(times)
+
+    # An existing allocation in the layout of trade_allocation.csv (e.g. the cached allocation stage)
+    def set_allocation(self, trade_allocation_df):
+        self.contribution = np.nan_to_num(self._columns_on_index(
+            trade_allocation_df, [f"{mp}_contribution" for mp in self.metering_point_ids]), nan=0.0)
+        self.has_trade = self.time_index.isin(pd.to_datetime(trade_allocation_df['delivery_start']))
+
+    # Revenue per interval in the layout of asset_revenue.csv
+    def set_revenue(self, asset_revenue_df):
+        self.revenue = self._columns_on_index(asset_revenue_df, [f"{mp}_revenue" for mp in self.metering_point_ids])
+
+    def set_market_price(self, market_index_df):
+        self.market_price = self._series_on_index(market_index_df, 'market_index_price')
+
+    def set_imbalance_penalty(self, imbalance_penalty_df):
+        self.imbalance_penalty = self._series_on_index(imbalance_penalty_df, 'imbalance_penalty')
+
+    # Forecasts (MW) of all assets, forecast_dfs mapping asset_id to its forecast frame; the frames are
+    # stacked and pivoted onto the time index once instead of being merged one asset at a time
+    def set_forecasts(self, forecast_dfs):
+        forecast_dfs = {asset_id: df for asset_id, df in forecast_dfs.items() if df is not None}
+        if not forecast_dfs:
+            return
+        forecast_long = pd.concat([df[['delivery_start', 'forecast']].assign(asset_id=asset_id)
+                                   for asset_id, df in forecast_dfs.items()])
+        forecast_long['delivery_start'] = pd.to_datetime(forecast_long['delivery_start'])
+        self.forecast = long_to_matrix(forecast_long, 'forecast', self.time_index, self.asset_ids)
+
+    # Allocate every interval's net position across all meters with the named strategy (see
+    # ALLOCATION_STRATEGIES); a meter outside its asset's contract takes no volume. The price-based
+    # strategies see the asset prices of the active contract terms (NaN outside a contract).
+    def allocate(self, strategy="merit_order"):
+        production = np.where(self.active, self.measured, 0.0)
+        prices = np.where(self.active, self.registry.price_matrix(self.time_index, self.market_price), np.nan)
+        contributions, self.remaining = allocate(strategy, self.quantity, production.T, prices.T, self.registry.capacity_kw)
+        self.contribution = contributions.T
+        return self.contribution
+
+    # Revenue of every asset in every interval under its active contract term
+    def compute_revenue(self):
+        prices = self.registry.price_matrix(self.time_index, self.market_price)
+        self.revenue = self.contribution * prices
+        return self.revenue
+
+    # Imbalance penalty of every asset in every interval; measured intervals without a measured value,
+    # forecast or penalty price are kept in missing_report and reported rather than left as silent NaN
+    # penalties
+    def compute_penalty(self):
+        measured_rows = self.has_measured
+        self.missing_report = missing_intervals(
+            self.time_index[measured_rows],
+            np.vstack([self.measured[:, measured_rows], self.forecast[:, measured_rows], self.imbalance_penalty[None, measured_rows]]),
+            [f"measured {mp}" for mp in self.metering_point_ids] + [f"forecast {asset_id}" for asset_id in self.asset_ids]
+            + ["imbalance_penalty"])
+        report_missing_intervals("imbalance penalty", self.missing_report)
+        self.penalty = imbalance_penalty_matrix(self.measured, self.forecast, self.imbalance_penalty)
+        return self.penalty
+
+    # Run allocation, revenue and penalty in one go
+    def run(self, strategy="merit_order"):
+        self.allocate(strategy)
+        self.compute_revenue()
+        self.compute_penalty()
+        return self
+
+    # Fee parts of every asset in every interval of the time index, traded or not, so capacity fees
+    # accrue over the whole settled period (see interval_fee_parts); days is the interval length in
+    # days, by default the step of the time index
+    def fee_parts(self, days=None):
+        days = interval_days(self.time_index) if days is None else days
+        return interval_fee_parts(self.registry, self.contribution, self.time_index, days)
+
+    # Per-asset totals needed for invoicing
+    def asset_totals(self):
+        traded = self.has_trade
+        return pd.DataFrame({
+            'asset_id': self.asset_ids,
+            'total_contribution': np.nansum(self.contribution[:, traded], axis=1),
+            'total_revenue': np.nansum(self.revenue[:, traded], axis=1),
+        })
+
+    # Invoice of every asset over the whole time index (the settled period), with the market-linked fees
+    # priced at avg_market_price
+    def invoices(self, avg_market_price):
+        fee_part, fee_weight = self.fee_parts()
+        return invoice_table(self.registry, fee_part.sum(axis=1), fee_weight.sum(axis=1),
+                             np.nansum(self.revenue[:, self.has_trade], axis=1), avg_market_price)
+
+    # Invoices of every asset for every billing period ('day' or 'month') of the time index in one pass:
+    # contributions, fee parts and revenue are summed per period with one groupby and the fees of all
+    # periods and assets are priced together; a period without trades is still charged its capacity
+    # fees. avg_market_price is a Series of the average market price by period label.
+    def invoices_by_period(self, period, avg_market_price):
+        periods_of_intervals = billing_periods(self.time_index, period)
+        fee_part, fee_weight = self.fee_parts()
+        revenue = np.where(self.has_trade, self.revenue, 0.0)
+        sums = {name: pd.DataFrame(values.T).groupby(periods_of_intervals).sum()
+                for name, values in [('contribution', self.contribution), ('revenue', revenue),
+                                     ('fee_part', fee_part), ('fee_weight', fee_weight)]}
+        periods = sums['contribution'].index
+        fees = invoice_fees(sums['fee_part'].to_numpy(), sums['fee_weight'].to_numpy(),
+                            avg_market_price.reindex(periods).to_numpy())
+        net_revenue, unit_net_revenue, gross_revenue = invoice_amounts(sums['revenue'].to_numpy(), fees, self.registry.capacity_kw)
+        return pd.DataFrame({
+            'billing_period': np.repeat(np.asarray(periods), len(self.asset_ids)),
+            'asset_id': np.tile(self.asset_ids, len(periods)),
+            'total_contribution': sums['contribution'].to_numpy().ravel(),
+            'fee': fees.ravel(),
+            'net_revenue': net_revenue.ravel(),
+            'unit_net_revenue': unit_net_revenue.ravel(),
+            'gross_revenue': gross_revenue.ravel(),
+        })
+
+    # Output frames in the layout of trade_allocation.csv, asset_revenue.csv and imbalance_penalties.csv
+    def allocation_frame(self):
+        traded = self.has_trade
+        columns = {'delivery_start': self.time_index[traded], 'quantity': self.quantity[traded]}
+        for i, mp in enumerate(self.metering_point_ids):
+            columns[f"{mp}_contribution"] = self.contribution[i, traded]
+        columns['remaining_quantity'] = self.remaining[traded]
+        return pd.DataFrame(columns)
+
+    def revenue_frame(self):
+        traded = self.has_trade
+        columns = {'delivery_start': self.time_index[traded]}
+        for i, mp in enumerate(self.metering_point_ids):
+            columns[f"{mp}_revenue"] = self.revenue[i, traded]
+        return pd.DataFrame(columns)
+
+    def penalty_frame(self):
+        measured_rows = self.has_measured
+        columns = {'delivery_start': self.time_index[measured_rows]}
+        for i, asset_id in enumerate(self.asset_ids):
+            columns[f"{asset_id}_penalty"] = self.penalty[i, measured_rows]
+        columns['total_penalty'] = self.penalty[:, measured_rows].sum(axis=0)
+        return pd.DataFrame(columns)
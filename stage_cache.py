@@ -0,0 +1,116 @@
+import hashlib
+import os
+import pickle
+
+# Function to fingerprint a file by its content
+def file_fingerprint(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to combine a stage name, its parameters and its upstream keys into one key
+def stage_key(name, params, dependency_keys):
+    digest = hashlib.sha256()
+    digest.update(name.encode())
+    digest.update(repr(sorted(params.items())).encode())
+    for key in dependency_keys:
+        digest.update(key.encode())
+    return digest.hexdigest()
+
+# On-disk cache of pickled stage outputs with least-recently-used eviction once max_bytes is exceeded
+class StageCache:
+    def __init__(self, cache_dir=".stage_cache", max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        os.utime(path)  # mark as recently used
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    # Drop the least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+# A small DAG of pipeline stages whose outputs are cached by the fingerprint of everything upstream
+# Sources are keyed by file content, stages by their name, parameters and upstream keys, so a
+# changed file only invalidates the stages downstream of it.
+class StageGraph:
+    def __init__(self, cache, code_fingerprint=""):
+        self.cache = cache
+        self.code_fingerprint = code_fingerprint
+        self.nodes = {}
+        self.keys = {}
+        self.values = {}
+        self.computed = []
+        self.reused = []
+
+    # Register an input file and the function that parses it
+    def add_source(self, name, file_path, loader):
+        self.nodes[name] = ('source', file_path, loader)
+
+    # Register a stage computed by func from the outputs of dependencies (passed positionally)
+    def add_stage(self, name, dependencies, func, params=None):
+        self.nodes[name] = ('stage', list(dependencies), func, dict(params or {}))
+
+    def key(self, name):
+        if name not in self.keys:
+            node = self.nodes[name]
+            if node[0] == 'source':
+                dependency_keys = [file_fingerprint(node[1])]
+                params = {'file': os.path.basename(node[1])}
+            else:
+                dependency_keys = [self.key(dependency) for dependency in node[1]]
+                params = node[3]
+            self.keys[name] = stage_key(name, dict(params, code=self.code_fingerprint), dependency_keys)
+        return self.keys[name]
+
+    # Return a node's output, from the cache when its key is unchanged
+    def get(self, name):
+        if name in self.values:
+            return self.values[name]
+        key = self.key(name)
+        value = self.cache.get(key)
+        if value is None:
+            node = self.nodes[name]
+            if node[0] == 'source':
+                value = node[2](node[1])
+            else:
+                value = node[2](*[self.get(dependency) for dependency in node[1]])
+            if value is None:
+                raise ValueError(f"Stage {name} produced no output")
+            self.cache.put(key, value)
+            self.computed.append(name)
+        else:
+            self.reused.append(name)
+        self.values[name] = value
+        return value
@@ -0,0 +1,207 @@
+import argparse
+import os
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from energy_trading5 import (load_csv_to_dataframe, load_json_to_dataframe, forecast_file_for_asset, ensure_datetime,
+                             allocate_positions, allocation_core, calculate_asset_revenue, calculate_imbalance_penalty,
+                             invoices_from_totals, save_dataframe)
+from settlement_core import AssetRegistry, interval_days
+from trade_book import add_positions, empty_positions, interval_nanoseconds, net_positions
+
+# Running per-asset aggregates carried from one chunk to the next; this is all invoicing needs
+class RunningTotals:
+    def __init__(self, asset_ids):
+        self.asset_ids = list(asset_ids)
+        self.total_contribution = np.zeros(len(self.asset_ids))
+        self.fee_part = np.zeros(len(self.asset_ids))
+        self.fee_weight = np.zeros(len(self.asset_ids))
+        self.total_revenue = np.zeros(len(self.asset_ids))
+        self.total_penalty = np.zeros(len(self.asset_ids))
+        self.market_price_sum = 0.0
+        self.market_price_count = 0
+        self.intervals = 0
+
+    # Fold one chunk's stage outputs into the totals; days is the length of its intervals in days
+    # Fees accrue over the chunk's measured intervals (the rows of imbalance_penalties_df), traded or not.
+    def update(self, registry, trade_allocation_df, asset_revenue_df, imbalance_penalties_df, market_index_df, days):
+        meter_columns = list(registry.metering_point_ids)
+        core = allocation_core(None, trade_allocation_df, registry, imbalance_penalties_df['delivery_start'])
+        fee_part, fee_weight = core.fee_parts(days)
+        self.total_contribution += core.contribution.sum(axis=1)
+        self.fee_part += fee_part.sum(axis=1)
+        self.fee_weight += fee_weight.sum(axis=1)
+        self.total_revenue += asset_revenue_df[[f"{mp}_revenue" for mp in meter_columns]].sum().to_numpy()
+        self.total_penalty += imbalance_penalties_df[[f"{asset_id}_penalty" for asset_id in self.asset_ids]].sum().to_numpy()
+        prices = market_index_df['market_index_price'].dropna()
+        self.market_price_sum += prices.sum()
+        self.market_price_count += len(prices)
+        self.intervals += len(imbalance_penalties_df)
+
+    # Merge the totals of another (disjoint) part of the billing period into these
+    def merge(self, other):
+        self.total_contribution += other.total_contribution
+        self.fee_part += other.fee_part
+        self.fee_weight += other.fee_weight
+        self.total_revenue += other.total_revenue
+        self.total_penalty += other.total_penalty
+        self.market_price_sum += other.market_price_sum
+        self.market_price_count += other.market_price_count
+        self.intervals += other.intervals
+        return self
+
+    def avg_market_price(self):
+        return self.market_price_sum / self.market_price_count if self.market_price_count else np.nan
+
+    def invoices(self, assets_df):
+        return invoices_from_totals(assets_df, dict(zip(self.asset_ids, self.fee_part)), dict(zip(self.asset_ids, self.fee_weight)),
+                                    dict(zip(self.asset_ids, self.total_revenue)), self.avg_market_price())
+
+# Function to list the delivery days in [start, end] that have a measured_YYYYMMDD.csv file
+def measured_files_in_range(data_dir, start, end):
+    day = start
+    while day <= end:
+        path = os.path.join(data_dir, f"measured_{day:%Y%m%d}.csv")
+        if os.path.exists(path):
+            yield day, path
+        else:
+            print(f"Warning: {path} not found, skipping {day}.")
+        day += timedelta(days=1)
+
+# Function to pick the per-day variant of an input file (e.g. trades_20241013.json) if present, else the shared file
+def daily_or_shared(data_dir, file_name, day):
+    stem, extension = os.path.splitext(file_name)
+    daily_path = os.path.join(data_dir, f"{stem}_{day:%Y%m%d}{extension}")
+    if os.path.exists(daily_path):
+        return daily_path, True
+    return os.path.join(data_dir, file_name), False
+
+# Shared input files already parsed in this process, keyed by (path, modification time), so that
+# backfill workers settling many partitions parse each shared file only once
+_shared_input_cache = {}
+
+# Per-day inputs are loaded for their day only; shared files are loaded once per process and sliced
+class DailyInputs:
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+
+    def load(self, file_name, day, loader):
+        path, is_daily = daily_or_shared(self.data_dir, file_name, day)
+        if is_daily or not os.path.exists(path):
+            return loader(path)
+        key = (os.path.abspath(path), os.path.getmtime(path))
+        if key not in _shared_input_cache:
+            _shared_input_cache[key] = loader(path)
+        return _shared_input_cache[key]
+
+# Function to keep the rows of a frame whose delivery_start lies in [window_start, window_end)
+def slice_window(df, window_start, window_end):
+    ensure_datetime(df)
+    return df[(df['delivery_start'] >= window_start) & (df['delivery_start'] < window_end)].reset_index(drop=True)
+
+# Function to net the previous day's trades still delivering after day_intervals[0] (block trades
+# across midnight) onto the day's intervals, keeping only the part delivered within the day
+def carried_positions(inputs, day, day_intervals):
+    previous_day = day - timedelta(days=1)
+    day_start, day_end = day_intervals[0], day_intervals[-1] + pd.Timedelta(interval_nanoseconds(day_intervals))
+    if not os.path.exists(daily_or_shared(inputs.data_dir, "trades.json", previous_day)[0]):
+        return empty_positions()
+    previous_df = slice_window(inputs.load("trades.json", previous_day, load_json_to_dataframe),
+                               day_start - pd.Timedelta(days=1), day_start)
+    if previous_df.empty or 'delivery_end' not in previous_df.columns:
+        return empty_positions()
+    previous_df = previous_df[pd.to_datetime(previous_df['delivery_end']) > day_start]
+    return slice_window(net_positions(previous_df, day_intervals), day_start, day_end)
+
+# Function to append a chunk's frame to an output CSV, writing the header only once
+def append_dataframe(df, output_file, first_chunk):
+    df.to_csv(output_file, index=False, sep=",", mode='w' if first_chunk else 'a', header=first_chunk)
+
+# Function to settle a date range day by day (or in chunks of chunk_rows measured intervals)
+# Yields each delivery day with its own RunningTotals; nothing else outlives the day.
+# The day's trades are netted once onto all its measured intervals (only the delivery_start column is
+# read for that), so partial-hour and block trades land in the same intervals as in the batch run
+# however the day is chunked. Block trades of the previous day delivered into this one (e.g. 23:00-01:00)
+# add their part after midnight, so each day stands alone like the backfill partitions. Every chunk
+# then takes the positions and inputs of its intervals [first, last + interval length).
+# Interval-level revenue and penalty rows are appended to the output CSVs as they are produced.
+def iter_daily_totals(start, end, data_dir=".", chunk_rows=None, write_interval_outputs=False):
+    assets_df = load_csv_to_dataframe(os.path.join(data_dir, "assets_base_data.csv"), delimiter=";")
+    if assets_df is None:
+        raise FileNotFoundError(f"Failed to load {os.path.join(data_dir, 'assets_base_data.csv')}")
+    registry = AssetRegistry(assets_df)
+    meter_columns = list(registry.metering_point_ids)
+    inputs = DailyInputs(data_dir)
+    first_chunk = True
+
+    for day, measured_file in measured_files_in_range(data_dir, start, end):
+        trades_df = inputs.load("trades.json", day, load_json_to_dataframe)
+        market_index_df = inputs.load("market_index_price.csv", day,
+                                      lambda path: load_csv_to_dataframe(path, delimiter=";", parse_dates=['delivery_start']))
+        imbalance_penalty_df = inputs.load("imbalance_penalty.csv", day,
+                                           lambda path: load_csv_to_dataframe(path, delimiter=";", parse_dates=['delivery_start']))
+        forecast_dfs = {asset_id: inputs.load(forecast_file_for_asset(asset_id), day,
+                                              lambda path: load_json_to_dataframe(path, flatten=True))
+                        for asset_id in registry.asset_ids}
+        if any(df is None for df in [trades_df, market_index_df, imbalance_penalty_df] + list(forecast_dfs.values())):
+            raise FileNotFoundError(f"Inputs for {day} failed to load")
+
+        day_totals = RunningTotals(registry.asset_ids)
+        day_intervals = pd.DatetimeIndex(pd.read_csv(measured_file, delimiter=";", usecols=['delivery_start'],
+                                                     parse_dates=['delivery_start'])['delivery_start'].unique()).sort_values()
+        interval = pd.Timedelta(interval_nanoseconds(day_intervals))
+        day_start, day_end = day_intervals[0], day_intervals[-1] + interval
+        positions_df = net_positions(slice_window(trades_df, day_start, day_end), day_intervals)
+        positions_df = add_positions(positions_df, carried_positions(inputs, day, day_intervals))
+        chunks = pd.read_csv(measured_file, delimiter=";", parse_dates=['delivery_start'], chunksize=chunk_rows)
+        for measured_df in ([chunks] if chunk_rows is None else chunks):
+            measured_df[meter_columns] = measured_df[meter_columns] / 1000
+            window_start, window_end = measured_df['delivery_start'].min(), measured_df['delivery_start'].max() + interval
+            positions_chunk = slice_window(positions_df, window_start, window_end)
+            market_chunk = slice_window(market_index_df, window_start, window_end)
+            penalty_chunk = slice_window(imbalance_penalty_df, window_start, window_end)
+            forecast_chunks = {asset_id: slice_window(df, window_start, window_end) for asset_id, df in forecast_dfs.items()}
+
+            trade_allocation_df = allocate_positions(positions_chunk, measured_df, registry)
+            asset_revenue_df = calculate_asset_revenue(assets_df, trade_allocation_df, market_chunk)
+            imbalance_penalties_df = calculate_imbalance_penalty(assets_df, measured_df, forecast_chunks, penalty_chunk)
+            day_totals.update(registry, trade_allocation_df, asset_revenue_df, imbalance_penalties_df, market_chunk,
+                              interval_days(day_intervals))
+
+            if write_interval_outputs:
+                append_dataframe(asset_revenue_df, "asset_revenue.csv", first_chunk)
+                append_dataframe(imbalance_penalties_df, "imbalance_penalties.csv", first_chunk)
+            first_chunk = False
+        yield day, day_totals
+
+# Function to settle a date range with bounded memory, folding the daily totals in date order
+def stream_settlement(start, end, data_dir=".", chunk_rows=None, write_interval_outputs=True):
+    assets_df = load_csv_to_dataframe(os.path.join(data_dir, "assets_base_data.csv"), delimiter=";")
+    if assets_df is None:
+        print("Failed to load assets_base_data.csv. Exiting.")
+        return None
+    totals = RunningTotals(AssetRegistry(assets_df).asset_ids)
+    try:
+        for day, day_totals in iter_daily_totals(start, end, data_dir, chunk_rows, write_interval_outputs):
+            totals.merge(day_totals)
+            print(f"Settled {day}: {totals.intervals} intervals so far.")
+    except FileNotFoundError as e:
+        print(f"Error: {e}. Exiting.")
+        return None
+    return totals
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Settle a range of delivery days with bounded memory.")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="first delivery day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="last delivery day (YYYY-MM-DD)")
+    parser.add_argument("--data-dir", default=".", help="directory with measured_YYYYMMDD.csv and the other inputs")
+    parser.add_argument("--chunk-rows", type=int, default=None, help="measured intervals per chunk (default: one day)")
+    parser.add_argument("--no-interval-outputs", action="store_true",
+                        help="only write asset_invoices.csv, not the interval-level revenue and penalty files")
+    args = parser.parse_args()
+
+    totals = stream_settlement(args.start, args.end, data_dir=args.data_dir, chunk_rows=args.chunk_rows,
+                               write_interval_outputs=not args.no_interval_outputs)
+    if totals is not None:
+        assets_df = load_csv_to_dataframe(os.path.join(args.data_dir, "assets_base_data.csv"), delimiter=";")
+        save_dataframe(totals.invoices(assets_df), "asset_invoices.csv", "Asset invoices")
@@ -0,0 +1,61 @@
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Delivery day of the small dataset: six hourly intervals from 2024-10-13 00:00 UTC
+DAY_START = pd.Timestamp("2024-10-13 00:00", tz="UTC")
+HOURS = 6
+
+# Function to write one trade record as in trades.json
+def trade(start, end, quantity, side="sell", trade_id=1):
+    return {'delivery_start': pd.Timestamp(start, tz="UTC").isoformat(), 'delivery_end': pd.Timestamp(end, tz="UTC").isoformat(),
+            'execution_time': "2024-10-12T12:00:00+00:00", 'price': 80.0, 'quantity': quantity, 'side': side,
+            'trade_id': trade_id}
+
+# Trades of the small dataset: a full hour, two partial-hour products in the 01:00 interval (the last
+# interval of the first chunk with two rows per chunk) and a two-hour block across a chunk boundary
+TRADES = [
+    trade("2024-10-13 00:00", "2024-10-13 01:00", 1.0, trade_id=1),
+    trade("2024-10-13 01:15", "2024-10-13 01:30", 0.5, trade_id=2),
+    trade("2024-10-13 01:45", "2024-10-13 02:00", 0.2, side="buy", trade_id=3),
+    trade("2024-10-13 03:00", "2024-10-13 05:00", 2.0, trade_id=4),
+]
+
+# Function to write a small dataset in the layout of the repository inputs to data_dir
+# assets_rows replaces the rows of assets_base_data.csv (e.g. to add a second contract term) and times
+# the hourly intervals, which are all written to measured_20241013.csv.
+def write_dataset(data_dir, assets_rows=None, trades=TRADES, times=None):
+    times = times if times is not None else pd.date_range(DAY_START, periods=HOURS, freq="h")
+    assets_rows = assets_rows or [
+        "a_1;mp_1;1000;solar;2024-01-01;;fixed;10.0;fixed_as_produced;1.2;",
+        "a_2;mp_2;2000;wind;2024-01-01;;market;;fixed_for_capacity;0.5;",
+    ]
+    header = "asset_id;metering_point_id;capacity__kw;technology;contract_begin;contract_end;price_model;price__eur_per_mwh;" \
+             "fee_model;fee__eur_per_mwh;fee_percent"
+    with open(os.path.join(data_dir, "assets_base_data.csv"), "w") as file:
+        file.write("\n".join([header] + assets_rows) + "\n")
+    pd.DataFrame({'delivery_start': times, 'mp_1': 500.0, 'mp_2': 1500.0}).to_csv(
+        os.path.join(data_dir, "measured_20241013.csv"), sep=";", index=False)
+    pd.DataFrame({'delivery_start': times, 'market_index_price': 50.0 + 10.0 * np.arange(len(times))}).to_csv(
+        os.path.join(data_dir, "market_index_price.csv"), sep=";", index=False)
+    pd.DataFrame({'delivery_start': times, 'imbalance_penalty': 20.0}).to_csv(
+        os.path.join(data_dir, "imbalance_penalty.csv"), sep=";", index=False)
+    with open(os.path.join(data_dir, "trades.json"), "w") as file:
+        json.dump(trades, file)
+    for asset_id, forecast_kw in [("a1", 400.0), ("a2", 1600.0)]:
+        with open(os.path.join(data_dir, f"{asset_id}.json"), "w") as file:
+            json.dump({'asset_id': asset_id, 'values': {time.isoformat(): forecast_kw for time in times}}, file)
+    return data_dir
+
+# Small dataset in a temporary directory that is also the working directory (the pipeline reads its
+# inputs from there)
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return str(write_dataset(str(tmp_path)))
@@ -0,0 +1,45 @@
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+import energy_trading5
+from backfill import backfill
+from benchmark_backfill import same_totals
+from conftest import TRADES, trade, write_dataset
+from streaming_settlement import RunningTotals, iter_daily_totals
+
+START, END = date(2024, 10, 13), date(2024, 10, 15)
+
+# Three days of hourly values in one measured file per UTC day (and all of them in measured_all.csv
+# for the batch run); the second day has no trades and the last day one
+@pytest.fixture
+def three_days(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_dataset(str(tmp_path), times=pd.date_range("2024-10-13", periods=72, freq="h", tz="UTC"),
+                  trades=TRADES + [trade("2024-10-15 10:00", "2024-10-15 11:00", 0.8, trade_id=5)])
+    measured_df = pd.read_csv("measured_20241013.csv", delimiter=";", parse_dates=['delivery_start'])
+    measured_df.to_csv("measured_all.csv", sep=";", index=False)
+    for day, day_df in measured_df.groupby(measured_df['delivery_start'].dt.strftime("%Y%m%d")):
+        day_df.to_csv(f"measured_{day}.csv", sep=";", index=False)
+    return str(tmp_path)
+
+@pytest.mark.parametrize("partition, workers", [("day", 1), ("day", 2), ("week", 1)])
+def test_backfill_equals_the_serial_streaming_run(three_days, partition, workers):
+    serial = RunningTotals(['a_1', 'a_2'])
+    for day, day_totals in iter_daily_totals(START, END, data_dir=three_days):
+        serial.merge(day_totals)
+    totals = backfill(START, END, data_dir=three_days, partition=partition, workers=workers)
+    assert totals.intervals == 72
+    assert same_totals(totals, serial)
+
+def test_backfill_invoices_match_the_batch_run(three_days):
+    totals = backfill(START, END, data_dir=three_days, workers=1)
+    inputs = energy_trading5.load_inputs(measured_file="measured_all.csv")
+    outputs = energy_trading5.settle(inputs)
+    np.testing.assert_allclose(totals.invoices(inputs['assets'])['net_revenue'], outputs['asset_invoices']['net_revenue'])
+
+def test_same_totals_compares_the_fee_parts(three_days):
+    a = backfill(START, END, data_dir=three_days, workers=1)
+    b = backfill(START, END, data_dir=three_days, workers=1)
+    b.fee_weight = b.fee_weight + 1.0
+    assert not same_totals(a, b)
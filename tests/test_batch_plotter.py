@@ -0,0 +1,25 @@
+import os
+import energy_trading5
+import results_store
+from batch_plotter import load_results, render_batch
+
+def test_renders_every_chart_without_a_display(dataset, tmp_path):
+    energy_trading5.save_outputs(energy_trading5.settle(energy_trading5.load_inputs()))
+    results = load_results()
+    assert sorted(results['meter_to_asset'].values()) == ['a_1', 'a_2']
+
+    output_folder = str(tmp_path / "charts")
+    assert render_batch(results, ['a_1', 'a_2'], dpi=30, output_folder=output_folder, workers=2) == 3 + 2 * 3
+    charts = sorted(os.listdir(output_folder))
+    assert len(charts) == 9 and all(chart.endswith(".png") and os.path.getsize(os.path.join(output_folder, chart)) > 0
+                                    for chart in charts)
+
+def test_renders_from_the_results_database(dataset, tmp_path):
+    inputs = energy_trading5.load_inputs()
+    results_store.store_results(energy_trading5.settle(inputs), inputs['assets'], "results.sqlite",
+                                market_index_df=inputs['market_index'])
+    results = load_results(results_db="results.sqlite", start="2024-10-13 02:00", end="2024-10-13 04:00")
+    assert len(results['imbalance_penalties']) == 2
+    output_folder = str(tmp_path / "charts")
+    assert render_batch(results, ['a_2'], dpi=30, output_folder=output_folder, workers=1, fleet_charts=False) == 3
+    assert len(os.listdir(output_folder)) == 3
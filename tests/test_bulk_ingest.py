@@ -0,0 +1,25 @@
+import json
+import pytest
+from bulk_ingest import iter_json_array, load_trades_streaming
+
+RECORDS = [{'trade_id': i, 'quantity': i / 10, 'side': "sell"} for i in range(50)]
+
+@pytest.mark.parametrize("prefix", ["", "\n", " \n\t" * 40])
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_array_elements_are_read_across_chunks(tmp_path, prefix, chunk_size):
+    path = tmp_path / "trades.json"
+    path.write_text(prefix + json.dumps(RECORDS, indent=2) + "\n")
+    assert list(iter_json_array(str(path), chunk_size=chunk_size)) == RECORDS
+
+@pytest.mark.parametrize("text", ["", "   \n", '{"trade_id": 1}', "  null"])
+def test_file_without_an_array_raises_a_clear_error(tmp_path, text):
+    path = tmp_path / "trades.json"
+    path.write_text(text)
+    with pytest.raises(ValueError, match="does not hold a JSON array"):
+        list(iter_json_array(str(path), chunk_size=4))
+    assert load_trades_streaming(str(path)) is None
+
+def test_empty_array_yields_nothing(tmp_path):
+    path = tmp_path / "trades.json"
+    path.write_text("  [ ]  ")
+    assert list(iter_json_array(str(path), chunk_size=2)) == []
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import pytest
+import energy_trading5
+from columnar_storage import import_archive, read_table, storage_path, write_table
+
+pytest.importorskip("pyarrow")
+
+@pytest.mark.parametrize("storage", ["arrow", "parquet"])
+def test_round_trip_keeps_types_and_reads_a_column_subset(tmp_path, storage):
+    df = pd.DataFrame({'delivery_start': pd.date_range("2024-10-13", periods=4, freq="h", tz="UTC"),
+                       'mp_1_revenue': [1.0, np.nan, 3.0, 4.0], 'asset_id': ['a_1', 'a_2', 'a_1', 'a_2']})
+    path = storage_path(str(tmp_path / "asset_revenue.csv"), storage)
+    write_table(df, path)
+    pd.testing.assert_frame_equal(read_table(path), df)
+    subset = read_table(path, columns=['delivery_start', 'mp_1_revenue'])
+    assert list(subset.columns) == ['delivery_start', 'mp_1_revenue']
+    assert str(subset['delivery_start'].dt.tz) == "UTC"
+
+@pytest.mark.parametrize("storage", ["arrow", "parquet"])
+def test_columnar_inputs_settle_like_the_csv_files(dataset, storage):
+    expected = energy_trading5.settle(energy_trading5.load_inputs())
+    import_archive(dataset, dataset, storage)
+    outputs = energy_trading5.settle(energy_trading5.load_inputs(storage=storage))
+    for name in ['trade_allocation', 'asset_revenue', 'asset_invoices', 'imbalance_penalties']:
+        pd.testing.assert_frame_equal(outputs[name], expected[name])
+
+    energy_trading5.save_outputs(outputs, storage=storage)
+    invoices_df = read_table(storage_path("asset_invoices.csv", storage), columns=['asset_id', 'net_revenue'])
+    np.testing.assert_allclose(invoices_df['net_revenue'], expected['asset_invoices']['net_revenue'])
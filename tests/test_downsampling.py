@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from downsampling import lttb_indices, minmax_indices
+
+@pytest.mark.parametrize("max_points", [3, 10, 100])
+def test_lttb_keeps_the_end_points_and_one_point_per_bucket(max_points):
+    values = np.random.default_rng(2).normal(size=1000)
+    selected = lttb_indices(np.arange(1000), values, max_points)
+    assert len(selected) == max_points
+    assert selected[0] == 0 and selected[-1] == 999
+    assert (np.diff(selected) > 0).all()
+
+def test_lttb_keeps_a_single_spike():
+    values = np.zeros(1000)
+    values[417] = 50.0
+    assert 417 in lttb_indices(np.arange(1000), values, 20)
+
+def test_short_series_is_kept_whole():
+    np.testing.assert_array_equal(lttb_indices(np.arange(5), np.arange(5.0), 10), np.arange(5))
+
+def test_minmax_keeps_the_extremes():
+    values = np.random.default_rng(4).normal(size=1000)
+    selected = minmax_indices(values, 50)
+    assert np.argmin(values) in selected and np.argmax(values) in selected
+    assert len(selected) <= 50 + 2
@@ -0,0 +1,58 @@
+import os
+import warnings
+import pandas as pd
+import pytest
+import energy_trading5
+from compare_allocation import compare_allocation_strategies
+from conftest import write_dataset
+
+def test_missing_forecast_is_reported_without_frame_attrs(dataset, tmp_path):
+    inputs = energy_trading5.load_inputs()
+    forecasts = dict(inputs['forecasts'], a_2=inputs['forecasts']['a_2'].iloc[1:])
+    penalties_df, report = energy_trading5.calculate_imbalance_penalty(inputs['assets'], inputs['measured'], forecasts,
+                                                                       inputs['imbalance_penalty'], with_report=True)
+    assert list(report['input']) == ["forecast a_2"]
+    assert report['delivery_start'].iloc[0] == inputs['measured']['delivery_start'].iloc[0]
+    assert penalties_df.attrs == {}
+
+    pytest.importorskip("pyarrow")
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        energy_trading5.save_dataframe(penalties_df, str(tmp_path / "imbalance_penalties.arrow"), "Imbalance penalties")
+
+def test_empty_trades_file_settles_to_capacity_fees_only(dataset):
+    with open("trades.json", "w") as file:
+        file.write("[]")
+    inputs = energy_trading5.load_inputs()
+    assert list(inputs['trades'].columns) == list(energy_trading5.load_json_to_dataframe("trades.json").columns)
+    assert {'delivery_start', 'delivery_end', 'quantity', 'side'} <= set(inputs['trades'].columns)
+
+    outputs = energy_trading5.settle(inputs, billing_period="day", with_trade_pnl=True)
+    assert outputs['trade_allocation'].empty
+    # a_2's capacity fee (2 MW x 0.5 per day over 6 hours) is due whether or not anything traded
+    assert outputs['asset_invoices']['net_revenue'].tolist() == pytest.approx([0.0, 0.25])
+    assert outputs['asset_invoices_by_period']['net_revenue'].sum() == pytest.approx(0.25)
+
+def test_capacity_fee_accrues_over_the_measured_period(dataset):
+    # Nothing trades at 02:00 and 05:00; a_2's capacity fee (2 MW x 0.5 per day) still covers all six hours
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    revenue = outputs['asset_revenue']['mp_2_revenue'].sum()
+    invoice = outputs['asset_invoices'].set_index('asset_id').loc['a_2']
+    assert invoice['net_revenue'] - revenue == pytest.approx(0.25)
+    comparison = compare_allocation_strategies(inputs)
+    assert comparison.loc[comparison['asset_id'] == 'a_2', 'fee'].tolist() == pytest.approx([0.25] * 4)
+
+def test_day_without_trades_is_billed_its_capacity_fee(tmp_path):
+    # Two UTC days of hourly values, trades only in the first six hours (all on 13 October local time)
+    write_dataset(str(tmp_path), times=pd.date_range("2024-10-13 00:00", periods=48, freq="h", tz="UTC"))
+    os.chdir(tmp_path)
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs, billing_period="day")
+    by_day = outputs['asset_invoices_by_period'].set_index(['billing_period', 'asset_id'])
+    assert list(by_day.index.get_level_values('billing_period').unique()) == ["2024-10-13", "2024-10-14", "2024-10-15"]
+    # Local days of 22, 24 and 2 hours; a_2 has no revenue on the 14th and 15th, only its capacity fee
+    assert by_day['fee'].xs('a_2', level='asset_id').tolist() == pytest.approx([22 / 24, 1.0, 2 / 24])
+    assert by_day.loc[("2024-10-14", 'a_2'), 'net_revenue'] == pytest.approx(1.0)
+    assert by_day.loc[("2024-10-14", 'a_1'), 'net_revenue'] == pytest.approx(0.0)
+    assert outputs['asset_invoices']['net_revenue'].sum() == pytest.approx(by_day['net_revenue'].sum())
@@ -0,0 +1,33 @@
+import json
+import os
+import pandas as pd
+import pytest
+import energy_trading5
+from instrumentation import RunMetrics, count_rows
+
+def test_pipeline_writes_per_stage_metrics(dataset):
+    energy_trading5.main(metrics_file="run_metrics.json", profile_stages=['calculate_invoices'], trace_memory=True)
+    with open("run_metrics.json") as file:
+        metrics = json.load(file)
+    stages = {record['stage']: record for record in metrics['stages']}
+    assert {'load_inputs', 'match_trades_with_measured', 'calculate_asset_revenue', 'calculate_invoices',
+            'calculate_imbalance_penalty', 'save_outputs'} <= set(stages)
+    assert stages['calculate_imbalance_penalty']['rows_out'] == 6
+    assert stages['match_trades_with_measured']['rows_out'] == 4
+    for record in metrics['stages']:
+        assert record['wall_s'] >= 0 and record['cpu_s'] >= 0 and record['peak_rss_mb'] > 0
+        assert 'tracemalloc_peak_mb' in record
+    assert os.path.exists(stages['calculate_invoices']['profile'])
+    assert 'profile' not in stages['load_inputs']
+    assert metrics['total_wall_s'] >= sum(record['wall_s'] for record in metrics['stages'])
+
+def test_failing_stage_is_still_recorded():
+    metrics = RunMetrics("test")
+    with pytest.raises(RuntimeError):
+        with metrics.stage('broken', rows_in=pd.DataFrame({'a': [1, 2]})):
+            raise RuntimeError("stage failed")
+    assert metrics.stages[0]['stage'] == 'broken' and metrics.stages[0]['rows_in'] == 2
+
+def test_count_rows_sums_nested_frames():
+    frame = pd.DataFrame({'a': range(3)})
+    assert count_rows({'trades': frame, 'forecasts': {'a_1': frame, 'a_2': None}, 'pair': [frame, frame]}) == 12
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import numpy as np
+import pytest
+import energy_trading5
+from conftest import write_dataset
+from live_settlement import LiveSettlement, consume, replay, replay_events
+
+# Function to replay the input files of the working directory through the live service
+def replay_all(assets_df):
+    service = LiveSettlement(assets_df)
+    events = replay_events(assets_df)
+
+    async def run():
+        queue = asyncio.Queue()
+        await asyncio.gather(replay(queue, events), consume(service, queue))
+    asyncio.run(run())
+    return service, events
+
+def test_live_totals_and_invoices_match_the_batch_run(dataset):
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    service, events = replay_all(inputs['assets'])
+    assert service.events == len(events)
+    totals = service.totals()
+    np.testing.assert_allclose([totals[asset_id]['total_contribution'] for asset_id in ['a_1', 'a_2']],
+                               outputs['trade_allocation'][['mp_1_contribution', 'mp_2_contribution']].sum())
+    np.testing.assert_allclose([totals[asset_id]['total_penalty'] for asset_id in ['a_1', 'a_2']],
+                               outputs['imbalance_penalties'][['a_1_penalty', 'a_2_penalty']].sum())
+    np.testing.assert_allclose(service.invoices()['net_revenue'], outputs['asset_invoices']['net_revenue'])
+    assert set(service.latency_stats()) >= {'events', 'trade', 'measured'}
+
+def test_multi_term_asset_is_replayed_once(tmp_path):
+    write_dataset(str(tmp_path), assets_rows=[
+        "a_1;mp_1;1000;solar;2024-01-01;2024-10-12;fixed;10.0;fixed_as_produced;1.2;",
+        "a_2;mp_2;2000;wind;2024-01-01;;market;;fixed_for_capacity;0.5;",
+        "a_1;mp_1;1000;solar;2024-10-13;;fixed;12.0;fixed_as_produced;1.0;",
+    ])
+    os.chdir(tmp_path)
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    service, events = replay_all(inputs['assets'])
+    assert sum(kind == 'forecast' for _, kind, _ in events) == 2 * 6
+    np.testing.assert_allclose(service.invoices()['net_revenue'], outputs['asset_invoices']['net_revenue'])
+    assert service.invoices()['net_revenue'].iloc[0] == pytest.approx(outputs['trade_allocation']['mp_1_contribution'].sum() * 13.0)
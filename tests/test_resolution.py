@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+import energy_trading5
+from resolution import align_inputs, infer_resolution, resample_to_resolution
+
+# Function to build an interval frame with an energy and a price column at the given resolution
+def interval_frame(periods, freq, seed=5):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'delivery_start': pd.date_range("2024-10-13", periods=periods, freq=freq, tz="UTC"),
+                         'mp_1': rng.uniform(0, 500, periods), 'price': rng.uniform(20, 120, periods)})
+
+@pytest.mark.parametrize("source, periods, target", [("15min", 96, "1h"), ("1h", 24, "15min"), ("1h", 24, "1h")])
+def test_resampling_preserves_energy_totals(source, periods, target):
+    df = interval_frame(periods, source)
+    resampled = resample_to_resolution(df, {'mp_1': 'energy', 'price': 'price'}, target)
+    assert infer_resolution(resampled['delivery_start']) == pd.Timedelta(target)
+    assert resampled['mp_1'].sum() == pytest.approx(df['mp_1'].sum())
+    assert resampled['delivery_start'].min() == df['delivery_start'].min()
+
+def test_downsampling_averages_prices():
+    df = interval_frame(8, "15min")
+    resampled = resample_to_resolution(df, {'mp_1': 'energy', 'price': 'price'}, "1h")
+    np.testing.assert_allclose(resampled['price'], df['price'].to_numpy().reshape(2, 4).mean(axis=1))
+
+def test_block_trade_is_split_over_the_target_intervals():
+    trades_df = pd.DataFrame({'delivery_start': pd.to_datetime(["2024-10-13 03:00"], utc=True),
+                              'delivery_end': pd.to_datetime(["2024-10-13 05:00"], utc=True), 'quantity': [2.0]})
+    resampled = resample_to_resolution(trades_df, {'quantity': 'energy'}, "1h",
+                                       trades_df['delivery_end'] - trades_df['delivery_start'])
+    assert list(resampled['quantity']) == [1.0, 1.0]
+    assert list(resampled['delivery_end'] - resampled['delivery_start']) == [pd.Timedelta(hours=1)] * 2
+
+def test_aligned_inputs_keep_energy_totals_and_prices(dataset):
+    inputs = energy_trading5.load_inputs()
+    aligned = align_inputs(inputs, "15min")
+    assert len(aligned['measured']) == 4 * len(inputs['measured'])
+    np.testing.assert_allclose(aligned['measured'][['mp_1', 'mp_2']].sum(), inputs['measured'][['mp_1', 'mp_2']].sum())
+    for asset_id, forecast_df in inputs['forecasts'].items():
+        assert aligned['forecasts'][asset_id]['forecast'].sum() == pytest.approx(forecast_df['forecast'].sum())
+    # Buys are netted by sign, the 01:15 and 01:45 quarter-hour products keep their own interval
+    assert aligned['trades']['quantity'].sum() == pytest.approx(1.0 + 0.5 - 0.2 + 2.0)
+    assert 'side' not in aligned['trades'].columns
+    assert aligned['market_index']['market_index_price'].iloc[:4].tolist() == [50.0] * 4
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+import energy_trading5
+import results_store
+from conftest import DAY_START
+from streaming_settlement import slice_window
+
+# Function to settle the small dataset, only the intervals in [start, end) if given, and store the run
+def store_run(database, start=None, end=None):
+    inputs = energy_trading5.load_inputs()
+    if start is not None:
+        start, end = DAY_START + pd.Timedelta(start), DAY_START + pd.Timedelta(end)
+        inputs = {name: df if name == 'assets' else slice_window(df, start, end) for name, df in inputs.items() if name != 'forecasts'}
+        inputs['forecasts'] = {asset_id: slice_window(df, start, end) for asset_id, df in energy_trading5.load_inputs()['forecasts'].items()}
+    outputs = energy_trading5.settle(inputs)
+    results_store.store_results(outputs, inputs['assets'], database, market_index_df=inputs['market_index'])
+    return outputs
+
+def test_range_invoices_match_the_pipeline(dataset):
+    outputs = store_run("results.sqlite")
+    expected = outputs['asset_invoices']
+    for invoices_df in [results_store.read_invoices("results.sqlite"),
+                        results_store.read_invoices("results.sqlite", start=DAY_START, end=DAY_START + pd.Timedelta("1D"))]:
+        assert list(invoices_df['asset_id']) == list(expected['asset_id'])
+        for column in ['net_revenue', 'unit_net_revenue', 'gross_revenue']:
+            np.testing.assert_allclose(invoices_df[column], expected[column])
+    assert results_store.read_invoices("results.sqlite", start="2024-11-01").empty
+
+def test_partial_resettlement_counts_every_interval_once(dataset):
+    full = store_run("results.sqlite")['asset_invoices']
+    # Re-settle 03:00-06:00 only: these intervals now come from the second run, the others from the first
+    store_run("results.sqlite", "3h", "6h")
+    day = results_store.read_invoices("results.sqlite", start=DAY_START, end=DAY_START + pd.Timedelta("1D"))
+    np.testing.assert_allclose(day['net_revenue'], full['net_revenue'])
+    halves = [results_store.read_invoices("results.sqlite", asset_ids=['a_2'], start=DAY_START + pd.Timedelta(start),
+                                          end=DAY_START + pd.Timedelta(end)) for start, end in [("0h", "3h"), ("3h", "6h")]]
+    assert sum(half['net_revenue'].iloc[0] for half in halves) == pytest.approx(full['net_revenue'].iloc[1])
+
+def test_resettled_interval_replaces_its_rows(dataset):
+    store_run("results.sqlite")
+    store_run("results.sqlite", "3h", "6h")
+    revenue_df = results_store.read_revenue("results.sqlite", start=DAY_START + pd.Timedelta("3h"))
+    assert len(revenue_df) == 2
+    assert results_store.read_revenue("results.sqlite")['mp_2_revenue'].notna().sum() == 4
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+import energy_trading5
+from rollup_cube import RollupCube
+from settlement_core import billing_periods
+
+# Function to build a cube of two assets over 40 days of hourly intervals with random values
+def random_cube(seed=7):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range("2024-09-20", periods=40 * 24, freq="h", tz="UTC")
+    cube = RollupCube(['a_1', 'a_2'], ['mp_1', 'mp_2'])
+    values = {measure: rng.uniform(0, 10, (2, len(times))) for measure in ['contribution', 'revenue', 'penalty']}
+    cube.append(times, values['contribution'], values['revenue'], values['penalty'], rng.uniform(20, 120, len(times)))
+    return cube, times, values
+
+@pytest.mark.parametrize("level", ["day", "month"])
+@pytest.mark.parametrize("start, end", [(None, None), ("2024-09-21 13:00", "2024-10-03 05:00"),
+                                        ("2024-09-30 20:00", "2024-10-01 02:00"), ("2024-10-02 10:00", "2024-10-02 11:00")])
+def test_level_series_clips_the_periods_cut_by_the_range(level, start, end):
+    cube, times, values = random_cube()
+    in_range = np.ones(len(times), dtype=bool)
+    if start is not None:
+        in_range &= (times >= pd.Timestamp(start, tz="UTC")) & (times < pd.Timestamp(end, tz="UTC"))
+    expected = pd.DataFrame(values['revenue'][:, in_range].T).groupby(billing_periods(times[in_range], level)).sum()
+
+    series = cube.series('revenue', start=start, end=end, level=level)
+    np.testing.assert_allclose(series[['mp_1_revenue', 'mp_2_revenue']].to_numpy(), expected.to_numpy())
+    np.testing.assert_allclose(series[['mp_1_revenue', 'mp_2_revenue']].sum().to_numpy(), cube.total('revenue', start, end))
+    assert series['delivery_start'].iloc[0] == times[in_range][0]
+
+def test_cube_invoices_match_the_pipeline(dataset):
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    cube = RollupCube.from_outputs(outputs, inputs['assets'], inputs['market_index'])
+    np.testing.assert_allclose(cube.invoices(inputs['assets'])['net_revenue'], outputs['asset_invoices']['net_revenue'])
+    by_day = energy_trading5.calculate_invoices_by_period(inputs['assets'], outputs['trade_allocation'], outputs['asset_revenue'],
+                                                          inputs['market_index'], 'day',
+                                                          settled_intervals=energy_trading5.measured_intervals(inputs['measured']))
+    np.testing.assert_allclose(cube.invoices_by_period(inputs['assets'], 'day')['net_revenue'], by_day['net_revenue'])
+
+def test_cube_charges_capacity_fees_in_intervals_without_trades(dataset):
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    cube = RollupCube.from_outputs(outputs, inputs['assets'], inputs['market_index'])
+    # a_2 pays 2 MW x 0.5 per day over all six measured hours, also the untraded 02:00 and 05:00
+    assert cube.total('fee_part')[1] == pytest.approx(0.25)
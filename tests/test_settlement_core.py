@@ -0,0 +1,69 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import energy_trading5
+from benchmark_allocation import allocate_with_iterrows, make_merged_frame
+from scenario_engine import ScenarioEngine
+from settlement_core import (ALLOCATION_STRATEGIES, AssetRegistry, SettlementCore, allocate, allocate_merit_order,
+                             interval_fee_parts)
+
+# Function to build the settlement core of the loaded inputs
+def core_from_inputs(inputs):
+    return SettlementCore.from_frames(inputs['assets'], inputs['measured'], inputs['trades'], inputs['market_index'],
+                                      inputs['imbalance_penalty'], inputs['forecasts'])
+
+@pytest.mark.parametrize("strategy", list(ALLOCATION_STRATEGIES))
+def test_core_nets_partial_hour_and_block_trades_like_the_pipeline(dataset, strategy):
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs, allocation_strategy=strategy)
+    core = core_from_inputs(inputs).run(strategy)
+
+    allocation = core.allocation_frame()
+    np.testing.assert_array_equal(allocation['delivery_start'], outputs['trade_allocation']['delivery_start'])
+    np.testing.assert_allclose(allocation.drop(columns='delivery_start'), outputs['trade_allocation'].drop(columns='delivery_start'))
+    np.testing.assert_allclose(core.asset_totals()['total_revenue'],
+                               outputs['asset_revenue'][['mp_1_revenue', 'mp_2_revenue']].sum().to_numpy())
+
+def test_scenarios_without_volatility_reproduce_the_deterministic_revenue(dataset):
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    engine = ScenarioEngine(core_from_inputs(inputs), production_sigma=0.0, price_sigma=0.0, penalty_sigma=0.0)
+    revenue, penalty = engine.run(scenarios=3)
+    np.testing.assert_allclose(revenue, np.tile(outputs['asset_revenue'][['mp_1_revenue', 'mp_2_revenue']].sum().to_numpy(), (3, 1)))
+
+def test_merit_order_kernel_matches_the_baseline_loop():
+    merged_df = make_merged_frame(500, 5, seed=3)
+    meter_columns = [f"mp_{i}" for i in range(1, 6)]
+    expected = allocate_with_iterrows(merged_df, meter_columns)
+    contributions, remaining = allocate_merit_order(merged_df['quantity'].to_numpy(), merged_df[meter_columns].to_numpy())
+    np.testing.assert_array_equal(contributions, expected[[f"{mp}_contribution" for mp in meter_columns]].to_numpy())
+    np.testing.assert_array_equal(remaining, expected['remaining_quantity'].to_numpy())
+
+@pytest.mark.parametrize("strategy", list(ALLOCATION_STRATEGIES))
+def test_every_strategy_allocates_within_production(strategy):
+    rng = np.random.default_rng(11)
+    quantity = rng.uniform(0, 6, 200)
+    production = rng.uniform(0, 2, (200, 4))
+    prices = rng.uniform(5, 50, (200, 4))
+    contributions, remaining = allocate(strategy, quantity, production, prices, np.array([1000.0, 2000.0, 500.0, 5000.0]))
+    assert (contributions >= 0).all() and (contributions <= production + 1e-12).all()
+    np.testing.assert_allclose(contributions.sum(axis=1), np.minimum(quantity, production.sum(axis=1)))
+    np.testing.assert_allclose(remaining, np.maximum(0.0, quantity - production.sum(axis=1)))
+
+def test_multi_term_asset_is_priced_and_charged_under_its_active_term():
+    assets_df = pd.read_csv(io.StringIO(
+        "asset_id;metering_point_id;capacity__kw;technology;contract_begin;contract_end;price_model;price__eur_per_mwh;"
+        "fee_model;fee__eur_per_mwh;fee_percent\n"
+        "a_1;mp_1;1000;solar;2024-01-01;2024-10-12;fixed;10.0;fixed_as_produced;1.2;\n"
+        "a_2;mp_2;2000;wind;2024-10-14;;market;;fixed_for_capacity;0.5;\n"
+        "a_1;mp_1;1000;solar;2024-10-13;;fixed;12.0;fixed_as_produced;1.0;\n"), delimiter=";")
+    registry = AssetRegistry(assets_df)
+    assert list(registry.asset_ids) == ['a_1', 'a_2']
+    # Local midnight of 2024-10-13 is 22:00 UTC the day before
+    times = pd.DatetimeIndex(["2024-10-12 21:00", "2024-10-12 22:00", "2024-10-13 22:00"], tz="UTC")
+    np.testing.assert_array_equal(registry.active_terms(times), [[0, 2, 2], [-1, -1, 1]])
+    np.testing.assert_allclose(registry.price_matrix(times, [50.0, 60.0, 70.0]), [[10.0, 12.0, 12.0], [0.0, 0.0, 70.0]])
+    parts, weights = interval_fee_parts(registry, np.ones((2, 3)), times, 1 / 24)
+    np.testing.assert_allclose(parts, [[1.2, 1.0, 1.0], [0.0, 0.0, 2 * 0.5 / 24]])
+    assert not weights.any()
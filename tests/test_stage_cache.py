@@ -0,0 +1,33 @@
+import json
+import pandas as pd
+import pytest
+import energy_trading5
+from stage_cache import StageCache
+
+NAMES = ['trade_allocation', 'asset_revenue', 'asset_invoices', 'imbalance_penalties']
+
+# Function to build the stage graph on the cache directory and evaluate the pipeline outputs
+def run_graph(cache_dir):
+    graph = energy_trading5.build_stage_graph(StageCache(cache_dir))
+    return graph, {name: graph.get(name) for name in NAMES}
+
+def test_cached_outputs_match_the_uncached_run(dataset, tmp_path):
+    graph, outputs = run_graph(str(tmp_path / "cache"))
+    expected = energy_trading5.settle(energy_trading5.load_inputs())
+    for name in NAMES:
+        pd.testing.assert_frame_equal(outputs[name], expected[name])
+
+def test_changed_forecast_only_recomputes_its_branch(dataset, tmp_path):
+    run_graph(str(tmp_path / "cache"))
+    graph, outputs = run_graph(str(tmp_path / "cache"))
+    assert graph.computed == [] and 'trade_allocation' in graph.reused
+
+    with open("a2.json") as file:
+        forecast = json.load(file)
+    forecast['values'] = {start: value + 100.0 for start, value in forecast['values'].items()}
+    with open("a2.json", "w") as file:
+        json.dump(forecast, file)
+    graph, outputs = run_graph(str(tmp_path / "cache"))
+    assert sorted(graph.computed) == ['forecast_a_2', 'imbalance_penalties']
+    # a_2 produces 1.5 MW against a forecast now 0.1 MW higher, at a penalty price of 20
+    assert outputs['imbalance_penalties']['a_2_penalty'].tolist() == pytest.approx([(1.5 - 1.7) * 20.0] * 6)
@@ -0,0 +1,74 @@
+import os
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+import energy_trading5
+from conftest import trade, write_dataset
+from streaming_settlement import iter_daily_totals, slice_window
+
+DAY = date(2024, 10, 13)
+
+@pytest.mark.parametrize("chunk_rows", [None, 1, 2, 4])
+def test_chunked_totals_match_batch(dataset, chunk_rows):
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    contribution = outputs['trade_allocation'][['mp_1_contribution', 'mp_2_contribution']].sum().to_numpy()
+    revenue = outputs['asset_revenue'][['mp_1_revenue', 'mp_2_revenue']].sum().to_numpy()
+
+    (day, totals), = list(iter_daily_totals(DAY, DAY, data_dir=dataset, chunk_rows=chunk_rows))
+    np.testing.assert_allclose(totals.total_contribution, contribution)
+    np.testing.assert_allclose(totals.total_revenue, revenue)
+    np.testing.assert_allclose(totals.invoices(inputs['assets'])['net_revenue'], outputs['asset_invoices']['net_revenue'])
+    # a_2's capacity fee covers the untraded 02:00 and 05:00 intervals too
+    assert totals.fee_part[1] == pytest.approx(0.25)
+
+def test_partial_hour_trade_in_last_interval_of_a_chunk(dataset):
+    # Two rows per chunk: 01:00 is the last interval of the first chunk and holds the 01:15 sell
+    # (0.5) and the 01:45 buy (0.2); the 03:00-05:00 block crosses into the third chunk
+    (day, totals), = list(iter_daily_totals(DAY, DAY, data_dir=dataset, chunk_rows=2))
+    assert totals.total_contribution.sum() == pytest.approx(1.0 + 0.5 - 0.2 + 2.0)
+
+def test_slice_window_is_half_open(dataset):
+    trades_df = energy_trading5.load_json_to_dataframe("trades.json")
+    window = slice_window(trades_df, trades_df['delivery_start'].min(), trades_df['delivery_start'].max())
+    assert len(window) == len(trades_df) - 1
+
+def test_multi_term_asset_settles_under_its_current_term(tmp_path):
+    write_dataset(str(tmp_path), assets_rows=[
+        "a_1;mp_1;1000;solar;2024-01-01;2024-10-12;fixed;10.0;fixed_as_produced;1.2;",
+        "a_2;mp_2;2000;wind;2024-01-01;;market;;fixed_for_capacity;0.5;",
+        "a_1;mp_1;1000;solar;2024-10-13;;fixed;12.0;fixed_as_produced;1.0;",
+    ])
+    os.chdir(tmp_path)
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    allocation = outputs['trade_allocation']
+    np.testing.assert_allclose(outputs['asset_revenue']['mp_1_revenue'], allocation['mp_1_contribution'] * 12.0)
+    invoice = outputs['asset_invoices'].set_index('asset_id').loc['a_1']
+    assert invoice['net_revenue'] == pytest.approx(allocation['mp_1_contribution'].sum() * (12.0 + 1.0))
+
+    (day, totals), = list(iter_daily_totals(DAY, DAY, data_dir=str(tmp_path), chunk_rows=2))
+    np.testing.assert_allclose(totals.invoices(inputs['assets'])['net_revenue'], outputs['asset_invoices']['net_revenue'])
+
+def test_block_across_midnight_settles_like_the_two_day_batch(tmp_path):
+    times = pd.date_range("2024-10-13 20:00", periods=8, freq="h", tz="UTC")
+    write_dataset(str(tmp_path), times=times, trades=[trade("2024-10-13 22:00", "2024-10-13 23:00", 1.0, trade_id=1),
+                                                      trade("2024-10-13 23:00", "2024-10-14 01:00", 1.0, trade_id=2),
+                                                      trade("2024-10-14 01:00", "2024-10-14 03:00", 0.5, trade_id=3)])
+    os.chdir(tmp_path)
+    inputs = energy_trading5.load_inputs()
+    outputs = energy_trading5.settle(inputs)
+    allocation = outputs['trade_allocation'].set_index('delivery_start')
+    assert allocation['quantity'].tolist() == [1.0, 0.5, 0.5, 0.25, 0.25]
+
+    # One measured file per UTC day, the block's second half is delivered on the next day
+    measured_df = pd.read_csv("measured_20241013.csv", delimiter=";", parse_dates=['delivery_start'])
+    next_day = measured_df['delivery_start'] >= pd.Timestamp("2024-10-14", tz="UTC")
+    measured_df[~next_day].to_csv("measured_20241013.csv", sep=";", index=False)
+    measured_df[next_day].to_csv("measured_20241014.csv", sep=";", index=False)
+    days = list(iter_daily_totals(DAY, date(2024, 10, 14), data_dir=str(tmp_path), chunk_rows=2))
+    contribution = sum(totals.total_contribution for day, totals in days)
+    revenue = sum(totals.total_revenue for day, totals in days)
+    np.testing.assert_allclose(contribution, outputs['trade_allocation'][['mp_1_contribution', 'mp_2_contribution']].sum())
+    np.testing.assert_allclose(revenue, outputs['asset_revenue'][['mp_1_revenue', 'mp_2_revenue']].sum())
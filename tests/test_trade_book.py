@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+import energy_trading5
+from conftest import DAY_START, HOURS, trade
+from trade_book import interval_nanoseconds, net_positions
+
+# Function to build a trades frame from trade records as loaded from trades.json
+def trades_frame(records):
+    trades_df = pd.DataFrame(records)
+    for column in ['delivery_start', 'delivery_end', 'execution_time']:
+        trades_df[column] = pd.to_datetime(trades_df[column])
+    return trades_df
+
+def test_buys_are_netted_against_sells_per_interval():
+    trades_df = trades_frame([trade("2024-10-13 00:00", "2024-10-13 01:00", 3.0, trade_id=1),
+                              trade("2024-10-13 00:00", "2024-10-13 01:00", 1.0, side="buy", trade_id=2),
+                              trade("2024-10-13 01:00", "2024-10-13 02:00", 0.5, side="buy", trade_id=3)])
+    positions_df = net_positions(trades_df)
+    assert list(positions_df['sell_quantity']) == [3.0, 0.0]
+    assert list(positions_df['buy_quantity']) == [1.0, 0.5]
+    assert list(positions_df['net_quantity']) == [2.0, -0.5]
+    assert list(positions_df['trade_count']) == [2, 1]
+
+def test_partial_hour_and_block_trades_map_onto_the_measured_grid(dataset):
+    trades_df = energy_trading5.load_json_to_dataframe("trades.json")
+    time_index = pd.date_range(DAY_START, periods=HOURS, freq="h")
+    assert interval_nanoseconds(time_index) == pd.Timedelta(hours=1).value
+    positions_df = net_positions(trades_df, time_index)
+    assert list(positions_df['delivery_start']) == list(time_index[[0, 1, 3, 4]])
+    assert list(positions_df['net_quantity']) == pytest.approx([1.0, 0.5 - 0.2, 1.0, 1.0])
+    assert positions_df['net_quantity'].sum() == pytest.approx(net_positions(trades_df)['net_quantity'].sum())
+
+def test_single_interval_grid_defaults_to_one_hour():
+    assert interval_nanoseconds(pd.DatetimeIndex([DAY_START])) == pd.Timedelta(hours=1).value
+
+def test_block_across_midnight_is_split_by_overlap_and_not_folded_into_the_last_interval():
+    trades_df = trades_frame([trade("2024-10-13 23:00", "2024-10-14 01:00", 2.0, trade_id=1),
+                              trade("2024-10-13 23:30", "2024-10-14 00:30", 1.0, trade_id=2)])
+    two_days = pd.date_range("2024-10-13 22:00", periods=4, freq="h", tz="UTC")
+    positions_df = net_positions(trades_df, two_days)
+    assert list(positions_df['delivery_start']) == list(two_days[1:3])
+    assert list(positions_df['net_quantity']) == pytest.approx([1.0 + 0.5, 1.0 + 0.5])
+
+    # On the first day's grid alone the part after midnight keeps its own interval
+    first_day = two_days[:2]
+    positions_df = net_positions(trades_df, first_day)
+    assert list(positions_df['delivery_start']) == [two_days[1], two_days[2]]
+    assert list(positions_df['net_quantity']) == pytest.approx([1.5, 1.5])
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+# Sign of a trade in the net position: sells are delivered from production, buys offset them
+SIDE_SIGNS = {'sell': 1.0, 'buy': -1.0}
+
+# Function to get every trade's quantity signed by its side
+# Trades without a side column are taken as already signed (e.g. after resampling).
+def signed_quantities(trades_df):
+    quantity = trades_df['quantity'].to_numpy(dtype=float)
+    if 'side' not in trades_df.columns:
+        return quantity
+    side = trades_df['side'].to_numpy(dtype=object)
+    signs = np.select([side == name for name in SIDE_SIGNS], list(SIDE_SIGNS.values()), np.nan)
+    if np.isnan(signs).any():
+        raise ValueError(f"Unknown trade side(s): {', '.join(sorted(set(map(str, side[np.isnan(signs)]))))}")
+    return quantity * signs
+
+# Function to turn a timestamp column or index into int64 nanoseconds (UTC for timezone-aware values)
+def _nanoseconds(times):
+    return pd.DatetimeIndex(times).as_unit('ns').asi8
+
+# Function to turn nanosecond keys back into timestamps with the timezone and unit of like
+def _timestamps(keys, like):
+    like = pd.DatetimeIndex(like)
+    times = pd.DatetimeIndex(keys.astype('datetime64[ns]'))
+    if like.tz is not None:
+        times = times.tz_localize('UTC').tz_convert(like.tz)
+    return times.as_unit(like.unit)
+
+# Function to get the interval length of a time axis in nanoseconds: the shortest step between two
+# intervals (one hour if there is a single interval)
+def interval_nanoseconds(time_index):
+    grid = np.unique(_nanoseconds(time_index))
+    return np.diff(grid).min() if len(grid) > 1 else pd.Timedelta(hours=1).value
+
+# Function to map trades onto the delivery intervals of time_index
+# Returns, per (trade, interval) piece: the trade row, the interval key (nanoseconds) and the share of
+# the trade's quantity. A trade lands in the interval containing its delivery_start, so partial-hour
+# products are netted into their hour; a trade spanning several intervals (by delivery_end) is split
+# across them by time overlap. Intervals are counted in steps from the first one of time_index, so a
+# piece outside time_index (e.g. the part of a 23:00-01:00 block after the last interval of the day)
+# keeps the start of its own interval as key instead of being folded into the last one.
+def interval_pieces(trades_df, time_index=None):
+    starts = _nanoseconds(trades_df['delivery_start'])
+    rows = np.arange(len(starts))
+    if time_index is None or len(time_index) == 0:
+        return rows, starts, np.ones(len(starts))
+    grid = np.sort(_nanoseconds(time_index))
+    step = interval_nanoseconds(grid)
+    first = (starts - grid[0]) // step
+    counts = np.ones(len(starts), dtype=np.int64)
+    if 'delivery_end' in trades_df.columns:
+        ends = _nanoseconds(trades_df['delivery_end'])
+        counts = np.maximum((ends - 1 - grid[0]) // step - first + 1, 1)
+    keys = grid[0] + first * step
+    if (counts == 1).all():
+        return rows, keys, np.ones(len(starts))
+    pieces = np.repeat(rows, counts)
+    offsets = np.arange(len(pieces)) - np.repeat(np.cumsum(counts) - counts, counts)
+    piece_starts = keys[pieces] + offsets * step
+    overlap = np.minimum(ends[pieces], piece_starts + step) - np.maximum(starts[pieces], piece_starts)
+    return pieces, piece_starts, overlap / (ends - starts)[pieces]
+
+# Columns of the net positions frame (see net_positions)
+POSITION_COLUMNS = ['delivery_start', 'sell_quantity', 'buy_quantity', 'net_quantity', 'trade_count']
+
+# Function to build a net positions frame without intervals
+def empty_positions(delivery_start_dtype='datetime64[ns, UTC]'):
+    return pd.DataFrame({column: [] for column in POSITION_COLUMNS}).astype({'delivery_start': delivery_start_dtype})
+
+# Function to net buys against sells and aggregate all trades per delivery interval
+# The pieces are sorted by interval once and summed with segmented reductions (np.add.reduceat over
+# the group offsets) instead of a many-to-many merge, so millions of trades per day stay cheap.
+# With time_index (e.g. the measured delivery_start values) trades are mapped onto its intervals.
+def net_positions(trades_df, time_index=None):
+    if len(trades_df) == 0:
+        return empty_positions(trades_df['delivery_start'].dtype)
+    rows, keys, share = interval_pieces(trades_df, time_index)
+    signed = signed_quantities(trades_df)[rows]
+    if not (share == 1).all():
+        signed = signed * share
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    offsets = np.concatenate([[0], np.flatnonzero(np.diff(sorted_keys)) + 1])
+    signed = signed[order]
+    return pd.DataFrame({
+        'delivery_start': _timestamps(sorted_keys[offsets], trades_df['delivery_start']),
+        'sell_quantity': np.add.reduceat(np.where(signed > 0, signed, 0.0), offsets),
+        'buy_quantity': -np.add.reduceat(np.where(signed < 0, signed, 0.0), offsets),
+        'net_quantity': np.add.reduceat(signed, offsets),
+        'trade_count': np.diff(np.append(offsets, len(signed))),
+    })
+
+# Function to add net positions of the same layout interval by interval, e.g. the part of the previous
+# day's block trades delivered after midnight to the positions of the next day
+def add_positions(positions_df, other_df):
+    if len(other_df) == 0:
+        return positions_df
+    if len(positions_df) == 0:
+        return other_df
+    combined = pd.concat([positions_df, other_df], ignore_index=True)
+    return combined.groupby('delivery_start', as_index=False, sort=True).sum()
+
+# Function to compute per-trade P&L against the market index and how much of each trade was covered
+# by allocated production. Each interval's net position is covered in the ratio allocated / net
+# quantity, which every trade in that interval shares. pnl is the trade value minus the value of the
+# same signed quantity at the market index price.
+def trade_pnl(trades_df, trade_allocation_df, market_index_df, time_index=None):
+    rows, keys, share = interval_pieces(trades_df, time_index)
+    signed = signed_quantities(trades_df)
+    allocation = trade_allocation_df.set_index(_nanoseconds(trade_allocation_df['delivery_start']))
+    contribution_columns = [column for column in allocation.columns if column.endswith('_contribution')]
+    allocated = allocation[contribution_columns].sum(axis=1)
+    net = allocation['quantity']
+    fill_ratio = (allocated / net.where(net > 0)).fillna(0.0).reindex(keys, fill_value=0.0).to_numpy()
+    market_price = pd.Series(market_index_df['market_index_price'].to_numpy(dtype=float),
+                             index=_nanoseconds(market_index_df['delivery_start'])).groupby(level=0).mean()
+    piece_price = market_price.reindex(keys).to_numpy()
+    piece_quantity = signed[rows] * share
+    n = len(trades_df)
+    covered = np.bincount(rows, weights=piece_quantity * fill_ratio, minlength=n)
+    market_value = np.bincount(rows, weights=piece_quantity * piece_price, minlength=n)
+    price = trades_df['price'].to_numpy(dtype=float)
+    result = pd.DataFrame({
+        'trade_id': trades_df['trade_id'].to_numpy() if 'trade_id' in trades_df.columns else np.arange(n),
+        'delivery_start': trades_df['delivery_start'].reset_index(drop=True),
+        'side': trades_df['side'].to_numpy() if 'side' in trades_df.columns else np.where(signed < 0, 'buy', 'sell'),
+        'quantity': trades_df['quantity'].to_numpy(dtype=float),
+        'price': price,
+        'signed_quantity': signed,
+        'covered_quantity': covered,
+        'trade_value': signed * price,
+        'market_value': market_value,
+    })
+    result['pnl'] = result['trade_value'] - result['market_value']
+    return result